@@ -1,17 +1,138 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import Integer, create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-# SQLite adatbázis (music.db)
-SQLALCHEMY_DATABASE_URL = "sqlite:///./music.db"
+# Adatbázis URL: alapból SQLite (music.db); nagyobb telepítéshez pl. postgresql://...
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./music.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite hangolás: WAL (olvasók nem várnak az íróra), NORMAL szinkron WAL mellett biztonságos
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    """Engine with a connection pool; SQLite connections get the PRAGMAs above."""
+    if url.startswith("sqlite"):
+        if ":memory:" in url or url.rstrip("/") == "sqlite:":
+            # Memóriabeli adatbázis: egyetlen megosztott kapcsolat (alapértelmezett pool)
+            engine = create_engine(url, connect_args={"check_same_thread": False})
+        else:
+            engine = create_engine(
+                url,
+                connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+            )
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        return engine
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+
+# -------------------------------------------
+# Kérésenkénti session (Flask)
+# -------------------------------------------
+
+def get_session():
+    """Session of the current Flask request: created on first use, closed
+    (rolled back on error) when the app context is torn down."""
+    from flask import g
+    if "db" not in g:
+        g.db = SessionLocal()
+    return g.db
+
+
+def init_app(app):
+    """Register the teardown that closes the request's session."""
+    from flask import g
+
+    @app.teardown_appcontext
+    def close_session(exc):
+        db = g.pop("db", None)
+        if db is None:
+            return
+        try:
+            if exc is not None:
+                db.rollback()
+        finally:
+            db.close()
+
+
 def init_db():
-    from backend.models.music import Track
+    from backend.models.music import Track, Genre
+    from backend.models.reccobeats import ReccoBeatsFeature
     Base.metadata.create_all(bind=engine)
+    migrate_db()
+
+def migrate_db():
+    """A create_all meglévő táblát nem módosít: a modellhez később hozzáadott
+    oszlopokat (nullable, ALTER TABLE ADD COLUMN) és indexeket itt pótoljuk,
+    így a régi music.db fájlok is használhatók maradnak."""
+    insp = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {col["name"] for col in insp.get_columns(table.name)}
+        missing = [col for col in table.columns if col.name not in existing]
+        if missing:
+            with engine.begin() as conn:
+                for col in missing:
+                    col_type = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}"))
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    # tracks.bpm Integer -> Float: SQLite az INTEGER oszlopban is megtartja a tizedes
+    # értéket, PostgreSQL-en viszont típust kell váltani
+    if engine.dialect.name == "postgresql" and insp.has_table("tracks"):
+        bpm_type = next((col["type"] for col in insp.get_columns("tracks") if col["name"] == "bpm"), None)
+        if isinstance(bpm_type, Integer):
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE tracks ALTER COLUMN bpm TYPE DOUBLE PRECISION"))
+
+    # Új normalizált oszlopok feltöltése a régi sorokból (camelot_number, genre_id, ...)
+    from backend.models.music import backfill_tracks
+    if insp.has_table("tracks"):
+        with engine.begin() as conn:
+            filled = backfill_tracks(conn)
+        if filled:
+            print(f"[DB] backfilled {filled} tracks")
+
+        # Hangzásvektor a korábban elemzett sorok features JSON-jából
+        from backend.services.similarity_index import backfill_vectors
+        with engine.begin() as conn:
+            filled = backfill_vectors(conn)
+        if filled:
+            print(f"[DB] backfilled {filled} feature vectors")
@@ -1,6 +1,41 @@
-from sqlalchemy import Column, Integer, String, Float
+import time
+from sqlalchemy import (Column, Integer, String, Float, JSON, LargeBinary, ForeignKey, Index, event, insert,
+                        select, update)
+from sqlalchemy.exc import IntegrityError
 from ..database import Base
 
+# Ismeretlen érték egységes jelölése (régebbi sorokban "Unknown", "Unknown Genre" is előfordul)
+UNKNOWN = "Ismeretlen"
+UNKNOWN_SENTINELS = {"", "ismeretlen", "unknown", "unknown genre", "unknown title", "unknown artist"}
+
+
+def normalize_unknown(value):
+    """None and every known "unknown" sentinel -> UNKNOWN; other values unchanged."""
+    if value is None or str(value).strip().lower() in UNKNOWN_SENTINELS:
+        return UNKNOWN
+    return value
+
+
+def split_camelot(key) -> tuple[int | None, str | None]:
+    """'8A' -> (8, 'A'); unknown / unparseable keys -> (None, None)."""
+    try:
+        num, letter = int(str(key)[:-1]), str(key)[-1].upper()
+    except (ValueError, IndexError):
+        return None, None
+    if not 1 <= num <= 12 or letter not in ("A", "B"):
+        return None, None
+    return num, letter
+
+
+class Genre(Base):
+    __tablename__ = "genres"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    # Kisbetűs kulcs: "Pop" és "pop" ugyanaz a műfaj
+    key = Column(String, nullable=False, unique=True, index=True)
+
+
 class Track(Base):
     __tablename__ = "tracks"
 
@@ -8,8 +43,93 @@ class Track(Base):
     title = Column(String, default="Ismeretlen")
     artist = Column(String, default="Ismeretlen")
     genre = Column(String, default="Ismeretlen")
-    bpm = Column(Integer, default=0)
+    # Tizedes pontosságú tempó (az ajánló a BPM-különbségre pontoz)
+    bpm = Column(Float, default=0.0)
     duration = Column(Float, default=0.0)
     rms = Column(Float, default=0.0)
     camelot = Column(String, default="Ismeretlen")
-    path = Column(String)
+    path = Column(String, index=True)
+    # Tömeges beolvasásnál: változatlan méret + mtime esetén a fájlt kihagyjuk
+    file_size = Column(Integer)
+    file_mtime = Column(Float)
+    # Normalizált oszlopok SQL oldali szűréshez (a camelot / genre szövegből töltődnek)
+    camelot_number = Column(Integer)
+    camelot_letter = Column(String(1))
+    genre_id = Column(Integer, ForeignKey("genres.id"))
+    # /analyze eredmények: tartalom hash szerinti deduplikáció és a teljes jellemzőkészlet
+    content_hash = Column(String, unique=True, index=True)
+    genre_local = Column(String)
+    genre_source = Column(String)
+    features = Column(JSON)
+    # Skálázott float32 hangzásleíró (similarity_index.feature_vector) a "hasonló hangzású" kereséshez
+    feature_vector = Column(LargeBinary)
+    # Utolsó írás ideje (time.time()): a memóriabeli indexek ebből látják a más folyamatok módosításait
+    updated_at = Column(Float, default=time.time, onupdate=time.time, index=True)
+
+    __table_args__ = (
+        Index("ix_tracks_camelot_bpm", "camelot_number", "camelot_letter", "bpm"),
+        Index("ix_tracks_genre_bpm", "genre_id", "bpm"),
+    )
+
+
+# -------------------------------------------
+# Származtatott oszlopok kitöltése
+# -------------------------------------------
+
+def genre_id_for(conn, genre) -> int | None:
+    """Id of the genre in the lookup table, inserted on first use; None for unknown genres."""
+    if normalize_unknown(genre) == UNKNOWN:
+        return None
+    key = str(genre).strip().lower()
+    genre_id = conn.execute(select(Genre.id).where(Genre.key == key)).scalar()
+    if genre_id is not None:
+        return genre_id
+    try:
+        with conn.begin_nested():
+            conn.execute(insert(Genre).values(name=str(genre).strip(), key=key))
+    except IntegrityError:
+        pass  # egy másik kapcsolat közben beszúrta
+    return conn.execute(select(Genre.id).where(Genre.key == key)).scalar()
+
+
+def fill_derived_columns(conn, row: dict, genre_ids: dict | None = None) -> dict:
+    """Normalize sentinels and fill camelot_number / camelot_letter / genre_id
+    in a column dict (for bulk_insert_mappings, which skips ORM events).
+    `genre_ids` caches genre -> id across the rows of one batch."""
+    if "camelot" in row:
+        row["camelot"] = normalize_unknown(row["camelot"])
+        row["camelot_number"], row["camelot_letter"] = split_camelot(row["camelot"])
+        if row["camelot_number"] is None:
+            row["camelot"] = UNKNOWN
+    if "genre" in row:
+        row["genre"] = normalize_unknown(row["genre"])
+        if genre_ids is None:
+            row["genre_id"] = genre_id_for(conn, row["genre"])
+        else:
+            if row["genre"] not in genre_ids:
+                genre_ids[row["genre"]] = genre_id_for(conn, row["genre"])
+            row["genre_id"] = genre_ids[row["genre"]]
+    return row
+
+
+@event.listens_for(Track, "before_insert")
+@event.listens_for(Track, "before_update")
+def _fill_track_columns(mapper, connection, target):
+    values = fill_derived_columns(connection, {"camelot": target.camelot, "genre": target.genre})
+    for name, value in values.items():
+        setattr(target, name, value)
+
+
+def backfill_tracks(conn) -> int:
+    """Fill the normalized columns of rows written before they existed.
+    Idempotent: rows already filled (or normalized to UNKNOWN) are skipped."""
+    rows = conn.execute(
+        select(Track.id, Track.camelot, Track.genre).where(
+            ((Track.camelot_number.is_(None)) & (Track.camelot.isnot(None)) & (Track.camelot != UNKNOWN))
+            | ((Track.genre_id.is_(None)) & (Track.genre.isnot(None)) & (Track.genre != UNKNOWN))
+        )
+    ).all()
+    for track_id, camelot, genre in rows:
+        values = fill_derived_columns(conn, {"camelot": camelot, "genre": genre})
+        conn.execute(update(Track).where(Track.id == track_id).values(**values))
+    return len(rows)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, Float, JSON
+from ..database import Base
+
+class ReccoBeatsFeature(Base):
+    """Locally stored ReccoBeats audio features."""
+    __tablename__ = "reccobeats_features"
+
+    # "id:<Spotify / ReccoBeats azonosító>" vagy "hash:<feltöltött fájl SHA-256>"
+    key = Column(String, primary_key=True)
+    # None: az API nem ismeri az azonosítót (negatív bejegyzés, RECCOBEATS_MISS_TTL után újrakérjük)
+    features = Column(JSON)
+    fetched_at = Column(Float, nullable=False)
@@ -1,16 +1,27 @@
-import os, shutil
+import os
 from flask import Blueprint, request, jsonify
 from sqlalchemy.orm import Session
-from ..database import SessionLocal
-from backend.services.music_service import analyze_track, save_track, recommend_ai
-from backend.services.reccobeats import get_features_by_ids
+from ..database import get_session
+from backend.services.music_service import (
+    recommend_ai, recommend_batch, build_playlist, similar_tracks, similar_to_analysis,
+)
+from backend.services.feature_store import get_features
+from backend.services.db_service import store_analysis
+from backend.services.http_client import (
+    http, spotify_token_cache, GENIUS_API_URL, GENIUS_WEB_API_URL, YOUTUBE_API_URL, SPOTIFY_API_URL,
+)
 from backend.services.music_analyze import analyze_music
+from backend.services.analysis_cache import analysis_cache
+from backend.services.blob_store import blob_store, audio_mimetype, blob_hash, BLOB_MAX_AGE
+from backend.services.response_cache import response_cache
+from backend.services.job_queue import job_queue, QueueFullError
+from backend.services.analysis_profile import get_profile
+from backend.services.ingest import ingest_runner, resolve_ingest_folder, IngestBusyError, INGEST_ROOT, INGEST_WORKERS
+from backend.services.metrics import analysis_cache_requests, analysis_store_errors, observe_analysis
+from backend.services.genre_classifier import reclassify_library
 from flask import send_from_directory
+from werkzeug.exceptions import NotFound
 import re
-import requests
-import base64
-from flask import redirect, session
-import io
 
 
 music_bp = Blueprint("music", __name__)
@@ -21,12 +32,9 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 def sanitize_filename(filename):
     return re.sub(r'[^\w\-_\.]', '_', filename)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def get_db() -> Session:
+    # A kéréshez kötött session; a lezárást az app teardown végzi (database.init_app)
+    return get_session()
 
 @music_bp.route("/analyze", methods=["POST"])
 def analyze():
@@ -34,95 +42,361 @@ def analyze():
     if not file:
         return jsonify({"error": "Nincs fájl feltöltve!"}), 400
 
-    safe_name = sanitize_filename(file.filename)
-    filepath = os.path.join(UPLOAD_DIR, safe_name)
-    file.save(filepath)
+    try:
+        profile = get_profile(request.args.get("profile"))["name"]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # A feltöltés írás közben hash-elődik (blob_store.init_app); ismert tartalom nem íródik ki újra,
+    # az eredeti név csak a metaadat fallbackhez kell
+    source_name = sanitize_filename(file.filename)
+    content_hash, filepath, _created = blob_store.store_upload(file)
+    safe_name = os.path.relpath(filepath, UPLOAD_DIR).replace(os.sep, "/")
 
     # Spotify token átadása, ha van
     user_token = None
     if "Authorization" in request.headers:
         user_token = request.headers["Authorization"].replace("Bearer ", "")
 
-    result = analyze_music(filepath, user_token)
+    # Azonos tartalom újrafeltöltésekor a tárolt eredményt adjuk vissza
+    result = analysis_cache.get(content_hash, profile)
+    analysis_cache_requests.inc(result="miss" if result is None else "hit")
+    # ?timings=true: a szakaszonkénti idők (ms) a válaszba is bekerülnek
+    with_timings = request.args.get("timings", "false").lower() == "true"
+
+    # Aszinkron mód: azonnal job azonosítót adunk vissza, az elemzés a háttérben fut
+    if request.args.get("async", "false").lower() == "true":
+        try:
+            job_id = job_queue.submit(filepath, content_hash, user_token,
+                                      extra={"path": safe_name}, cached_result=result,
+                                      profile=profile, timings=with_timings, source_name=source_name)
+        except QueueFullError as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+        job = job_queue.get(job_id)
+        return jsonify({
+            "job_id": job_id,
+            "status": job["status"],
+            "status_url": f"{request.script_root}/api/music/jobs/{job_id}",
+        }), 202
+
+    timings = None
+    if result is None:
+        result = analyze_music(filepath, user_token, return_timings=True, profile=profile,
+                               source_name=source_name, content_hash=content_hash)
+        observe_analysis(result)
+        timings = result.pop("timings")
+        analysis_cache.put(content_hash, result, profile)
+
+    # Mentés a tracks táblába (tartalom hash szerint frissít), így az ajánló is látja
+    db: Session = get_db()
     try:
-        result["path"] = safe_name
-    except Exception:
-        pass
+        result["id"] = store_analysis(db, result, filepath, content_hash)
+    except Exception as e:
+        # Az elemzés így is visszamegy, de a kliens és a /metrics is látja, hogy nem került a könyvtárba
+        db.rollback()
+        print("[DB] storing analysis failed:", str(e))
+        analysis_store_errors.inc(source="analyze")
+        result["storage_error"] = str(e) or type(e).__name__
+    result["path"] = safe_name
+    if with_timings:
+        # Cache találatnál nem futott elemzés: üres szakaszlista
+        result["timings"] = timings or {}
     return jsonify(result)
 
 
+@music_bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    job.pop("result")
+    return jsonify(job)
+
+
+@music_bp.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == "done":
+        return jsonify(job["result"])
+    if job["status"] in ("failed", "cancelled"):
+        return jsonify({"error": job["error"] or "Job " + job["status"], "status": job["status"]}), 409
+    return jsonify({"status": job["status"]}), 202
+
+
+@music_bp.route("/jobs/<job_id>", methods=["DELETE"])
+def job_cancel(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not job_queue.cancel(job_id):
+        return jsonify({"error": "Job already finished"}), 409
+    return jsonify(job_queue.get(job_id))
+
+
+@music_bp.route("/ingest", methods=["POST"])
+def ingest_start():
+    # Csak az INGEST_ROOT alatti mappák olvashatók be az API-n keresztül
+    if not INGEST_ROOT:
+        return jsonify({"error": "Folder ingest over the API is disabled (INGEST_ROOT not set)"}), 403
+    data = request.json or {}
+    folder = resolve_ingest_folder(data.get("folder"))
+    if folder is None:
+        return jsonify({"error": "Missing or invalid folder (must be inside INGEST_ROOT)"}), 400
+    try:
+        profile = get_profile(data.get("profile"))["name"]
+        options = {"profile": profile, "enrich": bool(data.get("enrich", False))}
+        if data.get("workers"):
+            options["workers"] = max(1, min(int(data["workers"]), INGEST_WORKERS))
+        if data.get("batch_size"):
+            options["batch_size"] = max(1, int(data["batch_size"]))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        run_id = ingest_runner.start(folder, **options)
+    except IngestBusyError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"ingest_id": run_id, "status": "running"}), 202
+
+
+@music_bp.route("/ingest/<run_id>", methods=["GET"])
+def ingest_status(run_id):
+    run = ingest_runner.get(run_id)
+    if run is None:
+        return jsonify({"error": "Ingest run not found"}), 404
+    return jsonify(run)
+
+
+@music_bp.route("/ingest/<run_id>", methods=["DELETE"])
+def ingest_stop(run_id):
+    if ingest_runner.get(run_id) is None:
+        return jsonify({"error": "Ingest run not found"}), 404
+    if not ingest_runner.stop(run_id):
+        return jsonify({"error": "Ingest run already finished"}), 409
+    return jsonify(ingest_runner.get(run_id))
+
+
 @music_bp.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    full_path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.exists(full_path):
+    # Range (206), If-None-Match / If-Modified-Since (304) és If-Range: send_file(conditional=True)
+    content_hash = blob_hash(filename)
+    try:
+        if content_hash is not None:
+            # Tartalom szerint címzett: a hash erős ETag, a fájl sosem változik
+            response = send_from_directory(UPLOAD_DIR, filename, mimetype=audio_mimetype(filename),
+                                           etag=content_hash, max_age=BLOB_MAX_AGE)
+            response.cache_control.immutable = True
+        else:
+            # Régi, név szerint mentett fájl: felülíródhat, ezért mindig újraellenőrizzük
+            response = send_from_directory(UPLOAD_DIR, filename, mimetype=audio_mimetype(filename))
+            response.cache_control.no_cache = True
+    except NotFound:
         return jsonify({"error": "File not found"}), 404
-    return send_from_directory(UPLOAD_DIR, filename, mimetype='audio/mpeg')
+    return response
 
 
 @music_bp.route("/recommend/<int:track_id>", methods=["GET"])
 def recommend(track_id):
     strict = request.args.get("strict", "false").lower() == "true"
-    db: Session = next(get_db())
+    db: Session = get_db()
     recommendations = recommend_ai(db, track_id, strict)
     return jsonify(recommendations)
 
 
+RECOMMEND_BATCH_MAX_IDS = int(os.getenv("RECOMMEND_BATCH_MAX_IDS", "1000"))
+RECOMMEND_MAX_K = 50
+
+@music_bp.route("/recommend/batch", methods=["POST"])
+def recommend_many():
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids")
+    if not isinstance(ids, list) or not ids:
+        return jsonify({"error": "ids must be a non-empty list of track ids"}), 400
+    if len(ids) > RECOMMEND_BATCH_MAX_IDS:
+        return jsonify({"error": f"At most {RECOMMEND_BATCH_MAX_IDS} ids per request"}), 400
+    try:
+        ids = [int(track_id) for track_id in ids]
+        k = int(data.get("k", 5))
+    except (TypeError, ValueError):
+        return jsonify({"error": "ids and k must be integers"}), 400
+    if not 1 <= k <= RECOMMEND_MAX_K:
+        return jsonify({"error": f"k must be between 1 and {RECOMMEND_MAX_K}"}), 400
+    strict = str(data.get("strict", False)).lower() == "true"
+
+    db: Session = get_db()
+    results = recommend_batch(db, ids, strict, k)
+    # JSON objektum kulcsai szövegek
+    return jsonify({"results": {str(track_id): results[track_id] for track_id in ids}})
+
+
+
+PLAYLIST_MAX_LENGTH = int(os.getenv("PLAYLIST_MAX_LENGTH", "500"))
+PLAYLIST_MAX_POOL_WITHOUT_SEED = int(os.getenv("PLAYLIST_MAX_POOL_WITHOUT_SEED", "5000"))
+
+@music_bp.route("/playlist", methods=["POST"])
+def playlist():
+    data = request.get_json(silent=True) or {}
+    seed_id = data.get("seed_id")
+    track_ids = data.get("ids")
+    try:
+        seed_id = int(seed_id) if seed_id is not None else None
+        track_ids = [int(track_id) for track_id in track_ids] if track_ids is not None else None
+        length = int(data.get("length", 20))
+    except (TypeError, ValueError):
+        return jsonify({"error": "seed_id, ids and length must be integers"}), 400
+    if seed_id is None and not track_ids:
+        return jsonify({"error": "seed_id or a non-empty ids list is required"}), 400
+    # Seed nélkül minden track kezdőpont-jelölt: a pool méretét korlátozzuk
+    if seed_id is None and len(track_ids) > PLAYLIST_MAX_POOL_WITHOUT_SEED:
+        return jsonify({"error": f"Without seed_id at most {PLAYLIST_MAX_POOL_WITHOUT_SEED} ids are allowed"}), 400
+    if not 1 <= length <= PLAYLIST_MAX_LENGTH:
+        return jsonify({"error": f"length must be between 1 and {PLAYLIST_MAX_LENGTH}"}), 400
+    strict = str(data.get("strict", False)).lower() == "true"
+
+    db: Session = get_db()
+    result = build_playlist(db, seed_id, track_ids, length, strict)
+    if not result["tracks"]:
+        return jsonify({"error": "Seed track or pool tracks not found"}), 404
+    return jsonify(result)
+
+
+@music_bp.route("/genres/reclassify", methods=["POST"])
+def genres_reclassify():
+    # A beállított modellel (GENRE_WEIGHTS_PATH / heurisztika) a tárolt jellemzőkből, újraelemzés nélkül
+    db: Session = get_db()
+    return jsonify(reclassify_library(db))
+
+
+SIMILAR_MAX_K = 100
+
+def _similar_options():
+    # (k, strict, approximate) a query paraméterekből; hibás k -> ValueError
+    try:
+        k = int(request.args.get("k", 10))
+    except ValueError:
+        raise ValueError("k must be an integer")
+    if not 1 <= k <= SIMILAR_MAX_K:
+        raise ValueError(f"k must be between 1 and {SIMILAR_MAX_K}")
+    strict = request.args.get("strict", "false").lower() == "true"
+    approximate = request.args.get("approximate", "false").lower() == "true"
+    return k, strict, approximate
+
+
+@music_bp.route("/similar/<int:track_id>", methods=["GET"])
+def similar(track_id):
+    try:
+        k, strict, approximate = _similar_options()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    db: Session = get_db()
+    results = similar_tracks(db, track_id, k, strict, approximate)
+    if results is None:
+        return jsonify({"error": "Track not found or has no stored features"}), 404
+    return jsonify(results)
+
+
+@music_bp.route("/similar", methods=["POST"])
+def similar_upload():
+    file = request.files.get("file")
+    if not file:
+        return jsonify({"error": "Nincs fájl feltöltve!"}), 400
+    try:
+        k, strict, approximate = _similar_options()
+        profile = get_profile(request.args.get("profile"))["name"]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    user_token = None
+    if "Authorization" in request.headers:
+        user_token = request.headers["Authorization"].replace("Bearer ", "")
+
+    # Csak lekérdezés: a fájl nem kerül a könyvtárba (a hivatkozás nélküli blobot a GC törli),
+    # az elemzés viszont a cache-be igen
+    content_hash, filepath, _created = blob_store.store_upload(file)
+    result = analysis_cache.get(content_hash, profile)
+    if result is None:
+        result = analyze_music(filepath, user_token, return_timings=True, profile=profile,
+                               source_name=sanitize_filename(file.filename), content_hash=content_hash)
+        observe_analysis(result)
+        result.pop("timings")
+        analysis_cache.put(content_hash, result, profile)
+
+    db: Session = get_db()
+    results = similar_to_analysis(db, result, k, strict, approximate)
+    if results is None:
+        return jsonify({"error": "No usable features could be extracted from the file"}), 422
+    query = {key: result.get(key) for key in ("title", "artist", "genre", "bpm", "camelot")}
+    return jsonify({"query": query, "results": results})
+
 GENIUS_TOKEN = os.getenv("GENIUS_TOKEN")
 
+# A külső keresések (payload, státusz) párt adnak vissza; a response_cache ezt tárolja.
+# Hiba esetén kivételt dobnak, így a hibás válasz nem kerül a cache-be.
+
+def _genius_search(snippet):
+    url = f"{GENIUS_API_URL}/search"
+    headers = {"Authorization": f"Bearer {GENIUS_TOKEN}"}
+    params = {"q": snippet}
+
+    response = http.get(url, headers=headers, params=params)
+    response.raise_for_status()
+    results = response.json()["response"]["hits"]
+    if not results:
+        return {"error": "No results found"}, 404
+
+    songs = []
+    for hit in results[:10]:
+        song = hit["result"]
+        songs.append({
+            "title": song["title"],
+            "artist": song["primary_artist"]["name"],
+            "url": song["url"],
+            "cover": song.get("song_art_image_url")
+        })
+    return {"songs": songs}, 200
+
 @music_bp.route("/search-lyrics", methods=["POST"])
 def search_lyrics():
-    print("Genius token:", GENIUS_TOKEN)
     data = request.json
     snippet = data.get("snippet")
     if not snippet:
         return jsonify({"error": "No lyrics snippet provided"}), 400
 
-    url = "https://api.genius.com/search"
-    headers = {"Authorization": f"Bearer {GENIUS_TOKEN}"}
-    params = {"q": snippet}
-
     try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        results = response.json()["response"]["hits"]
-        if not results:
-            return jsonify({"error": "No results found"}), 404
-
-        songs = []
-        for hit in results[:10]:
-            song = hit["result"]
-            songs.append({
-                "title": song["title"],
-                "artist": song["primary_artist"]["name"],
-                "url": song["url"],
-                "cover": song.get("song_art_image_url")
-            })
-        return jsonify({"songs": songs})
-    
+        payload, status = response_cache.get_or_fetch(
+            "genius_search", {"q": snippet}, lambda: _genius_search(snippet))
+        return jsonify(payload), status
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 
-@music_bp.route("/youtube", methods=["GET"])
-def youtube_search():
-    query = request.args.get("q")
-    if not query:
-        return jsonify({"error": "Missing query"}), 400
-
-    url = (
-        f"https://www.googleapis.com/youtube/v3/search"
-        f"?part=snippet&type=video&maxResults=1&q={query}&key={YOUTUBE_API_KEY}"
-    )
-    res = requests.get(url)
+def _youtube_search(query):
+    params = {"part": "snippet", "type": "video", "maxResults": 1, "q": query, "key": YOUTUBE_API_KEY}
+    res = http.get(f"{YOUTUBE_API_URL}/search", params=params)
+    res.raise_for_status()
     data = res.json()
 
     if "items" not in data or not data["items"]:
-        return jsonify({"error": "No results"}), 404
+        return {"error": "No results"}, 404
 
     video_id = data["items"][0]["id"]["videoId"]
     video_url = f"https://www.youtube.com/watch?v={video_id}"
-    return jsonify({"video_url": video_url})
+    return {"video_url": video_url}, 200
+
+@music_bp.route("/youtube", methods=["GET"])
+def youtube_search():
+    query = request.args.get("q")
+    if not query:
+        return jsonify({"error": "Missing query"}), 400
+
+    try:
+        payload, status = response_cache.get_or_fetch("youtube", {"q": query}, lambda: _youtube_search(query))
+        return jsonify(payload), status
+    except Exception as e:
+        print("YouTube search error:", e)
+        return jsonify({"error": "YouTube API error"}), 500
 
 
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
@@ -131,14 +405,28 @@ SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 
 
 def get_spotify_token():
-    auth_str = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
-    b64_auth_str = base64.b64encode(auth_str.encode()).decode()
-    headers = {"Authorization": f"Basic {b64_auth_str}"}
-    data = {"grant_type": "client_credentials"}
-
-    res = requests.post("https://accounts.spotify.com/api/token", headers=headers, data=data)
+    # Client-credentials token: lejárat előtt újrahasznosítva (http_client.TokenCache)
+    return spotify_token_cache.get()
+
+def _spotify_search(query):
+    params = {"q": query, "type": "track", "limit": 1}
+    res = http.get(f"{SPOTIFY_API_URL}/search",
+                   headers={"Authorization": f"Bearer {get_spotify_token()}"}, params=params)
+    if res.status_code == 401:
+        # Visszavont / lejárt token: egyszer újrakérjük
+        spotify_token_cache.invalidate()
+        res = http.get(f"{SPOTIFY_API_URL}/search",
+                       headers={"Authorization": f"Bearer {get_spotify_token()}"}, params=params)
     res.raise_for_status()
-    return res.json()["access_token"]
+    data = res.json()
+
+    if "tracks" not in data or not data["tracks"]["items"]:
+        return {"error": "No results"}, 404
+
+    track = data["tracks"]["items"][0]
+    track_url = track["external_urls"]["spotify"]
+
+    return {"track_url": track_url}, 200
 
 @music_bp.route("/spotify", methods=["GET"])
 def spotify_search():
@@ -147,19 +435,8 @@ def spotify_search():
         return jsonify({"error": "Missing query"}), 400
 
     try:
-        token = get_spotify_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        params = {"q": query, "type": "track", "limit": 1}
-        res = requests.get("https://api.spotify.com/v1/search", headers=headers, params=params)
-        data = res.json()
-
-        if "tracks" not in data or not data["tracks"]["items"]:
-            return jsonify({"error": "No results"}), 404
-
-        track = data["tracks"]["items"][0]
-        track_url = track["external_urls"]["spotify"]
-
-        return jsonify({"track_url": track_url})
+        payload, status = response_cache.get_or_fetch("spotify", {"q": query}, lambda: _spotify_search(query))
+        return jsonify(payload), status
 
     except Exception as e:
         print("Spotify search error:", e)
@@ -167,49 +444,57 @@ def spotify_search():
 
 
 
-@music_bp.route("/genius-top", methods=["GET"])
-def genius_top_songs():
-    import requests
+def _genius_top():
     from datetime import datetime
 
-    try:
-        url = "https://genius.com/api/songs/chart?time_period=day&chart_genre=all&per_page=50"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                          "AppleWebKit/537.36 (KHTML, like Gecko) "
-                          "Chrome/118.0.5993.88 Safari/537.36",
-            "Accept": "application/json",
-        }
-
-        res = requests.get(url, headers=headers, timeout=10)
-        res.raise_for_status()
-
-        data = res.json()
-        chart_items = data.get("response", {}).get("chart_items", [])
-
-        if not chart_items:
-            return jsonify({"error": "Nem találtam toplistát a Genius API-n"}), 404
-
-        top_tracks = []
-        for i, item in enumerate(chart_items, start=1):
-            song = item["item"]
-            top_tracks.append({
-                "rank": i,
-                "title": song["title"],
-                "artist": song["primary_artist"]["name"],
-                "url": song["url"],
-                "image": song["song_art_image_thumbnail_url"]
-            })
+    url = f"{GENIUS_WEB_API_URL}/songs/chart?time_period=day&chart_genre=all&per_page=50"
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                      "AppleWebKit/537.36 (KHTML, like Gecko) "
+                      "Chrome/118.0.5993.88 Safari/537.36",
+        "Accept": "application/json",
+    }
 
-        return jsonify({
-            "date": datetime.today().strftime("%Y-%m-%d"),
-            "top_tracks": top_tracks
+    res = http.get(url, headers=headers, timeout=10)
+    res.raise_for_status()
+
+    data = res.json()
+    chart_items = data.get("response", {}).get("chart_items", [])
+
+    if not chart_items:
+        return {"error": "Nem találtam toplistát a Genius API-n"}, 404
+
+    top_tracks = []
+    for i, item in enumerate(chart_items, start=1):
+        song = item["item"]
+        top_tracks.append({
+            "rank": i,
+            "title": song["title"],
+            "artist": song["primary_artist"]["name"],
+            "url": song["url"],
+            "image": song["song_art_image_thumbnail_url"]
         })
 
+    return {
+        "date": datetime.today().strftime("%Y-%m-%d"),
+        "top_tracks": top_tracks
+    }, 200
+
+@music_bp.route("/genius-top", methods=["GET"])
+def genius_top_songs():
+    try:
+        payload, status = response_cache.get_or_fetch("genius_top", {}, _genius_top)
+        return jsonify(payload), status
+
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
+
+
+@music_bp.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({"responses": response_cache.stats(), "analysis": analysis_cache.stats()})
     
 @music_bp.route("/reccobeats-features", methods=["GET"])
 def reccobeats_features():
@@ -226,10 +511,11 @@ def reccobeats_features():
 
     try:
         api_key = os.getenv("RECCOBEATS_API_KEY")
-        data = get_features_by_ids(ids, api_key)
-        if data is None:
+        # Helyi feature store: csak a hiányzó azonosítók mennek az API-hoz (40-es csomagokban, párhuzamosan)
+        features = get_features(ids, api_key, db=get_db())
+        if len(features) < len(set(ids)) and not any(features.values()):
             return jsonify({"error": "ReccoBeats API error"}), 500
-        return jsonify(data)
+        return jsonify({"content": [item for item in features.values() if item is not None]})
     except Exception as e:
         print("ReccoBeats features error:", e)
         return jsonify({"error": "Unexpected server error"}), 500
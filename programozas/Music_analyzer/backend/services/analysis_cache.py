@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import closing
+
+from backend.services.music_analyze import ANALYSIS_VERSION
+from backend.services.analysis_profile import DEFAULT_PROFILE
+
+
+CACHE_PATH = os.getenv(
+    "ANALYSIS_CACHE_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "analysis_cache.db")),
+)
+CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_hash(file_path: str) -> str:
+    """SHA-256 of the file content (hex). Reads in 1 MB chunks."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class AnalysisCache:
+    """Persistent analyze_music() result cache backed by a small SQLite file.
+
+    Entries are keyed on (content hash, analysis version + profile), so a
+    re-upload of the same bytes under any filename hits the cache, while
+    bumping ANALYSIS_VERSION silently invalidates every older result and
+    results of different analysis profiles never mix. Eviction is LRU,
+    bounded by both total payload bytes and entry count.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES,
+                 max_entries: int = CACHE_MAX_ENTRIES, version: str = ANALYSIS_VERSION):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.version = version
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            with self._lock:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                    " content_hash TEXT NOT NULL,"
+                    " version TEXT NOT NULL,"
+                    " payload TEXT NOT NULL,"
+                    " size INTEGER NOT NULL,"
+                    " created_at REAL NOT NULL,"
+                    " last_access REAL NOT NULL,"
+                    " PRIMARY KEY (content_hash, version))"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS ix_analysis_cache_last_access"
+                    " ON analysis_cache (last_access)"
+                )
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    def _version(self, profile: str | None) -> str:
+        return f"{self.version}/{profile or DEFAULT_PROFILE}"
+
+    def get(self, content_hash: str, profile: str | None = None) -> dict | None:
+        version = self._version(profile)
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT payload FROM analysis_cache WHERE content_hash = ? AND version = ?",
+                    (content_hash, version),
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE analysis_cache SET last_access = ? WHERE content_hash = ? AND version = ?",
+                    (time.time(), content_hash, version),
+                )
+                conn.commit()
+                return json.loads(row[0])
+        except Exception as e:
+            print("[AnalysisCache] read failed:", str(e))
+            return None
+
+    def put(self, content_hash: str, result: dict, profile: str | None = None) -> None:
+        # A határidő / hiba miatt ReccoBeats nélküli eredményt nem rögzítjük: a következő elemzés pótolhatja
+        if result.get("enrichment") in ("timeout", "error"):
+            return
+        version = self._version(profile)
+        try:
+            payload = json.dumps(result, ensure_ascii=False)
+            now = time.time()
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO analysis_cache"
+                    " (content_hash, version, payload, size, created_at, last_access)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (content_hash, version, payload, len(payload), now, now),
+                )
+                self._evict(conn)
+                conn.commit()
+        except Exception as e:
+            print("[AnalysisCache] write failed:", str(e))
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        # Legrégebben használt bejegyzések törlése, amíg mindkét korlát alá nem érünk
+        victims = []
+        for content_hash, version, size in conn.execute(
+            "SELECT content_hash, version, size FROM analysis_cache ORDER BY last_access ASC"
+        ):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((content_hash, version))
+            count -= 1
+            total -= size
+        conn.executemany(
+            "DELETE FROM analysis_cache WHERE content_hash = ? AND version = ?", victims
+        )
+
+    def hashes(self) -> set[str]:
+        """Content hashes with a stored result (any version / profile)."""
+        with closing(self._connect()) as conn:
+            return {content_hash for (content_hash,) in conn.execute(
+                "SELECT DISTINCT content_hash FROM analysis_cache")}
+
+    def stats(self) -> dict:
+        with closing(self._connect()) as conn:
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache"
+            ).fetchone()
+        return {"entries": count, "bytes": total, "version": self.version}
+
+
+analysis_cache = AnalysisCache()
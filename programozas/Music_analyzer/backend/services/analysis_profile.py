@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import librosa
+
+
+# Elemzési profilok: rögzített mintavételi frekvencia és keretezés, hogy a
+# különböző forrásból (44.1 / 48 kHz, sztereó) érkező fájlok eredményei
+# összehasonlíthatók legyenek, és az STFT / CQT ne a natív rátán fusson.
+ANALYSIS_PROFILES = {
+    "default": {
+        "sr": 22050,
+        "n_fft": 2048,
+        "hop_length": 512,
+        "res_type": "soxr_hq",
+    },
+    # Fele akkora ráta és keret: ~43 keret/s marad (a tempó felbontás nem
+    # romlik), a spektrum 5.5 kHz fölött elvész, a resampler pontatlanabb.
+    "fast": {
+        "sr": 11025,
+        "n_fft": 1024,
+        "hop_length": 256,
+        "res_type": "soxr_lq",
+    },
+}
+
+DEFAULT_PROFILE = os.getenv("ANALYSIS_PROFILE", "default")
+
+
+def get_profile(name: str | None = None) -> dict:
+    """Profile settings by name (None -> ANALYSIS_PROFILE). The returned dict
+    includes its own "name". Raises ValueError for unknown names."""
+    name = name or DEFAULT_PROFILE
+    if name not in ANALYSIS_PROFILES:
+        raise ValueError(f"Unknown analysis profile: {name} (available: {', '.join(ANALYSIS_PROFILES)})")
+    return {"name": name, **ANALYSIS_PROFILES[name]}
+
+
+def load_audio(file_path: str, profile: dict | None = None, offset: float = 0.0,
+               duration: float | None = None) -> tuple[np.ndarray, int]:
+    """Decode to mono float32 at the profile's sample rate.
+
+    The downmix happens before resampling, so the resampler only ever
+    processes one channel.
+    """
+    profile = profile or get_profile()
+    y, sr = librosa.load(file_path, sr=profile["sr"], mono=True, offset=offset,
+                         duration=duration, res_type=profile["res_type"], dtype=np.float32)
+    return y, sr
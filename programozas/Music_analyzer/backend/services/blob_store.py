@@ -0,0 +1,357 @@
+import io
+import os
+import re
+import sys
+import time
+import hashlib
+import argparse
+import threading
+import mimetypes
+import tempfile
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+# Tartalom szerint címzett feltöltések: <BLOB_DIR>/<hash[:2]>/<sha256><kiterjesztés>
+# (az uploads mappán belül, így az /uploads végpont kiszolgálja őket)
+BLOB_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "uploads", "blobs"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+# Eddig a méretig a feltöltés memóriában marad: ismert tartalom így egyáltalán nem íródik lemezre
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(16 * 1024 * 1024)))
+# Hivatkozás nélküli blob csak ennyi idő után törölhető (folyamatban lévő elemzések védelme)
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+COPY_CHUNK_SIZE = 1024 * 1024
+# Blob tartalma sosem változik: a böngésző egy évig újraellenőrzés nélkül használhatja
+BLOB_MAX_AGE = 365 * 24 * 3600
+
+# A rendszer mimetypes táblája platformonként hiányos (pl. Windows: .flac, .m4a)
+AUDIO_MIMETYPES = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+    ".ogg": "audio/ogg",
+    ".oga": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".m4a": "audio/mp4",
+    ".mp4": "audio/mp4",
+    ".aac": "audio/aac",
+    ".aif": "audio/aiff",
+    ".aiff": "audio/aiff",
+    ".webm": "audio/webm",
+    ".wma": "audio/x-ms-wma",
+}
+
+_EXTENSION_RE = re.compile(r"^\.[a-z0-9]{1,5}$")
+_BLOB_PATH_RE = re.compile(r"^blobs/([0-9a-f]{2})/(\1[0-9a-f]{62})(\.[a-z0-9]{1,5})?$")
+
+
+def blob_extension(filename: str | None) -> str:
+    """Lower-case extension of the original filename ('' if unusable); the
+    decoders and the /uploads mimetype rely on it."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if _EXTENSION_RE.match(ext) else ""
+
+
+def audio_mimetype(filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    return AUDIO_MIMETYPES.get(ext) or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def blob_hash(relative_path: str) -> str | None:
+    """Content hash if `relative_path` (relative to the uploads folder) is a
+    stored blob, else None (e.g. files saved before content addressing)."""
+    match = _BLOB_PATH_RE.match(relative_path.replace(os.sep, "/"))
+    return match.group(2) if match else None
+
+
+class HashingSpool:
+    """Write target for an upload: SHA-256 and size are updated on every
+    write, so the content hash is known as soon as the last chunk arrived.
+
+    Data stays in memory up to `spool_bytes`, then moves to a temp file
+    inside the blob store (same file system, so committing it is a rename).
+    Writing more than `max_bytes` raises RequestEntityTooLarge (413).
+    """
+
+    def __init__(self, tmp_dir: str, max_bytes: int = UPLOAD_MAX_BYTES, spool_bytes: int = UPLOAD_SPOOL_BYTES):
+        self.tmp_dir = tmp_dir
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.size = 0
+        self.tmp_path: str | None = None
+        self._hash = hashlib.sha256()
+        self._buffer: io.BytesIO | None = io.BytesIO()
+        self._file = None
+
+    def _active(self):
+        return self._file if self._file is not None else self._buffer
+
+    def _rollover(self) -> None:
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".part")
+        self._file = os.fdopen(fd, "w+b")
+        self._file.write(self._buffer.getbuffer())
+        self._file.seek(self._buffer.tell())
+        self._buffer = None
+
+    def write(self, data) -> int:
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        self._hash.update(data)
+        if self._file is None and self.size > self.spool_bytes:
+            self._rollover()
+        return self._active().write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._active().read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._active().seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._active().tell()
+
+    def flush(self) -> None:
+        self._active().flush()
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    @property
+    def in_memory(self) -> bool:
+        return self._file is None
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def getbuffer(self) -> memoryview:
+        return self._buffer.getbuffer()
+
+    def close(self) -> None:
+        # Nem véglegesített temp fájl törlése (pl. duplikátum vagy megszakadt feltöltés)
+        if self._file is not None:
+            self._file.close()
+        if self.tmp_path is not None and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.tmp_path = None
+
+    def detach(self) -> str:
+        """Close the temp file and hand it over (the caller renames it)."""
+        self._file.close()
+        path, self.tmp_path = self.tmp_path, None
+        return path
+
+
+class BlobStore:
+    """Content-addressed file store for uploads (one file per distinct content)."""
+
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        # Utolsó használat jelzőfájljai (<hash>): a blob mtime-ja = Last-Modified, azt nem írjuk át
+        self.used_dir = os.path.join(self.root, "used")
+        # commit() és a GC törlése ne fusson egymásba (ugyanazon a folyamaton belül)
+        self._lock = threading.Lock()
+
+    def spool(self) -> HashingSpool:
+        return HashingSpool(self.tmp_dir)
+
+    def path_for(self, content_hash: str, ext: str = "") -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash + ext)
+
+    def find(self, content_hash: str) -> str | None:
+        """Stored blob of this content (whatever its extension), or None."""
+        shard = os.path.join(self.root, content_hash[:2])
+        try:
+            names = os.listdir(shard)
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if name.split(".", 1)[0] == content_hash:
+                return os.path.join(shard, name)
+        return None
+
+    def _used_marker(self, content_hash: str) -> str:
+        return os.path.join(self.used_dir, content_hash)
+
+    def last_used(self, path: str) -> float:
+        """Latest of the blob's creation and its last duplicate upload."""
+        mtime = os.stat(path).st_mtime
+        try:
+            marker = os.stat(self._used_marker(os.path.basename(path).split(".", 1)[0])).st_mtime
+        except FileNotFoundError:
+            return mtime
+        return max(mtime, marker)
+
+    def commit(self, spool: HashingSpool, ext: str = "") -> tuple[str, str, bool]:
+        """Store the spooled upload under its hash: (content_hash, path, created).
+
+        Known content is not written again (created=False); its use is
+        recorded in a marker file so the garbage collector's grace period
+        starts over, while the blob itself (served as immutable, with its
+        mtime as Last-Modified) stays untouched.
+        """
+        content_hash = spool.hexdigest()
+        with self._lock:
+            existing = self.find(content_hash)
+            if existing is not None:
+                try:
+                    os.stat(existing)
+                    os.makedirs(self.used_dir, exist_ok=True)
+                    with open(self._used_marker(content_hash), "a"):
+                        pass
+                    os.utime(self._used_marker(content_hash))
+                except FileNotFoundError:
+                    # Közben egy másik folyamat GC-je törölte: újra kiírjuk
+                    existing = None
+            if existing is not None:
+                spool.close()
+                return content_hash, existing, False
+
+            path = self.path_for(content_hash, ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if spool.in_memory:
+                os.makedirs(self.tmp_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".part")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(spool.getbuffer())
+            else:
+                tmp_path = spool.detach()
+            # Atomikus: egy párhuzamos azonos feltöltés ugyanazt a tartalmat írja felül
+            os.replace(tmp_path, path)
+        return content_hash, path, True
+
+    def store_upload(self, file_storage) -> tuple[str, str, bool]:
+        """commit() for a Werkzeug FileStorage. Streams parsed by
+        UploadRequest are already hashed; others are copied through a spool."""
+        spool = file_storage.stream
+        if not isinstance(spool, HashingSpool):
+            spool = self.spool()
+            try:
+                for chunk in iter(lambda: file_storage.stream.read(COPY_CHUNK_SIZE), b""):
+                    spool.write(chunk)
+            except Exception:
+                spool.close()
+                raise
+        return self.commit(spool, blob_extension(file_storage.filename))
+
+    def collect_garbage(self, referenced, grace_seconds: int = BLOB_GC_GRACE_SECONDS,
+                        keep_hashes=()) -> dict:
+        """Delete blobs not in `referenced` (absolute paths), not in
+        `keep_hashes` and older than `grace_seconds`, plus leftover temp
+        files of aborted uploads. The grace period never goes below
+        BLOB_GC_GRACE_SECONDS."""
+        referenced = {os.path.abspath(path) for path in referenced if path}
+        keep_hashes = set(keep_hashes)
+        cutoff = time.time() - max(grace_seconds, BLOB_GC_GRACE_SECONDS)
+        stats = {"kept": 0, "removed": 0, "freed_bytes": 0}
+        if not os.path.isdir(self.root):
+            return stats
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root:
+                # A jelzőfájlok és a folyamatban lévő feltöltések nem blobok
+                for skip in ("used", "tmp"):
+                    if skip in dirnames:
+                        dirnames.remove(skip)
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if path in referenced or name.split(".", 1)[0] in keep_hashes:
+                    stats["kept"] += 1
+                    continue
+                # Zár alatt újra megnézzük: egy közbeni duplikált feltöltés frissíthette
+                with self._lock:
+                    try:
+                        st = os.stat(path)
+                        if self.last_used(path) >= cutoff:
+                            stats["kept"] += 1
+                            continue
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue
+                stats["removed"] += 1
+                stats["freed_bytes"] += st.st_size
+
+        # Megszakadt feltöltések maradványai: amíg egy feltöltés tart, a .part fájl mtime-ja friss
+        if os.path.isdir(self.tmp_dir):
+            for name in os.listdir(self.tmp_dir):
+                path = os.path.join(self.tmp_dir, name)
+                try:
+                    st = os.stat(path)
+                    if st.st_mtime >= cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                stats["removed"] += 1
+                stats["freed_bytes"] += st.st_size
+
+        # Jelzőfájlok, amelyekhez már nincs blob
+        if os.path.isdir(self.used_dir):
+            with self._lock:
+                for name in os.listdir(self.used_dir):
+                    if self.find(name) is None:
+                        try:
+                            os.remove(self._used_marker(name))
+                        except FileNotFoundError:
+                            pass
+        return stats
+
+
+blob_store = BlobStore()
+
+
+def collect_garbage(db, grace_seconds: int = BLOB_GC_GRACE_SECONDS) -> dict:
+    """Blob GC with the tracks table as the set of references; contents
+    with a stored analysis result are kept too, so the paths returned with
+    those results stay playable."""
+    from backend.models.music import Track
+    from backend.services.analysis_cache import analysis_cache
+    paths = [path for (path,) in db.query(Track.path).filter(Track.path.isnot(None))]
+    return blob_store.collect_garbage(paths, grace_seconds, analysis_cache.hashes())
+
+
+# -------------------------------------------
+# Flask integráció
+# -------------------------------------------
+
+def init_app(app):
+    """Upload size cap and hashing upload streams for every multipart request."""
+    from flask import Request
+
+    class UploadRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            return blob_store.spool()
+
+    app.request_class = UploadRequest
+    app.config.setdefault("MAX_CONTENT_LENGTH", UPLOAD_MAX_BYTES)
+
+
+# -------------------------------------------
+# PARANCSORI FUTTATÁS
+# -------------------------------------------
+def main(argv=None):
+    from backend.database import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Hivatkozás nélküli feltöltött blobok törlése")
+    parser.add_argument("--grace", type=int, default=BLOB_GC_GRACE_SECONDS,
+                        help="Ennél fiatalabb fájlok megmaradnak (s, legalább BLOB_GC_GRACE_SECONDS)")
+    args = parser.parse_args(argv)
+
+    init_db()
+    db = SessionLocal()
+    try:
+        stats = collect_garbage(db, args.grace)
+    finally:
+        db.close()
+    print(f"✅ Törölve: {stats['removed']} fájl ({stats['freed_bytes']} bájt), megtartva: {stats['kept']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
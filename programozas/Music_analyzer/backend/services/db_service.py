@@ -1,4 +1,6 @@
-from backend.models.music import Track
+from backend.models.music import Track, split_camelot, fill_derived_columns
+from backend.services.recommend_index import recommend_index
+from backend.services.similarity_index import similarity_index, vector_bytes
 
 def save_track(db, track_data, file_path: str):
     track = Track(
@@ -14,4 +16,117 @@ def save_track(db, track_data, file_path: str):
     db.add(track)
     db.commit()
     db.refresh(track)
-    return track
\ No newline at end of file
+    recommend_index.upsert_track(track)
+    return track
+
+def compatible_keys(camelot) -> list[tuple[int, str]]:
+    """Camelot keys accepted by camelot_compatible(): same key and +-1 on the wheel."""
+    num, letter = split_camelot(camelot)
+    if num is None:
+        return []
+    return [(n, letter) for n in sorted({num, num % 12 + 1, (num - 2) % 12 + 1})]
+
+def find_tracks_in_range(db, camelot=None, bpm_min=None, bpm_max=None, genre_id=None,
+                         compatible=True, limit=None):
+    """Tracks filtered in SQL by Camelot key (or its compatible neighbours),
+    BPM window and genre, so SQLite answers from the (camelot, bpm) /
+    (genre, bpm) indexes with range scans instead of reading every row."""
+    query = db.query(Track)
+    if camelot is not None:
+        keys = compatible_keys(camelot) if compatible else [split_camelot(camelot)]
+        keys = [key for key in keys if key[0] is not None]
+        if not keys:
+            return []
+        letter = keys[0][1]
+        query = query.filter(Track.camelot_number.in_([num for num, _ in keys]),
+                             Track.camelot_letter == letter)
+    if genre_id is not None:
+        query = query.filter(Track.genre_id == genre_id)
+    if bpm_min is not None:
+        query = query.filter(Track.bpm >= bpm_min)
+    if bpm_max is not None:
+        query = query.filter(Track.bpm <= bpm_max)
+    query = query.order_by(Track.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+# -------------------------------------------
+# ELEMZÉSI EREDMÉNYEK TÖMEGES MENTÉSE
+# -------------------------------------------
+
+ANALYSIS_COLUMNS = ("title", "artist", "genre", "genre_local", "genre_source", "bpm", "duration", "rms", "camelot")
+# Ezek a kulcsok nem az elemzés részei (válaszhoz fűzött mezők)
+NON_FEATURE_KEYS = ("path", "id", "timings")
+UPSERT_CHUNK_ROWS = 200
+
+def analysis_to_row(result: dict, file_path: str, content_hash: str) -> dict:
+    """analyze_music() result -> tracks row; everything without its own
+    column (spectral features, genre candidates, ReccoBeats data) goes to
+    the `features` JSON column."""
+    row = {key: result.get(key) for key in ANALYSIS_COLUMNS}
+    row["path"] = file_path
+    row["content_hash"] = content_hash
+    row["feature_vector"] = vector_bytes(result)
+    row["features"] = {
+        key: value for key, value in result.items()
+        if key not in ANALYSIS_COLUMNS and key not in NON_FEATURE_KEYS
+    }
+    return row
+
+def track_ids_by_hash(db, hashes) -> dict:
+    """{content_hash: track id} for the stored ones of `hashes`."""
+    ids = {}
+    for start in range(0, len(hashes), UPSERT_CHUNK_ROWS):
+        chunk = hashes[start:start + UPSERT_CHUNK_ROWS]
+        ids.update(db.query(Track.content_hash, Track.id).filter(Track.content_hash.in_(chunk)).all())
+    return ids
+
+def upsert_tracks(db, rows: list[dict]) -> dict:
+    """Insert or update many tracks keyed on content_hash in one transaction.
+
+    SQLite / PostgreSQL use one INSERT ... ON CONFLICT DO UPDATE statement;
+    other dialects fall back to bulk insert + bulk update. Returns
+    {content_hash: track id} and updates the recommendation index.
+    """
+    if not rows:
+        return {}
+    conn = db.connection()
+    # Core insert: az ORM események nem futnak, a normalizált oszlopokat itt töltjük; azonos hash -> utolsó nyer
+    genre_ids = {}
+    rows = list({row["content_hash"]: fill_derived_columns(conn, dict(row), genre_ids) for row in rows}.values())
+    hashes = [row["content_hash"] for row in rows]
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        # Egyetlen lefordított utasítás, executemany-vel végrehajtva
+        stmt = insert(Track.__table__)
+        set_ = {name: stmt.excluded[name] for name in rows[0] if name != "content_hash"}
+        # Az ON CONFLICT ág nem UPDATE utasítás: az onupdate itt nem fut le magától
+        set_["updated_at"] = stmt.excluded.updated_at
+        stmt = stmt.on_conflict_do_update(index_elements=[Track.content_hash], set_=set_)
+        conn.execute(stmt, rows)
+    else:
+        existing = track_ids_by_hash(db, hashes)
+        inserts = [row for row in rows if row["content_hash"] not in existing]
+        updates = [{**row, "id": existing[row["content_hash"]]} for row in rows if row["content_hash"] in existing]
+        if inserts:
+            db.bulk_insert_mappings(Track, inserts)
+        if updates:
+            db.bulk_update_mappings(Track, updates)
+    db.commit()
+
+    ids = track_ids_by_hash(db, hashes)
+    for row in rows:
+        recommend_index.upsert(ids[row["content_hash"]], row["bpm"], row["camelot"], row["genre"])
+        similarity_index.upsert(ids[row["content_hash"]], row["camelot"], row.get("feature_vector"))
+    return ids
+
+def store_analysis(db, result: dict, file_path: str, content_hash: str) -> int:
+    """Persist one /analyze result (deduplicated by content hash); returns the track id."""
+    return upsert_tracks(db, [analysis_to_row(result, file_path, content_hash)])[content_hash]
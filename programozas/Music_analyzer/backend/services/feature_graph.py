@@ -0,0 +1,146 @@
+import time
+import numpy as np
+import librosa
+
+from backend.services.tempo import estimate_tempo
+
+
+class FeatureGraph:
+    """Per-track cache of the expensive spectral intermediates.
+
+    Every node (STFT, HPSS, mel spectrogram, onset envelope, CQT, ...) is
+    computed lazily on first access and reused by all downstream features,
+    so analyze_music(), compute_local_features() and detect_camelot() share
+    a single STFT / HPSS / CQT instead of recomputing them independently.
+    The self time of each node (excluding the nodes it pulled in) is
+    recorded in `timings` (seconds), so the values add up to the total.
+    """
+
+    CHROMA_BINS_PER_OCTAVE = 36
+    CHROMA_OCTAVES = 7
+
+    def __init__(self, y: np.ndarray, sr: int, n_fft: int = 2048, hop_length: int = 512):
+        self.y = y
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.timings: dict[str, float] = {}
+        self._nodes: dict[str, object] = {}
+        # Beágyazott számítások ideje, hogy a szülő csak a saját idejét kapja
+        self._child_time: list[float] = []
+
+    def _measure(self, name: str, fn):
+        self._child_time.append(0.0)
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._child_time.pop()
+            self.timings[name] = self.timings.get(name, 0.0) + (elapsed - children)
+            if self._child_time:
+                self._child_time[-1] += elapsed
+
+    def node(self, name: str, fn):
+        """Return the memoized value of `name`, computing it with `fn()` once."""
+        if name not in self._nodes:
+            self._nodes[name] = self._measure(name, fn)
+        return self._nodes[name]
+
+    def timed(self, name: str, fn):
+        """Run a leaf computation (not memoized) and add its time to `timings`."""
+        return self._measure(name, fn)
+
+    def report(self) -> dict:
+        """Node timings in milliseconds, slowest first."""
+        return {
+            name: round(sec * 1000.0, 2)
+            for name, sec in sorted(self.timings.items(), key=lambda kv: kv[1], reverse=True)
+        }
+
+    # -------------------------------------------
+    # Alap reprezentációk
+    # -------------------------------------------
+
+    @property
+    def duration(self) -> float:
+        return self.node("duration", lambda: float(librosa.get_duration(y=self.y, sr=self.sr)))
+
+    @property
+    def stft(self) -> np.ndarray:
+        return self.node("stft", lambda: librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length))
+
+    @property
+    def magnitude(self) -> np.ndarray:
+        return self.node("magnitude", lambda: np.abs(self.stft))
+
+    @property
+    def power(self) -> np.ndarray:
+        return self.node("power", lambda: self.magnitude ** 2)
+
+    @property
+    def rms(self) -> np.ndarray:
+        """Frame RMS (1, frames)."""
+        return self.node("rms", lambda: librosa.feature.rms(
+            y=self.y, frame_length=self.n_fft, hop_length=self.hop_length))
+
+    @property
+    def hpss(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.node("hpss", lambda: librosa.decompose.hpss(self.stft))
+
+    @property
+    def y_harmonic(self) -> np.ndarray:
+        return self.node("y_harmonic", lambda: librosa.istft(
+            self.hpss[0], n_fft=self.n_fft, hop_length=self.hop_length,
+            length=len(self.y), dtype=self.y.dtype))
+
+    @property
+    def y_percussive(self) -> np.ndarray:
+        return self.node("y_percussive", lambda: librosa.istft(
+            self.hpss[1], n_fft=self.n_fft, hop_length=self.hop_length,
+            length=len(self.y), dtype=self.y.dtype))
+
+    @property
+    def mel_db(self) -> np.ndarray:
+        return self.node("mel_db", lambda: librosa.power_to_db(
+            librosa.feature.melspectrogram(S=self.power, sr=self.sr)))
+
+    @property
+    def onset_env(self) -> np.ndarray:
+        """Mean-aggregated onset strength (as used by onset_detect)."""
+        return self.node("onset_env", lambda: librosa.onset.onset_strength(
+            S=self.mel_db, sr=self.sr, hop_length=self.hop_length))
+
+    @property
+    def onset_env_median(self) -> np.ndarray:
+        """Median-aggregated onset strength (tempo estimation input)."""
+        return self.node("onset_env_median", lambda: librosa.onset.onset_strength(
+            S=self.mel_db, sr=self.sr, hop_length=self.hop_length, aggregate=np.median))
+
+    @property
+    def cqt(self) -> np.ndarray:
+        """Magnitude CQT of the harmonic component (chroma input)."""
+        return self.node("cqt", lambda: np.abs(librosa.cqt(
+            self.y_harmonic, sr=self.sr, hop_length=self.hop_length,
+            n_bins=self.CHROMA_OCTAVES * self.CHROMA_BINS_PER_OCTAVE,
+            bins_per_octave=self.CHROMA_BINS_PER_OCTAVE, tuning=None)))
+
+    @property
+    def chroma(self) -> np.ndarray:
+        return self.node("chroma", lambda: librosa.feature.chroma_cqt(
+            C=self.cqt, sr=self.sr, hop_length=self.hop_length,
+            bins_per_octave=self.CHROMA_BINS_PER_OCTAVE))
+
+    # -------------------------------------------
+    # Ritmus
+    # -------------------------------------------
+
+    @property
+    def tempo_estimate(self) -> dict:
+        """Segmented tempo estimate (see tempo.estimate_tempo)."""
+        return self.node("tempo", lambda: estimate_tempo(
+            self.onset_env_median, sr=self.sr, hop_length=self.hop_length))
+
+    @property
+    def tempo(self) -> float:
+        return self.tempo_estimate["bpm"]
@@ -0,0 +1,152 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.database import SessionLocal
+from backend.models.reccobeats import ReccoBeatsFeature
+from backend.services.reccobeats import get_features_by_ids
+
+
+# A GET /audio-features egyszerre legfeljebb 40 azonosítót fogad
+RECCOBEATS_MAX_IDS = 40
+RECCOBEATS_CONCURRENCY = int(os.getenv("RECCOBEATS_CONCURRENCY", "8"))
+RECCOBEATS_MISS_TTL = int(os.getenv("RECCOBEATS_MISS_TTL", str(24 * 3600)))
+# SQLite változó-limit alatt maradó IN (...) lekérdezések
+LOOKUP_CHUNK = 500
+
+FEATURE_KEYS = (
+    "acousticness", "danceability", "energy", "instrumentalness",
+    "liveness", "loudness", "speechiness", "tempo", "valence",
+)
+
+
+def _id_key(track_id: str) -> str:
+    return f"id:{track_id}"
+
+
+def _hash_key(content_hash: str) -> str:
+    return f"hash:{content_hash}"
+
+
+def _load(db, keys: list[str]) -> dict:
+    """key -> features (None for negative entries); expired negative entries are left out."""
+    found = {}
+    miss_cutoff = time.time() - RECCOBEATS_MISS_TTL
+    for start in range(0, len(keys), LOOKUP_CHUNK):
+        chunk = keys[start:start + LOOKUP_CHUNK]
+        for row in db.query(ReccoBeatsFeature).filter(ReccoBeatsFeature.key.in_(chunk)):
+            if row.features is None and row.fetched_at < miss_cutoff:
+                continue
+            found[row.key] = row.features
+    return found
+
+
+def _store(db, entries: dict) -> None:
+    """Upsert key -> features in one transaction."""
+    if not entries:
+        return
+    now = time.time()
+    rows = [{"key": key, "features": features, "fetched_at": now} for key, features in entries.items()]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(ReccoBeatsFeature.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={"features": stmt.excluded.features, "fetched_at": stmt.excluded.fetched_at},
+        )
+        db.execute(stmt, rows)
+    else:
+        for row in rows:
+            db.merge(ReccoBeatsFeature(**row))
+    db.commit()
+
+
+def _match(requested: list[str], content: list[dict]) -> dict:
+    """Map the API's items back to the requested ids (ReccoBeats id or the
+    Spotify id at the end of the item's href)."""
+    by_id = {}
+    for item in content:
+        if item.get("id"):
+            by_id[item["id"]] = item
+        href = item.get("href") or ""
+        if "/track/" in href:
+            by_id[href.rsplit("/track/", 1)[1].split("?")[0]] = item
+    return {track_id: by_id.get(track_id) for track_id in requested}
+
+
+def _fetch_chunk(ids: list[str], api_key: str | None) -> dict | None:
+    data = get_features_by_ids(ids, api_key)
+    if data is None:
+        return None  # hálózati / API hiba: nem tároljuk, legközelebb újra próbáljuk
+    content = data.get("content", []) if isinstance(data, dict) else data
+    return _match(ids, content or [])
+
+
+def get_features(ids, api_key: str | None = None, db=None) -> dict:
+    """ReccoBeats features for many Spotify / ReccoBeats ids.
+
+    Stored entries are answered from the local table; the misses are split
+    into chunks of RECCOBEATS_MAX_IDS, fetched concurrently (at most
+    RECCOBEATS_CONCURRENCY requests in flight) and written back in one
+    transaction. Returns {id: item, or None if ReccoBeats does not know
+    the id}; ids whose chunk failed to fetch are left out.
+    """
+    ids = list(dict.fromkeys(str(i).strip() for i in ids if str(i).strip()))
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        stored = _load(db, [_id_key(i) for i in ids])
+        result = {i: stored[_id_key(i)] for i in ids if _id_key(i) in stored}
+        missing = [i for i in ids if _id_key(i) not in stored]
+
+        chunks = [missing[start:start + RECCOBEATS_MAX_IDS] for start in range(0, len(missing), RECCOBEATS_MAX_IDS)]
+        fetched = {}
+        if chunks:
+            with ThreadPoolExecutor(max_workers=max(1, min(RECCOBEATS_CONCURRENCY, len(chunks)))) as pool:
+                for items in pool.map(lambda chunk: _fetch_chunk(chunk, api_key), chunks):
+                    if items is not None:
+                        fetched.update(items)
+        try:
+            _store(db, {_id_key(i): item for i, item in fetched.items()})
+        except Exception as e:
+            db.rollback()
+            print("[FeatureStore] write failed:", str(e))
+
+        result.update(fetched)
+        return {i: result[i] for i in ids if i in result}
+    finally:
+        if own_session:
+            db.close()
+
+
+def file_features(content_hash: str, upload) -> dict | None:
+    """Features of an uploaded file keyed by its content hash; `upload()`
+    (e.g. analyze_with_reccobeats) is only called on a miss, and only a
+    successful answer is stored. None if `upload()` failed (returned None)."""
+    db = SessionLocal()
+    try:
+        try:
+            stored = _load(db, [_hash_key(content_hash)]).get(_hash_key(content_hash))
+        except Exception as e:
+            print("[FeatureStore] read failed:", str(e))
+            stored = None
+        if stored:
+            return stored
+
+        rb = upload()
+        if rb is None:
+            return None
+        features = {key: rb[key] for key in FEATURE_KEYS if key in rb}
+        if features:
+            try:
+                _store(db, {_hash_key(content_hash): features})
+            except Exception as e:
+                db.rollback()
+                print("[FeatureStore] write failed:", str(e))
+        return features
+    finally:
+        db.close()
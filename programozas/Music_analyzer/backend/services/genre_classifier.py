@@ -0,0 +1,302 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from sqlalchemy import bindparam, update
+
+
+# Bázisfüggvények: a heurisztika minden tagja ezek lineáris kombinációja
+FEATURE_BASIS = ("bias", "spectral_centroid", "rolloff", "zcr", "onset_rate", "inv_hpr", "hpr", "chroma_var", "rms")
+# BPM tartomány indikátorok: (név, alsó, felső), zárt intervallum
+BPM_RANGES = (
+    ("bpm_118_135", 118.0, 135.0),
+    ("bpm_78_105", 78.0, 105.0),
+    ("bpm_120_180", 120.0, 180.0),
+    ("bpm_95_130", 95.0, 130.0),
+    ("bpm_le_120", -np.inf, 120.0),
+    ("bpm_80_160", 80.0, 160.0),
+    ("bpm_le_100", -np.inf, 100.0),
+    ("bpm_ge_135", 135.0, np.inf),
+)
+BASIS = FEATURE_BASIS + tuple(name for name, _, _ in BPM_RANGES)
+
+# A kézzel írt heurisztika súlyai (a konstans tagok a "bias" oszlopba kerültek,
+# pl. 0.3 * (1.2 - sc_n) -> bias 0.36, spectral_centroid -0.3)
+HEURISTIC_WEIGHTS = {
+    "Dance/Electronic": {"bpm_118_135": 1.5, "onset_rate": 0.6, "inv_hpr": 0.5, "spectral_centroid": 0.4},
+    "Hip-Hop/Rap": {"bpm_78_105": 1.2, "onset_rate": 0.6, "bias": 0.36, "spectral_centroid": -0.3, "zcr": 0.2},
+    "Rock/Metal": {"bpm_120_180": 1.0, "spectral_centroid": 0.7, "rolloff": 0.6, "zcr": 0.5, "onset_rate": 0.3},
+    "Pop": {"bpm_95_130": 1.0, "bias": 0.7, "zcr": -0.4, "rolloff": -0.3, "chroma_var": 0.4},
+    "Acoustic/Folk": {"bpm_le_120": 0.4, "hpr": 0.35, "bias": 1.02, "spectral_centroid": -0.6, "onset_rate": -0.3},
+    "Jazz/Blues": {"bpm_80_160": 0.6, "hpr": 0.35, "chroma_var": 0.6, "bias": 0.2, "onset_rate": -0.2},
+    "Classical/Orchestral": {"bpm_le_100": 0.5, "hpr": 0.4, "bias": 1.24, "spectral_centroid": -0.6,
+                             "onset_rate": -0.4},
+    "Electronic (Fast)": {"bpm_ge_135": 1.0, "onset_rate": 0.6, "inv_hpr": 0.5, "rolloff": 0.5},
+}
+
+# Alternatív súlykészlet (GenreModel.save() formátum); üres = beépített heurisztika
+GENRE_WEIGHTS_PATH = os.getenv("GENRE_WEIGHTS_PATH", "")
+GENRE_FIT_ALPHA = float(os.getenv("GENRE_FIT_ALPHA", "1.0"))
+GENRE_FIT_MIN_COUNT = int(os.getenv("GENRE_FIT_MIN_COUNT", "20"))
+
+
+def _column(feats: dict, key: str, n: int, default: float) -> np.ndarray:
+    # A skalár heurisztika `feats.get(key) or default` szabálya: None / NaN / 0 -> default
+    value = feats.get(key)
+    value = np.full(n, np.nan) if value is None else np.asarray(value, dtype=np.float64).reshape(-1)
+    value = np.broadcast_to(value, (n,))
+    return np.where(np.isnan(value) | (value == 0), default, value)
+
+
+def basis_matrix(bpm, rms, feats: dict) -> np.ndarray:
+    """(n, len(BASIS)) matrix of the heuristic's terms for n tracks.
+
+    `bpm` / `rms` are arrays (or scalars), `feats` maps the
+    compute_local_features() keys to arrays (or scalars / None).
+    """
+    bpm = np.nan_to_num(np.atleast_1d(np.asarray(bpm, dtype=np.float64)))
+    rms = np.nan_to_num(np.atleast_1d(np.asarray(rms, dtype=np.float64)))
+    n = len(bpm)
+    hpr_n = np.minimum(_column(feats, "harmonic_percussive_ratio", n, 1.0), 3.0)
+    columns = [
+        np.ones(n),
+        _column(feats, "spectral_centroid_mean", n, 0.0) / 4000.0,
+        _column(feats, "spectral_rolloff_85", n, 0.0) / 6000.0,
+        _column(feats, "zcr_mean", n, 0.0) * 10.0,
+        np.minimum(_column(feats, "onset_rate", n, 0.0) / 6.0, 1.5),
+        1.0 / np.maximum(hpr_n, 0.4),
+        hpr_n,
+        np.minimum(_column(feats, "chroma_var", n, 0.0), 1.5),
+        np.minimum(np.maximum(rms * 10.0, 0.0), 1.5),
+    ]
+    columns += [((bpm >= low) & (bpm <= high)).astype(np.float64) for _, low, high in BPM_RANGES]
+    return np.column_stack(columns)
+
+
+class GenreModel:
+    """Linear genre scorer: scores = basis_matrix() @ weights.
+
+    `weights` has one column per genre (len(BASIS) x len(genres)); the
+    first genre wins ties, like the stable sort of the original heuristic.
+    """
+
+    def __init__(self, genres: list[str], weights: np.ndarray, name: str = "custom", info: dict | None = None):
+        self.genres = list(genres)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        if self.weights.shape != (len(BASIS), len(self.genres)):
+            raise ValueError(f"weights must be {len(BASIS)} x {len(self.genres)}")
+        self.name = name
+        self.info = info or {}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GenreModel":
+        """{"name", "weights": {genre: {basis: weight}}}; missing terms are 0."""
+        genres = list(data["weights"])
+        weights = np.zeros((len(BASIS), len(genres)))
+        for j, genre in enumerate(genres):
+            for term, value in data["weights"][genre].items():
+                if term not in BASIS:
+                    raise ValueError(f"Unknown basis term: {term}")
+                weights[BASIS.index(term), j] = float(value)
+        return cls(genres, weights, name=data.get("name", "custom"), info=data.get("info"))
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "info": self.info,
+            "weights": {
+                genre: {term: float(w) for term, w in zip(BASIS, self.weights[:, j]) if w != 0.0}
+                for j, genre in enumerate(self.genres)
+            },
+        }
+
+    @classmethod
+    def load(cls, path: str) -> "GenreModel":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+    def scores(self, basis: np.ndarray) -> np.ndarray:
+        return basis @ self.weights
+
+    def predict(self, basis: np.ndarray) -> list[str]:
+        best = np.argmax(self.scores(basis), axis=1)
+        return [self.genres[i] for i in best]
+
+    def classify(self, bpm: float, rms: float, feats: dict) -> tuple[str, list]:
+        """Single-track form: (top_genre, [(genre, score), ...] best first)."""
+        score = self.scores(basis_matrix(bpm, rms, feats))[0]
+        order = np.argsort(-score, kind="stable")
+        candidates = [(self.genres[i], float(score[i])) for i in order]
+        return candidates[0][0], candidates
+
+
+HEURISTIC_MODEL = GenreModel.from_dict({"name": "heuristic", "weights": HEURISTIC_WEIGHTS})
+
+_active_model: GenreModel | None = None
+
+
+def genre_model() -> GenreModel:
+    """Model used for new analyses: GENRE_WEIGHTS_PATH if set, else the heuristic."""
+    global _active_model
+    if _active_model is None:
+        _active_model = HEURISTIC_MODEL
+        if GENRE_WEIGHTS_PATH:
+            try:
+                _active_model = GenreModel.load(GENRE_WEIGHTS_PATH)
+            except (OSError, ValueError, KeyError) as e:
+                print("[Genre] loading weights failed:", str(e))
+    return _active_model
+
+
+def set_genre_model(model: GenreModel | None) -> None:
+    """Replace the model used for new analyses (None: back to the default)."""
+    global _active_model
+    _active_model = model
+
+
+# -------------------------------------------
+# Könyvtár szintű műveletek
+# -------------------------------------------
+
+def library_basis(db) -> tuple[np.ndarray, list[tuple]]:
+    """Basis matrix of every track with a stored feature vector, plus its
+    rows (id, genre, genre_local, genre_source, genre_id)."""
+    # Az elemzés (music_analyze) csak a modellt használja: az adatbázis réteget itt töltjük be
+    from backend.models.music import Track
+    from backend.services.similarity_index import VECTOR_DIM, decode_vectors
+
+    rows = (db.query(Track.id, Track.bpm, Track.rms, Track.feature_vector, Track.genre,
+                     Track.genre_local, Track.genre_source, Track.genre_id)
+            .filter(Track.feature_vector.isnot(None)).order_by(Track.id).all())
+    rows = [row for row in rows if len(row[3]) == VECTOR_DIM * 4]
+    if not rows:
+        return np.zeros((0, len(BASIS))), []
+    feats = decode_vectors(row[3] for row in rows)
+    basis = basis_matrix([row[1] for row in rows], [row[2] for row in rows], feats)
+    return basis, [(row[0], row[4], row[5], row[6], row[7]) for row in rows]
+
+
+def reclassify_library(db, model: GenreModel | None = None) -> dict:
+    """Re-run genre classification over the stored features of every track.
+
+    genre_local is updated everywhere; `genre` (and genre_id) only where it
+    came from the classifier (genre_source "local_heuristic"), tagged
+    genres are kept. Only changed rows are written, in one transaction.
+    The analysis snapshot in `features` (genre_candidates) is not touched.
+    """
+    from backend.models.music import Track, fill_derived_columns
+    from backend.services.recommend_index import recommend_index
+
+    model = model or genre_model()
+    start = time.perf_counter()
+    basis, rows = library_basis(db)
+    predicted = model.predict(basis) if rows else []
+
+    # Két executemany UPDATE: csak genre_local, ill. genre + genre_id + genre_local
+    conn = db.connection()
+    genre_ids: dict = {}
+    local_updates, genre_updates = [], []
+    for (track_id, genre, genre_local, source, _genre_id), label in zip(rows, predicted):
+        if source == "local_heuristic" and genre != label:
+            values = fill_derived_columns(conn, {"genre": label}, genre_ids)
+            genre_updates.append({"b_id": track_id, "b_local": label, "b_genre": values["genre"],
+                                  "b_genre_id": values["genre_id"]})
+        elif genre_local != label:
+            local_updates.append({"b_id": track_id, "b_local": label})
+    if local_updates:
+        conn.execute(update(Track).where(Track.id == bindparam("b_id"))
+                     .values(genre_local=bindparam("b_local")), local_updates)
+    if genre_updates:
+        conn.execute(update(Track).where(Track.id == bindparam("b_id"))
+                     .values(genre_local=bindparam("b_local"), genre=bindparam("b_genre"),
+                             genre_id=bindparam("b_genre_id")), genre_updates)
+    db.commit()
+    if genre_updates:
+        recommend_index.invalidate()
+
+    counts: dict[str, int] = {}
+    for label in predicted:
+        counts[label] = counts.get(label, 0) + 1
+    return {
+        "model": model.name,
+        "tracks": len(rows),
+        "changed": len(local_updates) + len(genre_updates),
+        "genres": dict(sorted(counts.items(), key=lambda kv: kv[1], reverse=True)),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def fit_genre_model(db, alpha: float = GENRE_FIT_ALPHA, min_count: int = GENRE_FIT_MIN_COUNT) -> GenreModel:
+    """Ridge regression (one-vs-rest) from the basis terms to the library's
+    own tags: tracks whose genre came from ID3 tags / filenames, over the
+    genres with at least `min_count` such tracks. Raises ValueError if
+    fewer than two genres qualify."""
+    from backend.models.music import Genre
+
+    basis, rows = library_basis(db)
+    tagged = [i for i, row in enumerate(rows) if row[3] == "tag_or_filename" and row[4] is not None]
+    counts: dict[int, int] = {}
+    for i in tagged:
+        counts[rows[i][4]] = counts.get(rows[i][4], 0) + 1
+    labels = sorted(genre_id for genre_id, count in counts.items() if count >= min_count)
+    if len(labels) < 2:
+        raise ValueError(f"At least two genres with {min_count} tagged tracks are needed")
+
+    names = dict(db.query(Genre.id, Genre.name).filter(Genre.id.in_(labels)).all())
+    samples = [i for i in tagged if rows[i][4] in names]
+    X = basis[samples]
+    y = np.searchsorted(labels, [rows[i][4] for i in samples])
+    Y = np.eye(len(labels))[y]
+
+    # Zárt alakú megoldás; a konstans tagot nem büntetjük
+    penalty = np.full(len(BASIS), alpha)
+    penalty[BASIS.index("bias")] = 0.0
+    weights = np.linalg.solve(X.T @ X + np.diag(penalty), X.T @ Y)
+    accuracy = float(np.mean(np.argmax(X @ weights, axis=1) == y))
+    info = {"samples": len(samples), "alpha": alpha, "train_accuracy": round(accuracy, 4)}
+    return GenreModel([names[genre_id] for genre_id in labels], weights, name="trained", info=info)
+
+
+# -------------------------------------------
+# PARANCSORI FUTTATÁS
+# -------------------------------------------
+def main(argv=None):
+    from backend.database import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Műfaj újraosztályozás a tárolt jellemzőkből (újraelemzés nélkül)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    reclassify = sub.add_parser("reclassify", help="Tracks műfajának frissítése")
+    reclassify.add_argument("--weights", default=None, help="Súlykészlet JSON (alap: GENRE_WEIGHTS_PATH / heurisztika)")
+    fit = sub.add_parser("fit", help="Lineáris modell illesztése a könyvtár saját tagjeire")
+    fit.add_argument("--output", required=True)
+    fit.add_argument("--alpha", type=float, default=GENRE_FIT_ALPHA)
+    fit.add_argument("--min-count", type=int, default=GENRE_FIT_MIN_COUNT)
+    fit.add_argument("--apply", action="store_true", help="Illesztés után újraosztályozás az új modellel")
+    args = parser.parse_args(argv)
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.command == "fit":
+            model = fit_genre_model(db, alpha=args.alpha, min_count=args.min_count)
+            model.save(args.output)
+            print(f"✅ Modell mentve: {args.output} ({len(model.genres)} műfaj, {model.info})")
+            if not args.apply:
+                return 0
+        else:
+            model = GenreModel.load(args.weights) if args.weights else genre_model()
+        stats = reclassify_library(db, model)
+        print(f"✅ {stats['tracks']} track, {stats['changed']} módosult ({stats['seconds']} s)")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
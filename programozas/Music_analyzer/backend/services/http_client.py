@@ -0,0 +1,157 @@
+import os
+import time
+import base64
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit
+from backend.services.metrics import external_request_seconds, external_request_errors
+
+
+# Időkorlátok (kapcsolódás, olvasás) másodpercben; minden kérésre vonatkoznak, ha a hívó nem ad meg mást
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Külső API-k alap URL-jei: helyi mock szerverrel teszteléshez felülírhatók
+GENIUS_API_URL = os.getenv("GENIUS_API_URL", "https://api.genius.com")
+GENIUS_WEB_API_URL = os.getenv("GENIUS_WEB_API_URL", "https://genius.com/api")
+YOUTUBE_API_URL = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+SPOTIFY_ACCOUNTS_URL = os.getenv("SPOTIFY_ACCOUNTS_URL", "https://accounts.spotify.com")
+RECCOBEATS_API_URL = os.getenv("RECCOBEATS_API_URL", "https://api.reccobeats.com/v1")
+
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "60"))
+
+# Metrikák szolgáltatás címkéje az URL előtag alapján (különben a host neve)
+SERVICE_PREFIXES = (
+    (GENIUS_API_URL, "genius"),
+    (GENIUS_WEB_API_URL, "genius"),
+    (YOUTUBE_API_URL, "youtube"),
+    (SPOTIFY_API_URL, "spotify"),
+    (SPOTIFY_ACCOUNTS_URL, "spotify_accounts"),
+    (RECCOBEATS_API_URL, "reccobeats"),
+)
+
+
+def service_name(url: str) -> str:
+    for prefix, name in SERVICE_PREFIXES:
+        if url.startswith(prefix):
+            return name
+    return urlsplit(url).hostname or "unknown"
+
+
+class TimeoutSession(requests.Session):
+    """requests.Session that applies a default (connect, read) timeout."""
+
+    def __init__(self, timeout: tuple[float, float]):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.default_timeout)
+        # Késleltetés (újrapróbálkozásokkal együtt) és hibák szolgáltatásonként
+        service = service_name(url)
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.Timeout:
+            external_request_errors.inc(service=service, reason="timeout")
+            external_request_seconds.observe(time.perf_counter() - start, service=service, status="error")
+            raise
+        except requests.RequestException:
+            external_request_errors.inc(service=service, reason="connection")
+            external_request_seconds.observe(time.perf_counter() - start, service=service, status="error")
+            raise
+        external_request_seconds.observe(time.perf_counter() - start, service=service, status=response.status_code)
+        if response.status_code == 429 or response.status_code >= 500:
+            external_request_errors.inc(service=service, reason=str(response.status_code))
+        return response
+
+
+def create_session(retries: int = HTTP_RETRIES, backoff: float = HTTP_BACKOFF,
+                   pool_size: int = HTTP_POOL_SIZE,
+                   timeout: tuple[float, float] = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)) -> requests.Session:
+    """Session with keep-alive connection pooling, default timeouts and
+    retries with exponential backoff on connection errors and 429/5xx.
+
+    Only idempotent methods are retried (a POST with a file body would be
+    resent from a consumed stream); Retry-After headers are honoured.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = TimeoutSession(timeout)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Megosztott session: a kapcsolatok (TCP + TLS) kérések között újrahasznosulnak
+http = create_session()
+
+
+# -------------------------------------------
+# TOKEN CACHE
+# -------------------------------------------
+
+class TokenCache:
+    """Keeps an access token until `refresh_margin` seconds before it
+    expires. `fetch()` must return (token, expires_in seconds); concurrent
+    callers share one refresh."""
+
+    def __init__(self, fetch, refresh_margin: int = TOKEN_REFRESH_MARGIN):
+        self._fetch = fetch
+        self.refresh_margin = refresh_margin
+        self._token: str | None = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        with self._lock:
+            if self._token is None or time.time() >= self._expires_at - self.refresh_margin:
+                token, expires_in = self._fetch()
+                self._token = token
+                self._expires_at = time.time() + float(expires_in)
+            return self._token
+
+    def invalidate(self) -> None:
+        """Drop the token (e.g. after a 401) so the next get() fetches a new one."""
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
+
+
+def spotify_basic_auth() -> str:
+    client_id = os.getenv("SPOTIFY_CLIENT_ID")
+    client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
+    return base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+
+
+def _fetch_spotify_token() -> tuple[str, int]:
+    res = http.post(
+        f"{SPOTIFY_ACCOUNTS_URL}/api/token",
+        headers={"Authorization": f"Basic {spotify_basic_auth()}"},
+        data={"grant_type": "client_credentials"},
+    )
+    res.raise_for_status()
+    data = res.json()
+    return data["access_token"], data.get("expires_in", 3600)
+
+
+# Spotify client-credentials token (egy óráig érvényes)
+spotify_token_cache = TokenCache(_fetch_spotify_token)
@@ -0,0 +1,325 @@
+import os
+import sys
+import time
+import uuid
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from backend.database import SessionLocal, init_db
+from backend.models.music import Track
+from backend.services.analysis_cache import file_hash
+from backend.services.db_service import analysis_to_row, upsert_tracks, track_ids_by_hash
+from backend.services.music_analyze import analyze_music
+from backend.services.recommend_index import recommend_index
+from backend.services.similarity_index import similarity_index
+
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2)))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50"))
+# Az API csak e mappa alatt indíthat beolvasást (üres: csak parancssorból)
+INGEST_ROOT = os.getenv("INGEST_ROOT", "")
+# Egyszerre futó API-s beolvasások száma és a befejezettek megőrzési ideje (s)
+INGEST_MAX_RUNS = int(os.getenv("INGEST_MAX_RUNS", "1"))
+INGEST_RUN_TTL = int(os.getenv("INGEST_RUN_TTL", "3600"))
+
+
+class IngestBusyError(Exception):
+    """Raised when the folder is already being ingested or the run limit is reached."""
+
+
+def resolve_ingest_folder(folder: str, root: str = INGEST_ROOT) -> str | None:
+    """Real path of `folder` (relative ones are taken from `root`) if it is
+    an existing directory inside `root`, else None. Always None without a
+    configured root."""
+    if not root or not folder:
+        return None
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, folder))
+    if os.path.commonpath([root, path]) != root or not os.path.isdir(path):
+        return None
+    return path
+
+
+def find_audio_files(folder: str):
+    """Yield (path, size, mtime) for every audio file under `folder` (recursive)."""
+    for root, _dirs, files in os.walk(folder):
+        for name in sorted(files):
+            if not name.lower().endswith(AUDIO_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield path, st.st_size, st.st_mtime
+
+
+def _hash_file(path: str) -> tuple[str, str, str | None, str | None]:
+    # Munkafolyamatban fut: ("hash", path, tartalom hash, hibaüzenet)
+    try:
+        return "hash", path, file_hash(path), None
+    except Exception as e:
+        return "hash", path, None, str(e) or type(e).__name__
+
+
+def _analyze_file(path: str, content_hash: str, profile: str | None,
+                  enrich: bool) -> tuple[str, str, dict | None, str | None]:
+    # Munkafolyamatban fut: ("row", path, tracks sor, hibaüzenet)
+    try:
+        result = analyze_music(path, profile=profile, enrich=enrich, content_hash=content_hash)
+        return "row", path, analysis_to_row(result, path, content_hash), None
+    except Exception as e:
+        return "row", path, None, str(e) or type(e).__name__
+
+
+def _write_batch(db, batch: list[dict], existing: dict) -> None:
+    """One transaction per batch through upsert_tracks(), i.e. deduplicated
+    on content_hash like /analyze. `existing` (path -> (id, size, mtime,
+    content_hash)) is updated with the stored rows."""
+    # Ugyanazon az úton régi tartalom (vagy hash nélküli régi sor): az új hash-t kapja,
+    # így az upsert ezt a sort frissíti; ha a tartalom már másik soron van, a régi sor törlődik
+    stale = {}
+    for row in batch:
+        known = existing.get(row["path"])
+        if known is not None and known[3] != row["content_hash"]:
+            stale[known[0]] = row["content_hash"]
+    removed = False
+    if stale:
+        taken = set(track_ids_by_hash(db, list(set(stale.values()))))
+        for track_id, content_hash in stale.items():
+            query = db.query(Track).filter(Track.id == track_id)
+            if content_hash in taken:
+                query.delete(synchronize_session=False)
+                removed = True
+            else:
+                query.update({Track.content_hash: content_hash}, synchronize_session=False)
+                taken.add(content_hash)
+
+    ids = upsert_tracks(db, batch)
+    for row in batch:
+        existing[row["path"]] = (ids[row["content_hash"]], row["file_size"], row["file_mtime"], row["content_hash"])
+    if removed:
+        recommend_index.invalidate()
+        similarity_index.invalidate()
+
+
+def _mark_known(db, path: str, content_hash: str, file_info: tuple, existing: dict) -> bool:
+    """True if `content_hash` is already stored, i.e. the file needs no
+    analysis. If it is the row of this very path (only the mtime changed),
+    its size / mtime are refreshed so the next run skips it without hashing."""
+    track_id = track_ids_by_hash(db, [content_hash]).get(content_hash)
+    if track_id is None:
+        return False
+    known = existing.get(path)
+    if known is not None and known[0] == track_id:
+        size, mtime = file_info
+        db.query(Track).filter(Track.id == track_id).update(
+            {Track.file_size: size, Track.file_mtime: mtime}, synchronize_session=False)
+        db.commit()
+        existing[path] = (track_id, size, mtime, content_hash)
+    return True
+
+
+def ingest_folder(folder: str, workers: int = INGEST_WORKERS, batch_size: int = INGEST_BATCH_SIZE,
+                  profile: str | None = None, enrich: bool = False, progress=None,
+                  should_stop=None, session_factory=SessionLocal) -> dict:
+    """Analyze every audio file under `folder` on a process pool and store
+    the results in the `tracks` table.
+
+    Results are committed every `batch_size` files together with the file's
+    size, mtime and content hash, so an interrupted run loses at most one
+    batch, the next run skips every file whose size and mtime did not
+    change. Files are hashed first: content already stored (e.g. uploaded
+    through /analyze, or a copy elsewhere in the folder) is not analyzed
+    again and keeps its single row.
+    `progress(stats)` is called after each file; `should_stop()` returning
+    True stops submitting new files (in-flight ones are still stored).
+    """
+    db = session_factory()
+    stats = {"total": 0, "skipped": 0, "done": 0, "failed": 0, "errors": [], "started_at": time.time()}
+    try:
+        # Meglévő sorok: path -> (id, size, mtime, hash), csak a szükséges oszlopokkal
+        existing = {
+            path: (track_id, size, mtime, content_hash)
+            for track_id, path, size, mtime, content_hash in db.query(
+                Track.id, Track.path, Track.file_size, Track.file_mtime, Track.content_hash)
+            if path
+        }
+
+        todo = []
+        for path, size, mtime in find_audio_files(folder):
+            stats["total"] += 1
+            known = existing.get(path)
+            if known and known[1] == size and known[2] is not None and abs(known[2] - mtime) < 1e-6:
+                stats["skipped"] += 1
+                continue
+            todo.append((path, size, mtime))
+        file_info = {path: (size, mtime) for path, size, mtime in todo}
+        if progress:
+            progress(stats)
+
+        batch: list[dict] = []
+        # Elemzés alatt / a még nem mentett kötegben lévő tartalmak: egy másolatuk sem kerül újra sorra
+        queued_hashes = set()
+        # Korlátos számú feladat van egyszerre a pool előtt, így a memória nem nő a könyvtár méretével
+        max_in_flight = max(1, workers) * 4
+        pending = set()
+        queue = iter(todo)
+        exhausted = False
+        with ProcessPoolExecutor(max_workers=max(1, workers),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            while True:
+                while not exhausted and len(pending) < max_in_flight:
+                    if should_stop and should_stop():
+                        exhausted = True
+                        break
+                    item = next(queue, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    pending.add(pool.submit(_hash_file, item[0]))
+                if not pending:
+                    break
+
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    kind, path, payload, error = future.result()
+                    if error is not None:
+                        stats["failed"] += 1
+                        stats["errors"].append({"path": path, "error": error})
+                        print(f"[Ingest] {path}: {error}")
+                    elif kind == "hash":
+                        if payload in queued_hashes or _mark_known(db, path, payload, file_info[path], existing):
+                            stats["skipped"] += 1
+                        else:
+                            queued_hashes.add(payload)
+                            pending.add(pool.submit(_analyze_file, path, payload, profile, enrich))
+                            continue
+                    else:
+                        size, mtime = file_info[path]
+                        batch.append({**payload, "file_size": size, "file_mtime": mtime})
+                        stats["done"] += 1
+                    if len(batch) >= batch_size:
+                        _write_batch(db, batch, existing)
+                        queued_hashes.difference_update(row["content_hash"] for row in batch)
+                        batch = []
+                    if progress:
+                        progress(stats)
+
+        if batch:
+            _write_batch(db, batch, existing)
+    finally:
+        db.close()
+    stats["finished_at"] = time.time()
+    return stats
+
+
+# -------------------------------------------
+# HÁTTÉRBEN FUTÓ BEOLVASÁS (API)
+# -------------------------------------------
+
+class IngestRunner:
+    """Runs ingest_folder() in background threads and keeps their progress."""
+
+    def __init__(self, max_runs: int = INGEST_MAX_RUNS, run_ttl: int = INGEST_RUN_TTL):
+        self.max_runs = max(1, max_runs)
+        self.run_ttl = run_ttl
+        self._runs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.run_ttl
+        expired = [
+            run_id for run_id, run in self._runs.items()
+            if run["status"] != "running" and (run["finished_at"] or 0) < cutoff
+        ]
+        for run_id in expired:
+            del self._runs[run_id]
+
+    def start(self, folder: str, **kwargs) -> str:
+        """Start a background run and return its id. Raises IngestBusyError
+        if `folder` is already being ingested or max_runs runs are active."""
+        run_id = uuid.uuid4().hex
+        run = {"id": run_id, "folder": folder, "status": "running", "stop": False,
+               "stats": {"total": 0, "skipped": 0, "done": 0, "failed": 0}, "error": None,
+               "finished_at": None}
+        with self._lock:
+            self._prune()
+            active = [r for r in self._runs.values() if r["status"] == "running"]
+            if any(r["folder"] == folder for r in active):
+                raise IngestBusyError(f"Folder is already being ingested: {folder}")
+            if len(active) >= self.max_runs:
+                raise IngestBusyError(f"Too many ingest runs ({self.max_runs} running)")
+            self._runs[run_id] = run
+
+        def on_progress(stats):
+            with self._lock:
+                run["stats"] = {k: v for k, v in stats.items() if k != "errors"}
+                run["stats"]["errors"] = stats["errors"][-20:]
+
+        def target():
+            try:
+                stats = ingest_folder(folder, progress=on_progress,
+                                      should_stop=lambda: run["stop"], **kwargs)
+                on_progress(stats)
+                status = "stopped" if run["stop"] else "done"
+            except Exception as e:
+                status = "failed"
+                run["error"] = str(e)
+            with self._lock:
+                run["status"] = status
+                run["finished_at"] = time.time()
+
+        threading.Thread(target=target, name=f"ingest-{run_id[:8]}", daemon=True).start()
+        return run_id
+
+    def stop(self, run_id: str) -> bool:
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None or run["status"] != "running":
+                return False
+            run["stop"] = True
+            return True
+
+    def get(self, run_id: str) -> dict | None:
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None:
+                return None
+            return {key: value for key, value in run.items() if key != "stop"}
+
+
+ingest_runner = IngestRunner()
+
+
+# -------------------------------------------
+# PARANCSORI FUTTATÁS
+# -------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Zenekönyvtár tömeges elemzése a tracks táblába")
+    parser.add_argument("folder")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--profile", default=None)
+    parser.add_argument("--enrich", action="store_true", help="ReccoBeats lekérés fájlonként (lassú)")
+    args = parser.parse_args(argv)
+
+    init_db()
+
+    def report(stats):
+        processed = stats["done"] + stats["failed"] + stats["skipped"]
+        elapsed = time.time() - stats["started_at"]
+        print(f"\r{processed}/{stats['total']} (kihagyva: {stats['skipped']}, hiba: {stats['failed']}, "
+              f"{elapsed:.0f} s)", end="", flush=True)
+
+    stats = ingest_folder(args.folder, workers=args.workers, batch_size=args.batch_size,
+                          profile=args.profile, enrich=args.enrich, progress=report)
+    print(f"\n✅ Kész: {stats['done']} új/frissített, {stats['skipped']} változatlan, {stats['failed']} hibás")
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from backend.services.music_analyze import analyze_music
+from backend.services.analysis_cache import analysis_cache
+from backend.services.db_service import store_analysis
+from backend.services.metrics import analysis_store_errors, observe_analysis
+from backend.database import SessionLocal
+
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "32"))
+ANALYSIS_JOB_TTL = int(os.getenv("ANALYSIS_JOB_TTL", "3600"))
+# "spawn": a Flask szál-készletéből forkolni nem biztonságos
+ANALYSIS_MP_CONTEXT = os.getenv("ANALYSIS_MP_CONTEXT", "spawn")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised when the number of unfinished jobs reached the queue limit."""
+
+
+def _run_analysis(file_path: str, user_token=None, profile: str | None = None,
+                  source_name: str | None = None, content_hash: str | None = None) -> dict:
+    # Modul szintű függvény, hogy a munkafolyamat picklelni tudja
+    return analyze_music(file_path, user_token, return_timings=True, profile=profile,
+                         source_name=source_name, content_hash=content_hash)
+
+
+def _persist(result: dict, file_path: str, content_hash: str | None) -> dict:
+    # Az eredmény a tracks táblába kerül; a válaszhoz a sor id-ja (vagy a mentési hiba) társul
+    if not content_hash:
+        return {}
+    db = SessionLocal()
+    try:
+        return {"id": store_analysis(db, result, file_path, content_hash)}
+    except Exception as e:
+        print("[JobQueue] storing result failed:", str(e))
+        analysis_store_errors.inc(source="job")
+        return {"storage_error": str(e) or type(e).__name__}
+    finally:
+        db.close()
+
+
+class AnalysisJobQueue:
+    """analyze_music() jobs executed on a process pool.
+
+    Jobs are kept in memory (id -> record) until ANALYSIS_JOB_TTL seconds
+    after they finished. At most `max_pending` unfinished jobs are accepted;
+    beyond that submit() raises QueueFullError so the caller can answer 503.
+    """
+
+    def __init__(self, max_workers: int = ANALYSIS_WORKERS, max_pending: int = ANALYSIS_QUEUE_SIZE,
+                 job_ttl: int = ANALYSIS_JOB_TTL):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self._executor: ProcessPoolExecutor | None = None
+        self._jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(ANALYSIS_MP_CONTEXT),
+            )
+        return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        # Összeomlott munkafolyamat után a pool használhatatlan: a következő submit újat indít
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        executor.shutdown(wait=False)
+
+    def _pending_count(self) -> int:
+        # Egy futás közben visszavont feladat is foglalja a helyét, amíg a munkafolyamat végez vele
+        return sum(1 for job in self._jobs.values() if job["future"] is not None)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.job_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in FINISHED_STATES and job["future"] is None and (job["finished_at"] or 0) < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, file_path: str, content_hash: str | None = None, user_token=None,
+               extra: dict | None = None, cached_result: dict | None = None,
+               profile: str | None = None, timings: bool = False, source_name: str | None = None) -> str:
+        """Queue an analysis and return the job id.
+
+        `extra` is merged into the result when the job finishes (e.g. the
+        stored filename). With `cached_result` the job is created already
+        finished, so clients can use the same polling flow for cache hits.
+        `timings=True` keeps the per-stage timings in the job result.
+        `source_name` is the original upload filename (metadata fallback).
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            "id": job_id,
+            "status": QUEUED,
+            "file_path": file_path,
+            "content_hash": content_hash,
+            "profile": profile,
+            "timings": timings,
+            "extra": extra or {},
+            "created_at": now,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "future": None,
+        }
+        if cached_result is not None:
+            # Az adatbázis írás a záron kívül fut: a többi submit / get nem vár rá
+            stored = _persist(cached_result, file_path, content_hash)
+            result = {**cached_result, **stored, **job["extra"]}
+            if timings:
+                result["timings"] = {}
+            job.update(status=DONE, finished_at=now, result=result)
+            with self._lock:
+                self._prune()
+                self._jobs[job_id] = job
+            return job_id
+
+        args = (_run_analysis, file_path, user_token, profile, source_name, content_hash)
+        for attempt in range(2):
+            with self._lock:
+                self._prune()
+                if self._pending_count() >= self.max_pending:
+                    raise QueueFullError(f"Analysis queue is full ({self.max_pending} jobs)")
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(*args)
+                except BrokenProcessPool:
+                    if attempt:
+                        raise
+                    future = None
+                else:
+                    self._jobs[job_id] = job
+                    job["future"] = future
+            if future is not None:
+                break
+            # A pool összeomlott, de a kész-visszahívások még nem futottak le: új pool
+            self._discard_executor(executor)
+        future.add_done_callback(lambda f, job_id=job_id, executor=executor: self._on_done(job_id, f, executor))
+        return job_id
+
+    def _on_done(self, job_id: str, future, executor: ProcessPoolExecutor | None = None) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return
+
+        result, error, status, timings = None, None, DONE, None
+        if future.cancelled() or job["status"] == CANCELLED:
+            status = CANCELLED
+        else:
+            exc = future.exception()
+            if isinstance(exc, BrokenProcessPool):
+                status, error = FAILED, "Analysis worker crashed"
+                print("[JobQueue] worker pool broken, restarting:", str(exc))
+                self._discard_executor(executor)
+            elif exc is not None:
+                status, error = FAILED, str(exc)
+            else:
+                result = future.result()
+                # A munkafolyamat metrikái nem látszanak itt: a szakaszidők az eredménnyel jönnek
+                observe_analysis(result)
+                timings = result.pop("timings", None)
+
+        # A kész eredmény akkor is a cache-be és az adatbázisba kerül, ha közben visszavonták
+        stored = {}
+        if result is not None and job["content_hash"]:
+            analysis_cache.put(job["content_hash"], result, job["profile"])
+            stored = _persist(result, job["file_path"], job["content_hash"])
+
+        with self._lock:
+            job["status"] = status
+            job["error"] = error
+            job["result"] = {**result, **stored, **job["extra"]} if result is not None and status == DONE else None
+            if job["result"] is not None and job["timings"]:
+                job["result"]["timings"] = timings or {}
+            job["finished_at"] = time.time()
+            job["future"] = None
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job. Queued jobs never start; a job that is already
+        running finishes in its worker but its result is discarded."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in FINISHED_STATES:
+                return False
+            future = job["future"]
+            job["status"] = CANCELLED
+            job["finished_at"] = time.time()
+        if future is not None:
+            future.cancel()
+        return True
+
+    def get(self, job_id: str) -> dict | None:
+        """Public view of a job (no future / file path), or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = job["status"]
+            if status == QUEUED and job["future"] is not None and job["future"].running():
+                status = RUNNING
+            return {
+                "job_id": job["id"],
+                "status": status,
+                "created_at": job["created_at"],
+                "finished_at": job["finished_at"],
+                "error": job["error"],
+                "result": job["result"],
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = self._pending_count()
+            return {
+                "workers": self.max_workers,
+                "pending": pending,
+                "capacity": self.max_pending,
+                "jobs": len(self._jobs),
+            }
+
+
+job_queue = AnalysisJobQueue()
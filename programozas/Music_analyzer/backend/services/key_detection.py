@@ -0,0 +1,178 @@
+import os
+import numpy as np
+import librosa
+
+
+Camelot_map = {
+    "C:maj": "8B", "G:maj": "9B", "D:maj": "10B", "A:maj": "11B", "E:maj": "12B",
+    "B:maj": "1B", "F#:maj": "2B", "C#:maj": "3B", "Ab:maj": "4B", "Eb:maj": "5B",
+    "Bb:maj": "6B", "F:maj": "7B",
+    "A:min": "8A", "E:min": "9A", "B:min": "10A", "F#:min": "11A", "C#:min": "12A",
+    "G#:min": "1A", "D#:min": "2A", "A#:min": "3A", "F:min": "4A", "C:min": "5A",
+    "G:min": "6A", "D:min": "7A"
+}
+
+# Krumhansl–Schmuckler hangnemprofilok
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09,
+                          2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53,
+                          2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+# Index -> hangnév leképezés a Camelot_map kulcsaihoz illesztve
+MAJOR_NAMES = ["C", "C#", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B"]
+MINOR_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+# A 24 hangnem sorrendje: 0..11 dúr (alaphang szerint), 12..23 moll
+KEY_NAMES = [f"{name}:maj" for name in MAJOR_NAMES] + [f"{name}:min" for name in MINOR_NAMES]
+KEY_CAMELOT = [Camelot_map[name] for name in KEY_NAMES]
+
+
+def _profile_matrix() -> np.ndarray:
+    """24x12 matrix of the rotated profiles, each centered and L2-normalized,
+    so a product with a centered, normalized chroma vector is its Pearson
+    correlation with every key at once."""
+    rows = [np.roll(MAJOR_PROFILE, r) for r in range(12)] + [np.roll(MINOR_PROFILE, r) for r in range(12)]
+    profiles = np.array(rows, dtype=np.float64)
+    profiles -= profiles.mean(axis=1, keepdims=True)
+    profiles /= np.linalg.norm(profiles, axis=1, keepdims=True)
+    return profiles
+
+
+KEY_PROFILES = _profile_matrix()
+
+# Csúszóablakos becslés: blokkok (a chroma kereteinek összegei) és az ablak hossza
+KEY_BLOCK_SECONDS = float(os.getenv("KEY_BLOCK_SECONDS", "10"))
+KEY_WINDOW_SECONDS = float(os.getenv("KEY_WINDOW_SECONDS", "20"))
+
+
+def key_scores(chroma: np.ndarray) -> np.ndarray:
+    """Correlation of each chroma column (12 x n) with all 24 keys -> 24 x n.
+    Silent (all-zero) columns score 0 for every key."""
+    chroma = np.asarray(chroma, dtype=np.float64)
+    centered = chroma - chroma.mean(axis=0, keepdims=True)
+    norms = np.linalg.norm(centered, axis=0, keepdims=True)
+    centered /= np.where(norms > 1e-12, norms, np.inf)
+    return KEY_PROFILES @ centered
+
+
+def chroma_blocks(chroma: np.ndarray, frames_per_block: int) -> np.ndarray:
+    """Sum the chroma frames in consecutive blocks of `frames_per_block` -> 12 x n_blocks
+    (the last block may be shorter)."""
+    n_frames = chroma.shape[1]
+    n_blocks = -(-n_frames // frames_per_block)
+    padded = np.zeros((chroma.shape[0], n_blocks * frames_per_block))
+    padded[:, :n_frames] = chroma
+    return padded.reshape(chroma.shape[0], n_blocks, frames_per_block).sum(axis=2)
+
+
+class ChromaBlocks:
+    """Incremental chroma_blocks() for block-wise (streaming) analysis:
+    only the per-block sums are kept, never the chroma frames."""
+
+    def __init__(self, frames_per_block: int):
+        self.frames_per_block = frames_per_block
+        self._blocks: list[np.ndarray] = []
+        self._partial = np.zeros(12)
+        self._partial_frames = 0
+
+    def add(self, chroma: np.ndarray) -> None:
+        pos = 0
+        n_frames = chroma.shape[1]
+        while pos < n_frames:
+            take = min(self.frames_per_block - self._partial_frames, n_frames - pos)
+            self._partial += chroma[:, pos:pos + take].sum(axis=1)
+            self._partial_frames += take
+            pos += take
+            if self._partial_frames == self.frames_per_block:
+                self._blocks.append(self._partial)
+                self._partial = np.zeros(12)
+                self._partial_frames = 0
+
+    def blocks(self) -> np.ndarray:
+        blocks = self._blocks + ([self._partial] if self._partial_frames else [])
+        return np.stack(blocks, axis=1) if blocks else np.zeros((12, 0))
+
+
+def detect_key_blocks(blocks: np.ndarray, block_seconds: float, duration: float | None = None,
+                      window_seconds: float = KEY_WINDOW_SECONDS) -> dict | None:
+    """Key estimate from chroma block sums (12 x n_blocks).
+
+    Sliding windows of whole blocks are scored against all 24 keys in one
+    matrix product. Every window votes for its best key with its energy,
+    so a quiet intro or a short modulation cannot outvote the rest of the
+    track; ties (and the runner-up when all windows agree) are decided by
+    the energy-weighted mean correlation. `confidence` is the energy share
+    of the windows that agree with the track key. Consecutive windows with
+    the same best key are merged into `segments`. None for silent input.
+    """
+    n_blocks = blocks.shape[1]
+    if n_blocks == 0 or not np.any(blocks):
+        return None
+    win = min(max(1, int(round(window_seconds / block_seconds))), n_blocks)
+    csum = np.concatenate([np.zeros((12, 1)), np.cumsum(blocks, axis=1)], axis=1)
+    windows = csum[:, win:] - csum[:, :-win]
+
+    scores = key_scores(windows)
+    energy = windows.sum(axis=0)
+    weights = energy / energy.sum()
+    track_scores = scores @ weights
+
+    best = scores.argmax(axis=0)
+    votes = np.bincount(best, weights=weights, minlength=24)
+    top, second = np.lexsort((track_scores, votes))[::-1][:2]
+    confidence = float(votes[top])
+
+    # Azonos legjobb kulcsú szomszédos ablakok összevonása szakaszokká
+    total = duration if duration is not None else n_blocks * block_seconds
+    starts = np.concatenate([[0], np.flatnonzero(best[1:] != best[:-1]) + 1])
+    edges = np.minimum(np.append(starts, len(best)) * block_seconds, total)
+    edges[-1] = total
+    segments = [
+        {
+            "start": round(float(edges[i]), 2),
+            "end": round(float(edges[i + 1]), 2),
+            "camelot": KEY_CAMELOT[best[start]],
+            "key": KEY_NAMES[best[start]],
+        }
+        for i, start in enumerate(starts)
+    ]
+
+    return {
+        "camelot": KEY_CAMELOT[top],
+        "key": KEY_NAMES[top],
+        "score": float(track_scores[top]),
+        "runner_up": KEY_CAMELOT[second],
+        "runner_up_key": KEY_NAMES[second],
+        "runner_up_score": float(track_scores[second]),
+        "confidence": round(confidence, 4),
+        "segments": segments,
+    }
+
+
+def detect_key(chroma: np.ndarray, sr: int, hop_length: int = 512,
+               block_seconds: float = KEY_BLOCK_SECONDS) -> dict | None:
+    """detect_key_blocks() on a frame-level chroma (12 x frames)."""
+    if chroma is None or chroma.size == 0:
+        return None
+    frames_per_block = max(1, int(round(block_seconds * sr / hop_length)))
+    blocks = chroma_blocks(chroma, frames_per_block)
+    return detect_key_blocks(blocks, frames_per_block * hop_length / sr,
+                             duration=chroma.shape[1] * hop_length / sr)
+
+
+def key_chroma(y: np.ndarray, sr: int, hop_length: int = 512) -> np.ndarray:
+    """Chroma of the harmonic component (the same input the analyzer's feature graph uses)."""
+    y_harm = librosa.effects.harmonic(y)
+    return librosa.feature.chroma_cqt(y=y_harm, sr=sr, hop_length=hop_length)
+
+
+def key_fields(estimate: dict | None) -> dict:
+    """Result-dict fields of an estimate (the Camelot key itself goes to "camelot")."""
+    if estimate is None:
+        return {"key": None, "key_confidence": None, "camelot_runner_up": None, "key_segments": []}
+    return {
+        "key": estimate["key"],
+        "key_confidence": estimate["confidence"],
+        "camelot_runner_up": estimate["runner_up"],
+        "key_segments": estimate["segments"],
+    }
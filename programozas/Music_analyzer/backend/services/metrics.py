@@ -0,0 +1,224 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+
+# Késleltetés hisztogramok határai (másodperc)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels (Prometheus semantics)."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # címkék -> [bucketenkénti darabszám (nem kumulált), összeg, darabszám]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        out = []
+        for key, counts, total, count in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                out.append((self.name + "_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            out.append((self.name + "_sum", labels, total))
+            out.append((self.name + "_count", labels, count))
+        return out
+
+
+class MetricsRegistry:
+    """Process-local metrics rendered in the Prometheus text format.
+
+    Besides the counters / histograms created here, collectors (callables
+    returning (name, type, help, [(labels, value), ...]) tuples) are read
+    at scrape time, e.g. for cache statistics kept elsewhere.
+    """
+
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: list = []
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print("[Metrics] collector failed:", str(e))
+                continue
+            for name, metric_type, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Flask request latency by route", ("method", "route", "status"))
+analysis_seconds = registry.histogram(
+    "analysis_duration_seconds", "Total analyze_music() time (sum of its stages)", ("mode",))
+analysis_stage_seconds = registry.histogram(
+    "analysis_stage_seconds", "Self time of each analysis stage (decode, stft, hpss, cqt, tempo, ...)",
+    ("mode", "stage"), buckets=STAGE_BUCKETS)
+analysis_cache_requests = registry.counter(
+    "analysis_cache_requests_total", "Analysis result cache lookups of /analyze", ("result",))
+analysis_store_errors = registry.counter(
+    "analysis_store_errors_total", "Analysis results that could not be written to the tracks table", ("source",))
+external_request_seconds = registry.histogram(
+    "external_request_duration_seconds", "Latency of calls to external APIs", ("service", "status"))
+external_request_errors = registry.counter(
+    "external_request_errors_total", "Failed external API calls (exceptions, 429 and 5xx answers)",
+    ("service", "reason"))
+
+
+def observe_analysis(result: dict) -> None:
+    """Record the per-stage timings (ms) of an analyze_music() result."""
+    timings = result.get("timings") or {}
+    mode = result.get("analysis_mode", "unknown")
+    for stage, ms in timings.items():
+        analysis_stage_seconds.observe(ms / 1000.0, mode=mode, stage=stage)
+    if timings:
+        analysis_seconds.observe(sum(timings.values()) / 1000.0, mode=mode)
+
+
+# -------------------------------------------
+# Gyorsítótárak és sor állapota (lekérdezéskor olvasva)
+# -------------------------------------------
+
+def _cache_collector():
+    from backend.services.response_cache import response_cache
+    from backend.services.analysis_cache import analysis_cache
+    from backend.services.job_queue import job_queue
+
+    responses = response_cache.stats()
+    requests_samples, hit_rate_samples = [], []
+    for namespace, counters in responses["namespaces"].items():
+        for result in ("hits", "misses", "coalesced", "errors"):
+            requests_samples.append(({"namespace": namespace, "result": result}, counters[result]))
+        if counters["hit_rate"] is not None:
+            hit_rate_samples.append(({"namespace": namespace}, counters["hit_rate"]))
+    analysis = analysis_cache.stats()
+    jobs = job_queue.stats()
+    return [
+        ("response_cache_requests_total", "counter", "External API response cache lookups", requests_samples),
+        ("response_cache_hit_ratio", "gauge", "Share of lookups answered without an upstream call", hit_rate_samples),
+        ("response_cache_entries", "gauge", "Entries in the response cache", [({}, responses["entries"])]),
+        ("analysis_cache_entries", "gauge", "Stored analysis results", [({}, analysis["entries"])]),
+        ("analysis_cache_bytes", "gauge", "Payload bytes of stored analysis results", [({}, analysis["bytes"])]),
+        ("analysis_jobs_pending", "gauge", "Queued or running analysis jobs", [({}, jobs["pending"])]),
+    ]
+
+
+def init_app(app):
+    """Time every request by route and serve the metrics on GET /metrics."""
+    from flask import Response, g, request
+
+    registry.register_collector(_cache_collector)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            http_request_seconds.observe(time.perf_counter() - start, method=request.method,
+                                         route=route, status=response.status_code)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
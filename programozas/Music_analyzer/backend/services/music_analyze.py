@@ -6,18 +6,43 @@ import base64
 import time
 import numpy as np
 import librosa
+import soundfile as sf
 from mutagen.mp3 import MP3
 from mutagen.id3 import ID3
 from flask import jsonify
 from dotenv import load_dotenv
-from backend.services.camelot import detect_camelot
+from backend.services.camelot import estimate_key
+from backend.services.key_detection import key_fields
+from backend.services.feature_graph import FeatureGraph
+from backend.services.genre_classifier import genre_model
+from backend.services.analysis_profile import get_profile, load_audio
 from backend.services.reccobeats import analyze_with_reccobeats
+from backend.services.snippet import make_snippet
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 
 # Betöltjük a .env fájlt (Spotify kulcsokhoz)
 load_dotenv()
 
 upload_folder = "./uploads"
 
+# Minden olyan változtatásnál növelni kell, ami az elemzés eredményét módosítja
+# (a cache és a tárolt eredmények ehhez a verzióhoz kötődnek).
+ANALYSIS_VERSION = "6"
+
+# Ennél hosszabb felvételeket (pl. DJ mixek) blokkonként, korlátos memóriával elemzünk
+STREAM_THRESHOLD_SECONDS = float(os.getenv("STREAM_THRESHOLD_SECONDS", "900"))
+
+# A ReccoBeats feltöltési korlátja; e fölött 30 s-os tömörített részlet megy fel
+RECCOBEATS_MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+# Háttérszálak a hálózati dúsításhoz (a helyi elemzéssel párhuzamosan)
+_enrich_pool = ThreadPoolExecutor(max_workers=int(os.getenv("ENRICH_WORKERS", "4")),
+                                  thread_name_prefix="enrich")
+# Külön szálak a gyors helyi I/O lépésekhez (metaadat), hogy ne várjanak a lassú feltöltések mögött
+_stage_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stage")
+# Teljes elemzés határideje (s): eddig várunk a ReccoBeats válaszra, utána nélküle adunk eredményt.
+# 0 = nincs határidő.
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "60"))
+
 # -------------------------------------------
 # SEGÉDFÜGGVÉNYEK
 # -------------------------------------------
@@ -37,12 +62,18 @@ def cleaned_title(title: str) -> str:
 # LOKÁLIS JELLEMZŐK ÉS MŰFAJ HEURISZTIKA
 # -------------------------------------------
 
-def compute_local_features(y: np.ndarray, sr: int) -> dict:
-    """Számol néhány stabil, olcsó jellemzőt műfajbecsléshez."""
+def compute_local_features(y: np.ndarray, sr: int, graph: FeatureGraph | None = None) -> dict:
+    """Számol néhány stabil, olcsó jellemzőt műfajbecsléshez.
+
+    A közös köztes reprezentációkat (STFT, HPSS, onset burkoló, CQT) a
+    `graph` adja; ha nincs megadva, itt hozunk létre egyet.
+    """
+    if graph is None:
+        graph = FeatureGraph(y, sr)
     out = {}
     # Spektrális jellemzők
     try:
-        sc = librosa.feature.spectral_centroid(y=y, sr=sr)
+        sc = graph.timed("spectral_centroid", lambda: librosa.feature.spectral_centroid(S=graph.magnitude, sr=sr))
         out["spectral_centroid_mean"] = float(np.mean(sc))
         out["spectral_centroid_std"] = float(np.std(sc))
     except Exception:
@@ -50,152 +81,65 @@ def compute_local_features(y: np.ndarray, sr: int) -> dict:
         out["spectral_centroid_std"] = None
 
     try:
-        roll = librosa.feature.spectral_rolloff(y=y, sr=sr, roll_percent=0.85)
+        roll = graph.timed("spectral_rolloff", lambda: librosa.feature.spectral_rolloff(S=graph.magnitude, sr=sr, roll_percent=0.85))
         out["spectral_rolloff_85"] = float(np.mean(roll))
     except Exception:
         out["spectral_rolloff_85"] = None
 
     # ZCR és onset sűrűség
     try:
-        zcr = librosa.feature.zero_crossing_rate(y)
+        zcr = graph.timed("zcr", lambda: librosa.feature.zero_crossing_rate(
+            y, frame_length=graph.n_fft, hop_length=graph.hop_length))
         out["zcr_mean"] = float(np.mean(zcr))
     except Exception:
         out["zcr_mean"] = None
 
     try:
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
-        duration = librosa.get_duration(y=y, sr=sr)
+        onsets = graph.timed("onset_detect", lambda: librosa.onset.onset_detect(
+            onset_envelope=graph.onset_env, sr=sr, hop_length=graph.hop_length))
+        duration = graph.duration
         out["onset_rate"] = float(len(onsets) / duration) if duration > 0 else 0.0
     except Exception:
         out["onset_rate"] = None
 
     # Harmonic vs percussive arány
     try:
-        y_h, y_p = librosa.effects.hpss(y)
-        h_energy = float(np.mean(np.abs(y_h)))
-        p_energy = float(np.mean(np.abs(y_p)))
+        h_energy = float(np.mean(np.abs(graph.y_harmonic)))
+        p_energy = float(np.mean(np.abs(graph.y_percussive)))
         out["harmonic_percussive_ratio"] = float((h_energy + 1e-8) / (p_energy + 1e-8))
     except Exception:
         out["harmonic_percussive_ratio"] = None
 
     # Kromatikus változékonyság (harmóniai gazdagság indikátor)
     try:
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        out["chroma_var"] = float(np.mean(np.var(chroma, axis=1)))
+        out["chroma_var"] = float(np.mean(np.var(graph.chroma, axis=1)))
     except Exception:
         out["chroma_var"] = None
 
     return out
 
 
-def classify_genre_local(bpm: int, rms: float, feats: dict) -> tuple[str, list]:
+def classify_genre_local(bpm: float, rms: float, feats: dict) -> tuple[str, list]:
     """Egyszerű, változatos heurisztika több jelölttel.
     Visszaad: (top_genre, candidates_sorted)
+
+    The scoring is linear in a fixed set of terms (see genre_classifier),
+    so the same model can reclassify the whole library from stored
+    features; GENRE_WEIGHTS_PATH selects an alternative weight set.
     """
-    sc = feats.get("spectral_centroid_mean") or 0.0
-    roll = feats.get("spectral_rolloff_85") or 0.0
-    zcr = feats.get("zcr_mean") or 0.0
-    onset = feats.get("onset_rate") or 0.0
-    hpr = feats.get("harmonic_percussive_ratio") or 1.0
-    chroma_var = feats.get("chroma_var") or 0.0
-
-    # Normalizálások (durva skálák)
-    sc_n = sc / 4000.0  # ~0..3 tipikusan
-    roll_n = roll / 6000.0
-    zcr_n = zcr * 10.0
-    onset_n = min(onset / 6.0, 1.5)
-    hpr_n = min(hpr, 3.0)
-    chroma_n = min(chroma_var, 1.5)
-    rms_n = min(max(rms * 10.0, 0.0), 1.5)
-
-    candidates = []
-
-    # Dance / Electronic
-    score_dance = 0.0
-    if 118 <= bpm <= 135:
-        score_dance += 1.5
-    score_dance += 0.6 * onset_n + 0.5 * (1.0 / max(hpr_n, 0.4)) + 0.4 * sc_n
-    candidates.append(("Dance/Electronic", score_dance))
-
-    # Hip-Hop / Rap
-    score_rap = 0.0
-    if 78 <= bpm <= 105:
-        score_rap += 1.2
-    score_rap += 0.6 * onset_n + 0.3 * (1.2 - sc_n) + 0.2 * zcr_n
-    candidates.append(("Hip-Hop/Rap", score_rap))
-
-    # Rock / Metal
-    score_rock = 0.0
-    if 120 <= bpm <= 180:
-        score_rock += 1.0
-    score_rock += 0.7 * sc_n + 0.6 * roll_n + 0.5 * zcr_n + 0.3 * onset_n
-    candidates.append(("Rock/Metal", score_rock))
-
-    # Pop
-    score_pop = 0.0
-    if 95 <= bpm <= 130:
-        score_pop += 1.0
-    score_pop += 0.4 * (1.0 - zcr_n) + 0.3 * (1.0 - roll_n) + 0.4 * chroma_n
-    candidates.append(("Pop", score_pop))
-
-    # Acoustic/Folk
-    score_acoustic = 0.0
-    if bpm <= 120:
-        score_acoustic += 0.4
-    score_acoustic += 0.7 * (hpr_n / 2.0) + 0.6 * (1.2 - sc_n) + 0.3 * (1.0 - onset_n)
-    candidates.append(("Acoustic/Folk", score_acoustic))
-
-    # Jazz/Blues
-    score_jazz = 0.0
-    if 80 <= bpm <= 160:
-        score_jazz += 0.6
-    score_jazz += 0.7 * (hpr_n / 2.0) + 0.6 * chroma_n + 0.2 * (1.0 - onset_n)
-    candidates.append(("Jazz/Blues", score_jazz))
-
-    # Classical / Orchestral
-    score_classical = 0.0
-    if bpm <= 100:
-        score_classical += 0.5
-    score_classical += 0.8 * (hpr_n / 2.0) + 0.6 * (1.4 - sc_n) + 0.4 * (1.0 - onset_n)
-    candidates.append(("Classical/Orchestral", score_classical))
-
-    # Electronic (Fast)
-    score_fast_edm = 0.0
-    if bpm >= 135:
-        score_fast_edm += 1.0
-    score_fast_edm += 0.6 * onset_n + 0.5 * (1.0 / max(hpr_n, 0.4)) + 0.5 * roll_n
-    candidates.append(("Electronic (Fast)", score_fast_edm))
-
-    candidates_sorted = sorted(candidates, key=lambda x: x[1], reverse=True)
-    top_genre = candidates_sorted[0][0]
-    return top_genre, candidates_sorted
+    return genre_model().classify(bpm, rms, feats)
 
 
 # -------------------------------------------
-# ZENE ANALÍZIS
+# METAADAT ÉS KÜLSŐ GAZDAGÍTÁS
 # -------------------------------------------
 
-def analyze_music(file_path: str, user_token=None):
-    """Librosa + Spotify alapú elemzés.
+def read_metadata(file_path: str, source_name: str | None = None) -> tuple[str, str, str]:
+    """ID3 tagek, ha hiányoznak, a fájlnév alapján. Visszaad: (title, artist, genre).
 
-    If a user OAuth access token is provided, use it; otherwise fall back
-    to app client-credentials token.
+    `source_name` is the original filename when the file itself is stored
+    under another name (content-addressed uploads).
     """
-    try:
-        y, sr = librosa.load(file_path, sr=None)
-    except Exception as e:
-        print("Librosa hiba:", str(e))
-        raise
-
-    duration = librosa.get_duration(y=y, sr=sr)
-    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-    bpm = int(round(float(tempo))) if isinstance(tempo, (int, float)) else int(round(float(tempo[0])))
-    rms = float(librosa.feature.rms(y=y).mean())
-    camelot = detect_camelot(y, sr)
-    local_feats = compute_local_features(y, sr)
-    genre_local, genre_candidates = classify_genre_local(bpm, rms, local_feats)
-
     artist = "Unknown Artist"
     genre = "Unknown Genre"
     title = "Unknown Title"
@@ -218,7 +162,7 @@ def analyze_music(file_path: str, user_token=None):
 
     # Ha hiányzik az előadó/cím, próbáljuk a fájlnévből
     if artist == "Unknown Artist" or title == "Unknown Title":
-        filename = os.path.basename(file_path).replace(".mp3", "")
+        filename = os.path.basename(source_name or file_path).replace(".mp3", "")
         parts = filename.split("-")
         if len(parts) >= 2:
             if artist == "Unknown Artist":
@@ -226,50 +170,115 @@ def analyze_music(file_path: str, user_token=None):
             if title == "Unknown Title":
                 title = cleaned_title(parts[1].strip().replace("_", " "))
 
-    # Optional ReccoBeats enrichment (5MB limit; for larger files create 30s snippet)
-    rb_features = {}
-    try:
-        # Always allow calling ReccoBeats (no API key required per docs)
-        api_key = os.getenv("RECCOBEATS_API_KEY")
-        target_path = file_path
+    return title, artist, genre
+
+
+def reccobeats_enrichment(file_path: str, y: np.ndarray | None, sr: int,
+                          rms_frames: np.ndarray | None = None, hop_length: int = 512,
+                          content_hash: str | None = None) -> dict | None:
+    """Optional ReccoBeats enrichment (5MB upload limit). None if the
+    request failed, so the caller does not mistake it for an empty answer.
+
+    Larger files are replaced by a compressed in-memory snippet of their
+    loudest 30 s (picked from the frame RMS `rms_frames`), so nothing is
+    written to disk. `y` may be None (streaming mode); the snippet window
+    is then decoded on its own. Results are kept in the feature store by
+    content hash, so re-analyzing the same file does not upload it again;
+    the file is only read to hash it when `content_hash` is not given.
+    """
+    from backend.services.analysis_cache import file_hash
+    from backend.services.feature_store import file_features
+
+    # Always allow calling ReccoBeats (no API key required per docs)
+    api_key = os.getenv("RECCOBEATS_API_KEY")
+
+    def upload():
         try:
             file_size = os.path.getsize(file_path)
         except Exception:
             file_size = 0
 
-        if file_size > 5 * 1024 * 1024:
+        if file_size > RECCOBEATS_MAX_UPLOAD_BYTES:
             try:
-                import soundfile as sf
-                snip_samples = int(min(30.0, duration) * sr)
-                y_snip = y[:snip_samples]
-                tmp_out = file_path + ".rb_snip.wav"
-                sf.write(tmp_out, y_snip, sr)
-                target_path = tmp_out
+                data, ext, _mime = make_snippet(file_path, y, sr, rms_frames, hop_length)
+                name = os.path.splitext(os.path.basename(file_path))[0] + ext
+                return analyze_with_reccobeats(file_path, api_key, data=data, filename=name)
             except Exception as e:
                 print("[ReccoBeats] snippet create failed:", str(e))
+        return analyze_with_reccobeats(file_path, api_key)
 
-        rb = analyze_with_reccobeats(target_path, api_key) or {}
-
-        if target_path != file_path:
-            try:
-                os.remove(target_path)
-            except Exception:
-                pass
-
-        for key in [
-            "acousticness", "danceability", "energy", "instrumentalness",
-            "liveness", "loudness", "speechiness", "tempo", "valence"
-        ]:
-            if key in rb:
-                rb_features[key] = rb[key]
+    try:
+        return file_features(content_hash or file_hash(file_path), upload)
     except Exception as e:
         print("[ReccoBeats] integration error:", str(e))
+        return None
+
+
+def needs_snippet(file_path: str) -> bool:
+    """True if the file is over the ReccoBeats upload limit, i.e. its
+    snippet window has to be picked from the frame RMS first."""
+    try:
+        return os.path.getsize(file_path) > RECCOBEATS_MAX_UPLOAD_BYTES
+    except OSError:
+        return False
+
+
+def start_enrichment(file_path: str, y: np.ndarray | None = None, sr: int | None = None,
+                     rms_frames: np.ndarray | None = None, hop_length: int = 512,
+                     content_hash: str | None = None) -> Future:
+    """Run reccobeats_enrichment() on the enrichment pool; the caller goes on with the local DSP."""
+    return _enrich_pool.submit(reccobeats_enrichment, file_path, y, sr, rms_frames, hop_length, content_hash)
+
+
+def analysis_deadline() -> float | None:
+    """time.monotonic() value by which the analysis should finish (None: no deadline)."""
+    if ANALYSIS_DEADLINE_SECONDS <= 0:
+        return None
+    return time.monotonic() + ANALYSIS_DEADLINE_SECONDS
+
+
+def collect_enrichment(future: Future | None, deadline: float | None) -> tuple[dict, str]:
+    """ReccoBeats features of a start_enrichment() future, waiting at most
+    until `deadline`. Returns (features, status), status being "ok",
+    "skipped", "timeout" or "error" (also when the request failed); on
+    timeout or error the features are empty and the analysis result is
+    returned without them (and is not cached). A request
+    still in flight is left to finish in the background, so its answer
+    lands in the feature store for the next analysis of the same file.
+    """
+    if future is None:
+        return {}, "skipped"
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        features = future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()  # ha még sorban áll, el sem indul
+        print(f"[ReccoBeats] enrichment dropped: analysis deadline ({ANALYSIS_DEADLINE_SECONDS:g} s) exceeded")
+        return {}, "timeout"
+    except Exception as e:
+        print("[ReccoBeats] enrichment failed:", str(e))
+        return {}, "error"
+    if features is None:
+        return {}, "error"
+    return features, "ok"
+
+
+def build_result(file_path: str, duration: float, tempo: dict, rms: float, key_estimate: dict | None,
+                 local_feats: dict, rb_features: dict | None = None,
+                 metadata: tuple[str, str, str] | None = None) -> dict:
+    """Metaadat + műfaj + ReccoBeats összefésülése a végső válasszá.
+
+    `tempo` is a tempo.estimate_tempo() result, `key_estimate` a
+    key_detection estimate (None: unknown key).
+    `metadata` is a read_metadata() result computed ahead of time; it is
+    read here if not given.
+    """
+    bpm = tempo["bpm"]
+    genre_local, genre_candidates = classify_genre_local(bpm, rms, local_feats)
+    title, artist, genre = metadata if metadata is not None else read_metadata(file_path)
 
     # Spotify audio features nem kerülnek lekérésre; csak lokális jellemzők
 
-    # -------------------------------------------
-    # Eredmény összeállítás
-    # -------------------------------------------
     result = {
         "title": title,
         "artist": artist,
@@ -278,8 +287,10 @@ def analyze_music(file_path: str, user_token=None):
         "genre_source": "local_heuristic" if genre == "Unknown Genre" else "tag_or_filename",
         "duration": float(duration),
         "bpm": bpm,
+        "bpm_confidence": tempo["confidence"],
         "rms": rms,
-        "camelot": camelot,
+        "camelot": key_estimate["camelot"] if key_estimate is not None else "Unknown",
+        **key_fields(key_estimate),
         **local_feats,
         "genre_candidates": [{"label": g, "score": float(s)} for g, s in genre_candidates]
     }
@@ -289,10 +300,101 @@ def analyze_music(file_path: str, user_token=None):
     return result
 
 
+# -------------------------------------------
+# ZENE ANALÍZIS
+# -------------------------------------------
+
+def use_streaming(file_path: str) -> bool:
+    """Hosszú fájloknál (STREAM_THRESHOLD_SECONDS felett) blokkos elemzés."""
+    try:
+        # Csak soundfile: a stream_blocks is azzal olvas (a librosa audioreadre váltana)
+        return sf.info(file_path).duration > STREAM_THRESHOLD_SECONDS
+    except Exception:
+        # Pl. soundfile által nem olvasható formátum (m4a): marad a teljes dekódolás
+        return False
+
+
+def analyze_music(file_path: str, user_token=None, return_timings: bool = False, mode: str = "auto",
+                  profile: str | None = None, enrich: bool = True, source_name: str | None = None,
+                  content_hash: str | None = None):
+    """Librosa + Spotify alapú elemzés.
+
+    If a user OAuth access token is provided, use it; otherwise fall back
+    to app client-credentials token. With `return_timings=True` the result
+    also carries a "timings" dict (ms per stage: decode, feature-graph
+    nodes, enrichment_wait / metadata_wait); the stages add up to the
+    total analysis time.
+
+    `mode` is "full" (decode the whole track), "stream" (bounded-memory
+    block-wise analysis, see stream_analyze) or "auto" (stream only for
+    tracks longer than STREAM_THRESHOLD_SECONDS).
+
+    `profile` selects an analysis profile (sample rate, framing, resampler;
+    see analysis_profile.ANALYSIS_PROFILES); the result records its name.
+    `enrich=False` skips the ReccoBeats request (bulk ingestion).
+    `source_name` is the original filename for the filename-based
+    title / artist fallback (see read_metadata). `content_hash` is the
+    file's SHA-256 if already known (hashed while uploading); otherwise
+    the enrichment hashes the file itself.
+
+    The ReccoBeats request and the metadata read run on background threads
+    while the track is decoded and analyzed, so the latency is close to
+    max(local, remote) instead of their sum. Enrichment that misses the
+    ANALYSIS_DEADLINE_SECONDS deadline is dropped ("enrichment": "timeout").
+    """
+    prof = get_profile(profile)
+    if mode == "stream" or (mode == "auto" and use_streaming(file_path)):
+        from backend.services.stream_analyze import analyze_music_stream
+        return analyze_music_stream(file_path, user_token, return_timings=return_timings,
+                                    profile=prof, enrich=enrich, source_name=source_name,
+                                    content_hash=content_hash)
+
+    deadline = analysis_deadline()
+    metadata = _stage_pool.submit(read_metadata, file_path, source_name)
+    # Kis fájl: a feltöltés azonnal indul, még a dekódolás előtt
+    snippet = enrich and needs_snippet(file_path)
+    enrichment = start_enrichment(file_path, content_hash=content_hash) if enrich and not snippet else None
+
+    decode_start = time.perf_counter()
+    try:
+        y, sr = load_audio(file_path, prof)
+    except Exception as e:
+        print("Librosa hiba:", str(e))
+        raise
+
+    # Egyetlen STFT / HPSS / CQT / onset burkoló az összes jellemzőhöz
+    graph = FeatureGraph(y, sr, n_fft=prof["n_fft"], hop_length=prof["hop_length"])
+    graph.timings["decode"] = time.perf_counter() - decode_start
+    duration = graph.duration
+
+    # Nagy fájl: a snippet ablakához a keret-RMS kell, utána a feltöltés a többi DSP-vel párhuzamosan fut
+    if snippet:
+        enrichment = start_enrichment(file_path, y, sr, graph.rms, graph.hop_length, content_hash)
+
+    tempo = graph.tempo_estimate
+    rms = float(graph.rms.mean())
+    key_estimate = estimate_key(y, sr, graph=graph)
+    local_feats = compute_local_features(y, sr, graph=graph)
+
+    # -------------------------------------------
+    # Eredmény összeállítás
+    # -------------------------------------------
+    # A háttérszálakra várakozás is külön szakasz: a helyi DSP-n felüli távoli késleltetés
+    rb_features, enrichment_status = graph.timed("enrichment_wait", lambda: collect_enrichment(enrichment, deadline))
+    result = build_result(file_path, duration, tempo, rms, key_estimate, local_feats, rb_features,
+                          metadata=graph.timed("metadata_wait", metadata.result))
+    result["enrichment"] = enrichment_status
+    result["analysis_mode"] = "full"
+    result["analysis_profile"] = prof["name"]
+    if return_timings:
+        result["timings"] = graph.report()
+    return result
+
+
 # -------------------------------------------
 # PARANCSORI FUTTATÁS TESZTELÉSHEZ
 # -------------------------------------------
 if __name__ == "__main__":
     file_path = sys.argv[1]
-    result = analyze_music(file_path)
+    result = analyze_music(file_path, return_timings=True)
     print(json.dumps(result, indent=2, ensure_ascii=False))
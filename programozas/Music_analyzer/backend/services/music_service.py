@@ -1,32 +1,19 @@
-import librosa, numpy as np, mutagen
+import mutagen
 from mutagen.easyid3 import EasyID3
 from sqlalchemy.orm import Session
 from backend.models.music import Track
-
-# Camelot mapping
-camelot_map = {
-    "C": "8B", "Cm": "5A", "C#": "3B", "C#m": "12A",
-    "D": "10B", "Dm": "7A", "D#": "5B", "D#m": "2A",
-    "E": "12B", "Em": "9A", "F": "7B", "Fm": "4A",
-    "F#": "2B", "F#m": "11A", "G": "9B", "Gm": "6A",
-    "G#": "4B", "G#m": "1A", "A": "11B", "Am": "8A",
-    "A#": "6B", "A#m": "3A", "B": "1B", "Bm": "10A"
-}
+from backend.services.analysis_profile import load_audio
+from backend.services.camelot import estimate_key
+from backend.services.tempo import estimate_tempo, tempo_onset_env
+from backend.services.recommend_index import recommend_index
+from backend.services.similarity_index import similarity_index
 
 def detect_key_camelot(y, sr):
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-    chroma_mean = np.mean(chroma, axis=1)
-    pitch_class = np.argmax(chroma_mean)
-    pitch_names = ['C','C#','D','D#','E','F','F#','G','G#','A','A#','B']
-    is_minor = librosa.feature.tonnetz(y=y, sr=sr).mean() < 0
-    key_name = pitch_names[pitch_class] + ('m' if is_minor else '')
-    return camelot_map.get(key_name, "Ismeretlen")
+    estimate = estimate_key(y, sr)
+    return estimate["camelot"] if estimate is not None else "Ismeretlen"
 
 def analyze_bpm(y, sr):
-    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-    if isinstance(tempo, (list, np.ndarray)):
-        tempo = tempo[0]
-    return int(round(float(tempo)))
+    return estimate_tempo(tempo_onset_env(y, sr), sr)["bpm"]
 
 def analyze_track(file_path: str):
     try:
@@ -37,7 +24,7 @@ def analyze_track(file_path: str):
     except mutagen.id3.ID3NoHeaderError:
         title, artist, genre = "Ismeretlen", "Ismeretlen", "Ismeretlen"
 
-    y, sr = librosa.load(file_path)
+    y, sr = load_audio(file_path)
     bpm = analyze_bpm(y, sr)
     camelot_key = detect_key_camelot(y, sr)
 
@@ -55,6 +42,7 @@ def save_track(db: Session, track_data: dict) -> Track:
     db.add(track)
     db.commit()
     db.refresh(track)
+    recommend_index.upsert_track(track)
     return track
 
 def camelot_compatible(key1, key2):
@@ -64,42 +52,89 @@ def camelot_compatible(key1, key2):
     num2, letter2 = int(key2[:-1]), key2[-1]
     return (key1 == key2) or (letter1 == letter2 and abs(num1 - num2) in [1, 11])
 
-def recommend_ai(db: Session, input_track_id: int, strict: bool = False):
-    input_track = db.query(Track).filter(Track.id == input_track_id).first()
-    if not input_track:
-        return []
-
-    tracks = db.query(Track).all()
-    scored = []
-    for track in tracks:
-        if track.id == input_track.id:
-            continue
-
-        if strict and not camelot_compatible(track.camelot, input_track.camelot):
+def _recommendation_rows(db: Session, results: dict) -> dict:
+    # A találatok sorai egyetlen lekérdezéssel
+    ids = {track_id for best in results.values() for track_id, _ in best}
+    tracks = {track.id: track for track in db.query(Track).filter(Track.id.in_(ids))} if ids else {}
+    rows = {}
+    for seed_id, best in results.items():
+        rows[seed_id] = []
+        for track_id, score in best:
+            track = tracks.get(track_id)
+            if track is None:
+                continue
+            rows[seed_id].append({
+                "id": track.id,
+                "title": track.title,
+                "artist": track.artist,
+                "genre": track.genre,
+                "bpm": track.bpm,
+                "camelot": track.camelot,
+                "score": int(score) if score.is_integer() else round(score, 2)
+            })
+    return rows
+
+def recommend_ai(db: Session, input_track_id: int, strict: bool = False, k: int = 5):
+    # Pontozás a memóriában tartott, vektorizált indexen; csak a k találat sorát olvassuk be
+    best = recommend_index.recommend(db, input_track_id, strict=strict, k=k)
+    return _recommendation_rows(db, {input_track_id: best})[input_track_id]
+
+def recommend_batch(db: Session, input_track_ids: list[int], strict: bool = False, k: int = 5) -> dict:
+    """recommend_ai() for many seeds in one pass: {seed id: recommendation list}."""
+    results = recommend_index.recommend_many(db, input_track_ids, strict=strict, k=k)
+    return _recommendation_rows(db, results)
+
+def _similar_rows(db: Session, best: list[tuple[int, float]]) -> list[dict]:
+    ids = [track_id for track_id, _ in best]
+    tracks = {track.id: track for track in db.query(Track).filter(Track.id.in_(ids))} if ids else {}
+    return [
+        {
+            "id": track.id,
+            "title": track.title,
+            "artist": track.artist,
+            "genre": track.genre,
+            "bpm": track.bpm,
+            "camelot": track.camelot,
+            "distance": round(distance, 4)
+        }
+        for track_id, distance in best
+        if (track := tracks.get(track_id)) is not None
+    ]
+
+def similar_tracks(db: Session, track_id: int, k: int = 10, strict: bool = False,
+                   approximate: bool = False) -> list[dict] | None:
+    """Tracks that sound like `track_id` (nearest feature vectors), nearest
+    first; `strict` keeps only Camelot-compatible keys. None if the track
+    has no stored feature vector."""
+    best = similarity_index.similar_to_track(db, track_id, k=k, strict=strict, approximate=approximate)
+    return _similar_rows(db, best) if best is not None else None
+
+def similar_to_analysis(db: Session, result: dict, k: int = 10, strict: bool = False,
+                        approximate: bool = False) -> list[dict] | None:
+    """similar_tracks() for an analyze_music() result (e.g. an uploaded file)."""
+    best = similarity_index.similar_to_features(db, result, k=k, strict=strict, approximate=approximate)
+    return _similar_rows(db, best) if best is not None else None
+
+def build_playlist(db: Session, seed_id: int | None = None, track_ids: list[int] | None = None,
+                   length: int = 20, strict: bool = False) -> dict:
+    """Harmonic-mix ordering: `length` tracks (from `track_ids`, or the whole
+    library) starting at `seed_id`, chosen and ordered to maximize the sum
+    of recommend_ai() transition scores along the playlist."""
+    ids, gains = recommend_index.sequence(db, seed_id=seed_id, pool_ids=track_ids, length=length, strict=strict)
+    tracks = {track.id: track for track in db.query(Track).filter(Track.id.in_(ids))} if ids else {}
+    playlist = []
+    for track_id, gain in zip(ids, gains):
+        track = tracks.get(track_id)
+        if track is None:
             continue
-
-        score = 0
-        bpm_diff = abs(track.bpm - input_track.bpm)
-        score += max(0, 50 - bpm_diff * 5)
-
-        if not strict:
-            if camelot_compatible(track.camelot, input_track.camelot):
-                score += 30
-        else:
-            score += 30
-
-        if track.genre.lower() == input_track.genre.lower():
-            score += 20
-
-        scored.append({
+        playlist.append({
             "id": track.id,
             "title": track.title,
             "artist": track.artist,
             "genre": track.genre,
             "bpm": track.bpm,
             "camelot": track.camelot,
-            "score": score
+            "transition_score": int(gain) if gain.is_integer() else round(gain, 2)
         })
-
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    return scored[:5]
+    total = sum(gains)
+    return {"tracks": playlist, "total_score": int(total) if float(total).is_integer() else round(total, 2)}
@@ -1,21 +1,25 @@
 import os
 import mimetypes
-import requests
 
+from backend.services.http_client import http, RECCOBEATS_API_URL
 
-RECCOBEATS_URL = "https://api.reccobeats.com/v1/analysis/audio-features"
 
+RECCOBEATS_URL = f"{RECCOBEATS_API_URL}/analysis/audio-features"
 
-def analyze_with_reccobeats(file_path: str, api_key: str | None = None) -> dict | None:
+
+def analyze_with_reccobeats(file_path: str, api_key: str | None = None, data: bytes | None = None,
+                            filename: str | None = None) -> dict | None:
     """Call ReccoBeats audio-features API with an audio file.
 
+    With `data` the in-memory audio (e.g. an encoded snippet) is uploaded
+    under `filename` instead of reading `file_path`.
     Returns a dict with keys like danceability, energy, valence, tempo, loudness, etc.,
     or None on failure.
     """
-    if not os.path.isfile(file_path):
+    if data is None and not os.path.isfile(file_path):
         return None
 
-    filename = os.path.basename(file_path)
+    filename = filename or os.path.basename(file_path)
     mime = mimetypes.guess_type(filename)[0] or "application/octet-stream"
 
     headers = {
@@ -26,20 +30,23 @@ def analyze_with_reccobeats(file_path: str, api_key: str | None = None) -> dict
         headers["x-api-key"] = api_key
         headers["Authorization"] = f"Bearer {api_key}"
 
-    with open(file_path, "rb") as f:
+    f = open(file_path, "rb") if data is None else None
+    try:
         files = [
-            ("audioFile", (filename, f, mime))
+            ("audioFile", (filename, f if f is not None else data, mime))
         ]
-        try:
-            resp = requests.post(RECCOBEATS_URL, headers=headers, files=files, timeout=60)
-            if resp.status_code == 200:
-                return resp.json()
-            # Bubble minimal info for debugging
-            print("[ReccoBeats] error:", resp.status_code, resp.text[:300])
-            return None
-        except Exception as e:
-            print("[ReccoBeats] request failed:", str(e))
-            return None
+        resp = http.post(RECCOBEATS_URL, headers=headers, files=files, timeout=60)
+        if resp.status_code == 200:
+            return resp.json()
+        # Bubble minimal info for debugging
+        print("[ReccoBeats] error:", resp.status_code, resp.text[:300])
+        return None
+    except Exception as e:
+        print("[ReccoBeats] request failed:", str(e))
+        return None
+    finally:
+        if f is not None:
+            f.close()
 
 
 def get_features_by_ids(ids: list[str] | tuple[str, ...], api_key: str | None = None) -> dict | None:
@@ -49,14 +56,14 @@ def get_features_by_ids(ids: list[str] | tuple[str, ...], api_key: str | None =
     """
     if not ids:
         return None
-    url = "https://api.reccobeats.com/v1/audio-features"
+    url = f"{RECCOBEATS_API_URL}/audio-features"
     headers = {"Accept": "application/json"}
     if api_key:
         headers["x-api-key"] = api_key
         headers["Authorization"] = f"Bearer {api_key}"
     params = {"ids": ",".join(ids)}
     try:
-        resp = requests.get(url, headers=headers, params=params, timeout=30)
+        resp = http.get(url, headers=headers, params=params, timeout=30)
         if resp.status_code == 200:
             return resp.json()
         print("[ReccoBeats] GET features error:", resp.status_code, resp.text[:300])
@@ -0,0 +1,322 @@
+import os
+import time
+import threading
+import numpy as np
+from sqlalchemy import func
+
+from backend.models.music import Track, split_camelot
+
+
+# Camelot kód egész számként: (szám - 1) * 2 + (A=0, B=1), 0..23; ismeretlen = 24
+UNKNOWN_CAMELOT = 24
+UNKNOWN_GENRE = -1
+
+INDEX_REFRESH_SECONDS = float(os.getenv("RECOMMEND_INDEX_REFRESH_SECONDS", "30"))
+# Kötegelt ajánlásnál egyszerre pontozott mátrix mérete (seed x track cella)
+BATCH_CHUNK_CELLS = int(os.getenv("RECOMMEND_BATCH_CHUNK_CELLS", str(2_000_000)))
+PLAYLIST_BEAM_WIDTH = int(os.getenv("PLAYLIST_BEAM_WIDTH", "16"))
+
+
+def encode_camelot(key) -> int:
+    """'8A' -> 14, '12B' -> 23; anything unparseable ('Ismeretlen', 'Unknown', None) -> 24."""
+    num, letter = split_camelot(key)
+    if num is None:
+        return UNKNOWN_CAMELOT
+    return (num - 1) * 2 + (0 if letter == "A" else 1)
+
+
+def _build_compat_table() -> np.ndarray:
+    # Előre kiszámolt 25x25 kompatibilitási tábla (camelot_compatible szabályai szerint)
+    table = np.zeros((UNKNOWN_CAMELOT + 1, UNKNOWN_CAMELOT + 1), dtype=bool)
+    for a in range(UNKNOWN_CAMELOT):
+        for b in range(UNKNOWN_CAMELOT):
+            num_a, letter_a = a // 2 + 1, a % 2
+            num_b, letter_b = b // 2 + 1, b % 2
+            table[a, b] = a == b or (letter_a == letter_b and abs(num_a - num_b) in (1, 11))
+    return table
+
+
+CAMELOT_COMPAT = _build_compat_table()
+
+
+class RecommendationIndex:
+    """Column-wise, in-memory copy of the fields recommend_ai() scores on.
+
+    BPM, Camelot code and genre id live in NumPy arrays (row order = track
+    id order), so scoring a seed against the whole library is a handful of
+    vectorized operations and top-k selection uses argpartition instead of
+    a full sort. Rows are updated in place by upsert(); changes made by
+    other processes (new, deleted or updated rows) are picked up by a
+    cheap count / max(id) / max(updated_at) check at most every
+    INDEX_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._checked_at = 0.0
+        self._marker = None
+        self._genre_ids: dict[str, int] = {}
+        self._reset(0)
+
+    def _reset(self, capacity: int) -> None:
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.bpm = np.zeros(capacity, dtype=np.float64)
+        self.camelot = np.full(capacity, UNKNOWN_CAMELOT, dtype=np.int16)
+        self.genre = np.full(capacity, UNKNOWN_GENRE, dtype=np.int32)
+        self._pos: dict[int, int] = {}
+
+    def _genre_id(self, genre) -> int:
+        if genre is None:
+            return UNKNOWN_GENRE
+        key = str(genre).lower()
+        if key not in self._genre_ids:
+            self._genre_ids[key] = len(self._genre_ids)
+        return self._genre_ids[key]
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        for name, fill in (("ids", 0), ("bpm", 0.0), ("camelot", UNKNOWN_CAMELOT), ("genre", UNKNOWN_GENRE)):
+            old = getattr(self, name)
+            new = np.full(new_capacity, fill, dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+
+    # -------------------------------------------
+    # Betöltés és frissítés
+    # -------------------------------------------
+
+    @staticmethod
+    def _change_marker(db) -> tuple:
+        return tuple(db.query(func.count(Track.id), func.max(Track.id), func.max(Track.updated_at)).one())
+
+    def load(self, db) -> None:
+        """(Re)build the index from the tracks table, reading only four columns."""
+        with self._lock:
+            # A jelölő a sorok előtt: ami közben íródik, azt a következő ellenőrzés újratölti
+            marker = self._change_marker(db)
+            rows = db.query(Track.id, Track.bpm, Track.camelot, Track.genre).order_by(Track.id).all()
+            self._reset(len(rows))
+            self._genre_ids = {}
+            self._append(rows)
+            self._loaded = True
+            self._marker = marker
+            self._checked_at = time.time()
+
+    def _append(self, rows) -> None:
+        start = self.size
+        self._grow(start + len(rows))
+        for offset, (track_id, bpm, camelot, genre) in enumerate(rows):
+            row = start + offset
+            self.ids[row] = track_id
+            self.bpm[row] = bpm or 0
+            self.camelot[row] = encode_camelot(camelot)
+            self.genre[row] = self._genre_id(genre)
+            self._pos[int(track_id)] = row
+        self.size = start + len(rows)
+
+    def ensure_loaded(self, db) -> None:
+        with self._lock:
+            if not self._loaded:
+                self.load(db)
+                return
+            if time.time() - self._checked_at < INDEX_REFRESH_SECONDS:
+                return
+            self._checked_at = time.time()
+            if self._change_marker(db) != self._marker:
+                self.load(db)
+
+    def upsert(self, track_id: int, bpm, camelot, genre) -> None:
+        """Insert or update one row (called when a track is saved)."""
+        with self._lock:
+            if not self._loaded:
+                return  # az első kérés úgyis a teljes táblát tölti be
+            row = self._pos.get(int(track_id))
+            if row is None:
+                if self.size and track_id < self.ids[self.size - 1]:
+                    # Rendezettség megtartása: ritka eset, teljes újratöltés a következő kérésnél
+                    self._loaded = False
+                    return
+                self._append([(track_id, bpm, camelot, genre)])
+                return
+            self.bpm[row] = bpm or 0
+            self.camelot[row] = encode_camelot(camelot)
+            self.genre[row] = self._genre_id(genre)
+
+    def upsert_track(self, track: Track) -> None:
+        self.upsert(track.id, track.bpm, track.camelot, track.genre)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded = False
+
+    # -------------------------------------------
+    # Pontozás
+    # -------------------------------------------
+
+    def score_matrix(self, rows, strict: bool = False, cols=None) -> tuple[np.ndarray, np.ndarray]:
+        """Score every track (or only the rows in `cols`) against each seed
+        row in one broadcast pass.
+
+        Returns (scores, eligible mask), both shaped (len(rows), targets);
+        same rules as the original loop: up to 50 points for BPM distance,
+        30 for a compatible Camelot key (strict mode drops incompatible
+        tracks instead), 20 for same genre. A seed is never eligible for
+        itself.
+        """
+        seeds = np.asarray(rows, dtype=np.int64)
+        if cols is None:
+            targets = np.arange(self.size)
+            bpm, camelot, genre = self.bpm[:self.size], self.camelot[:self.size], self.genre[:self.size]
+        else:
+            targets = np.asarray(cols, dtype=np.int64)
+            bpm, camelot, genre = self.bpm[targets], self.camelot[targets], self.genre[targets]
+
+        compat = CAMELOT_COMPAT[self.camelot[seeds][:, None], camelot[None, :]]
+        score = np.abs(bpm[None, :] - self.bpm[seeds][:, None])
+        score *= -5.0
+        score += 50.0
+        np.maximum(score, 0.0, out=score)
+        if strict:
+            eligible = compat
+            score += 30.0
+        else:
+            eligible = np.ones((len(seeds), len(targets)), dtype=bool)
+            score += 30.0 * compat
+        seed_genre = self.genre[seeds][:, None]
+        score += 20.0 * ((genre[None, :] == seed_genre) & (seed_genre != UNKNOWN_GENRE))
+        eligible &= targets[None, :] != seeds[:, None]
+        return score, eligible
+
+    def scores(self, row: int, strict: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """score_matrix() for a single seed row."""
+        score, eligible = self.score_matrix([row], strict)
+        return score[0], eligible[0]
+
+    @staticmethod
+    def top_k(score: np.ndarray, eligible: np.ndarray, k: int) -> np.ndarray:
+        """Rows of the k best scores, best first; ties keep row (id) order,
+        exactly like a stable sort of the full list would."""
+        rows = np.flatnonzero(eligible)
+        if len(rows) == 0 or k <= 0:
+            return rows[:0]
+        sc = score[rows]
+        if len(rows) > k:
+            threshold = -np.partition(-sc, k - 1)[k - 1]
+            above = rows[sc > threshold]
+            tied = rows[sc == threshold][:k - len(above)]
+            rows = np.concatenate([above, tied])
+            sc = score[rows]
+        return rows[np.lexsort((rows, -sc))]
+
+    def recommend(self, db, track_id: int, strict: bool = False, k: int = 5) -> list[tuple[int, float]]:
+        """[(track_id, score), ...] of the k best matches for `track_id`."""
+        self.ensure_loaded(db)
+        with self._lock:
+            row = self._pos.get(int(track_id))
+            if row is None:
+                return []
+            score, eligible = self.scores(row, strict)
+            best = self.top_k(score, eligible, k)
+            return [(int(self.ids[r]), float(score[r])) for r in best]
+
+    def recommend_many(self, db, track_ids, strict: bool = False,
+                       k: int = 5) -> dict[int, list[tuple[int, float]]]:
+        """recommend() for many seeds at once; unknown ids map to [].
+
+        Seeds are scored in chunks of at most BATCH_CHUNK_CELLS matrix
+        cells, so memory stays bounded for large libraries.
+        """
+        self.ensure_loaded(db)
+        results: dict[int, list[tuple[int, float]]] = {}
+        with self._lock:
+            known = []
+            for track_id in track_ids:
+                row = self._pos.get(int(track_id))
+                if row is None:
+                    results[int(track_id)] = []
+                else:
+                    known.append((int(track_id), row))
+            chunk = max(1, BATCH_CHUNK_CELLS // max(1, self.size))
+            for start in range(0, len(known), chunk):
+                part = known[start:start + chunk]
+                score, eligible = self.score_matrix([row for _, row in part], strict)
+                for i, (track_id, _row) in enumerate(part):
+                    best = self.top_k(score[i], eligible[i], k)
+                    results[track_id] = [(int(self.ids[r]), float(score[i, r])) for r in best]
+        return results
+
+    # -------------------------------------------
+    # Lejátszási lista sorrend (beam search)
+    # -------------------------------------------
+
+    def sequence(self, db, seed_id: int | None = None, pool_ids=None, length: int = 20,
+                 strict: bool = False, beam_width: int = PLAYLIST_BEAM_WIDTH) -> tuple[list[int], list[float]]:
+        """Order tracks so the sum of transition scores along the path is maximal.
+
+        Beam search: every step extends each of the `beam_width` best partial
+        paths with its `beam_width` best unused next tracks (one score_matrix
+        pass per chunk of paths) and keeps the best `beam_width` of those.
+        Candidates are the tracks in `pool_ids` (default: the whole library).
+        Without a seed every pool track is tried as a start. Returns
+        (track ids, transition scores); the first track's score is 0. The
+        path ends early when no eligible next track is left (e.g. strict
+        mode with no compatible key).
+        """
+        self.ensure_loaded(db)
+        with self._lock:
+            if pool_ids is None:
+                pool = np.arange(self.size)
+            else:
+                pool = np.unique([self._pos[int(i)] for i in pool_ids if int(i) in self._pos])
+
+            if seed_id is not None:
+                seed_row = self._pos.get(int(seed_id))
+                if seed_row is None:
+                    return [], []
+                # Útvonal: a pool-beli indexek sorozata; a seed a pool-ba kerül, ha nincs benne
+                pool = np.union1d(pool, [seed_row])
+                paths = np.searchsorted(pool, [[seed_row]])
+            else:
+                paths = np.arange(len(pool))[:, None]
+            if len(pool) == 0 or length <= 0:
+                return [], []
+
+            totals = np.zeros(len(paths))
+            steps = np.zeros((len(paths), 1))
+            beam_width = max(1, beam_width)
+            for _ in range(min(length, len(pool)) - 1):
+                states, picks, gains = [], [], []
+                chunk = max(1, BATCH_CHUNK_CELLS // len(pool))
+                for start in range(0, len(paths), chunk):
+                    part = np.arange(start, min(start + chunk, len(paths)))
+                    score, eligible = self.score_matrix(pool[paths[part, -1]], strict, cols=pool)
+                    eligible[np.arange(len(part))[:, None], paths[part]] = False  # már a listán
+                    score[~eligible] = -np.inf
+                    kk = min(beam_width, len(pool))
+                    best = np.argpartition(-score, kk - 1, axis=1)[:, :kk]
+                    gain = np.take_along_axis(score, best, axis=1)
+                    ok = np.isfinite(gain)
+                    states.append(np.broadcast_to(part[:, None], best.shape)[ok])
+                    picks.append(best[ok])
+                    gains.append(gain[ok])
+
+                states, picks, gains = np.concatenate(states), np.concatenate(picks), np.concatenate(gains)
+                if len(states) == 0:
+                    break
+                candidate_totals = totals[states] + gains
+                keep = np.argsort(-candidate_totals, kind="stable")[:beam_width]
+                paths = np.hstack([paths[states[keep]], picks[keep][:, None]])
+                steps = np.hstack([steps[states[keep]], gains[keep][:, None]])
+                totals = candidate_totals[keep]
+
+            best_path = int(np.argmax(totals))
+            return ([int(self.ids[pool[i]]) for i in paths[best_path]],
+                    [float(g) for g in steps[best_path]])
+
+
+recommend_index = RecommendationIndex()
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # "memory" vagy "sqlite"
+RESPONSE_CACHE_PATH = os.getenv(
+    "RESPONSE_CACHE_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "response_cache.db")),
+)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+# Végpontonkénti élettartam (másodperc)
+RESPONSE_CACHE_TTLS = {
+    "genius_search": int(os.getenv("RESPONSE_CACHE_TTL_GENIUS_SEARCH", str(24 * 3600))),
+    "youtube": int(os.getenv("RESPONSE_CACHE_TTL_YOUTUBE", str(7 * 24 * 3600))),
+    "spotify": int(os.getenv("RESPONSE_CACHE_TTL_SPOTIFY", str(24 * 3600))),
+    "genius_top": int(os.getenv("RESPONSE_CACHE_TTL_GENIUS_TOP", "900")),
+}
+# "Nincs találat" válaszok rövidebb ideig élnek
+RESPONSE_CACHE_NEGATIVE_TTL = int(os.getenv("RESPONSE_CACHE_NEGATIVE_TTL", "300"))
+CACHEABLE_STATUSES = (200, 404)
+
+
+def normalize_query(value) -> str:
+    """Case- and whitespace-insensitive form of a search string."""
+    return " ".join(str(value).lower().split())
+
+
+def cache_key(namespace: str, params: dict) -> str:
+    normalized = {key: normalize_query(value) for key, value in params.items() if value is not None}
+    return namespace + ":" + json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+
+# -------------------------------------------
+# Tárolók
+# -------------------------------------------
+
+class MemoryBackend:
+    """In-process LRU dict: key -> (expires_at, value)."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value, ttl: int) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteBackend:
+    """On-disk backend (survives restarts, shared between worker processes)."""
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_response_cache_expires_at ON response_cache (expires_at)"
+            )
+            conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str):
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT value FROM response_cache WHERE key = ? AND expires_at >= ?",
+                    (key, time.time()),
+                ).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            print("[ResponseCache] read failed:", str(e))
+            return None
+
+    def set(self, key: str, value, ttl: int) -> None:
+        try:
+            with closing(self._connect()) as conn:
+                now = time.time()
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now + ttl),
+                )
+                conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,))
+                # Túl sok bejegyzés: a leghamarabb lejárók törlése
+                conn.execute(
+                    "DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache"
+                    " ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                conn.commit()
+        except Exception as e:
+            print("[ResponseCache] write failed:", str(e))
+
+    def __len__(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+# -------------------------------------------
+# Cache összevonással (singleflight)
+# -------------------------------------------
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Exception | None = None
+
+
+class ResponseCache:
+    """Caches (payload, status) of upstream lookups per namespace.
+
+    Identical concurrent misses are coalesced: the first caller runs
+    `fetch()`, the others wait for its result instead of calling the
+    upstream API again. Only 200 and 404 responses are stored (404 with
+    the shorter negative TTL); errors are never cached.
+    """
+
+    def __init__(self, backend=None, ttls: dict | None = None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttls = ttls or RESPONSE_CACHE_TTLS
+        self._flights: dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._metrics: dict[str, dict[str, int]] = {}
+
+    def _count(self, namespace: str, name: str) -> None:
+        with self._lock:
+            counters = self._metrics.setdefault(
+                namespace, {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0})
+            counters[name] += 1
+
+    def get_or_fetch(self, namespace: str, params: dict, fetch) -> tuple[object, int]:
+        """Cached (payload, status) for `params`, or the result of `fetch()`."""
+        key = cache_key(namespace, params)
+        cached = self.backend.get(key)
+        if cached is not None:
+            self._count(namespace, "hits")
+            return cached[0], cached[1]
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self._count(namespace, "coalesced")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            # Egy korábbi vezető közben végezhetett: újraellenőrzés, mielőtt a külső API-t hívjuk
+            cached = self.backend.get(key)
+            if cached is not None:
+                self._count(namespace, "hits")
+                flight.value = (cached[0], cached[1])
+                return flight.value
+            self._count(namespace, "misses")
+            payload, status = fetch()
+            flight.value = (payload, status)
+            if status in CACHEABLE_STATUSES:
+                ttl = self.ttls.get(namespace, 300)
+                if status != 200:
+                    ttl = min(ttl, RESPONSE_CACHE_NEGATIVE_TTL)
+                self.backend.set(key, [payload, status], ttl)
+            return payload, status
+        except Exception as e:
+            self._count(namespace, "errors")
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces = {}
+            for namespace, counters in self._metrics.items():
+                lookups = counters["hits"] + counters["misses"] + counters["coalesced"]
+                namespaces[namespace] = {
+                    **counters,
+                    "hit_rate": round((counters["hits"] + counters["coalesced"]) / lookups, 4) if lookups else None,
+                }
+        return {"backend": type(self.backend).__name__, "entries": len(self.backend), "namespaces": namespaces}
+
+
+def create_backend(name: str = RESPONSE_CACHE_BACKEND):
+    if name == "sqlite":
+        return SqliteBackend()
+    return MemoryBackend()
+
+
+response_cache = ResponseCache(create_backend())
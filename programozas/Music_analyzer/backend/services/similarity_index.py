@@ -0,0 +1,326 @@
+import os
+import time
+import threading
+import numpy as np
+from sqlalchemy import func, select, update
+
+from backend.models.music import Track
+from backend.services.recommend_index import CAMELOT_COMPAT, UNKNOWN_CAMELOT, encode_camelot
+
+
+# Hangzásleíró vektor: (kulcs, skála, log). Érték / skála (ferde eloszlásnál log1p),
+# így minden dimenzió nagyjából 0..1 körüli; hiányzó érték = NaN
+LOCAL_VECTOR_FEATURES = (
+    ("spectral_centroid_mean", 4000.0, False),
+    ("spectral_centroid_std", 2000.0, False),
+    ("spectral_rolloff_85", 8000.0, False),
+    ("zcr_mean", 0.2, False),
+    ("onset_rate", 6.0, True),
+    ("harmonic_percussive_ratio", 1.0, True),
+    ("chroma_var", 0.1, False),
+)
+# ReccoBeats jellemzők (csak ha volt dúsítás)
+RECCOBEATS_VECTOR_FEATURES = (
+    ("energy", 1.0, False),
+    ("valence", 1.0, False),
+    ("danceability", 1.0, False),
+)
+VECTOR_FEATURES = LOCAL_VECTOR_FEATURES + RECCOBEATS_VECTOR_FEATURES
+VECTOR_DIM = len(VECTOR_FEATURES)
+
+INDEX_REFRESH_SECONDS = float(os.getenv("SIMILARITY_INDEX_REFRESH_SECONDS", "30"))
+# Közelítő (IVF) keresés: ennyi sor alatt mindig pontos keresés fut
+IVF_MIN_ROWS = int(os.getenv("SIMILARITY_IVF_MIN_ROWS", "20000"))
+IVF_NPROBE = int(os.getenv("SIMILARITY_IVF_NPROBE", "8"))
+IVF_TRAIN_ITERATIONS = int(os.getenv("SIMILARITY_IVF_TRAIN_ITERATIONS", "10"))
+# A listák újraépítése, ha az építés óta módosult sorok aránya ezt meghaladja
+IVF_REBUILD_SHARE = float(os.getenv("SIMILARITY_IVF_REBUILD_SHARE", "0.1"))
+# Egyszerre számolt távolságmátrix mérete (sor x középpont cella)
+ASSIGN_CHUNK_CELLS = 2_000_000
+
+
+def feature_vector(values: dict) -> np.ndarray | None:
+    """Scaled float32 descriptor of an analysis result (or its `features`
+    JSON); missing values are NaN. None if no local feature is present."""
+    vector = np.full(VECTOR_DIM, np.nan, dtype=np.float32)
+    for i, (key, scale, log) in enumerate(VECTOR_FEATURES):
+        value = values.get(key)
+        if isinstance(value, (int, float)) and np.isfinite(value):
+            value = value / scale
+            vector[i] = np.log1p(max(value, 0.0)) if log else value
+    if np.isnan(vector[:len(LOCAL_VECTOR_FEATURES)]).all():
+        return None
+    return vector
+
+
+def vector_bytes(values: dict) -> bytes | None:
+    """feature_vector() as the raw bytes stored in tracks.feature_vector."""
+    vector = feature_vector(values)
+    return vector.tobytes() if vector is not None else None
+
+
+def decode_vectors(blobs) -> dict[str, np.ndarray]:
+    """Stored feature_vector blobs -> {feature key: float64 values} (the
+    inverse of feature_vector(); missing values stay NaN)."""
+    blobs = list(blobs)
+    vectors = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), VECTOR_DIM)
+    out = {}
+    for i, (key, scale, log) in enumerate(VECTOR_FEATURES):
+        column = vectors[:, i].astype(np.float64)
+        out[key] = (np.expm1(column) if log else column) * scale
+    return out
+
+
+def backfill_vectors(conn) -> int:
+    """Fill tracks.feature_vector from the stored `features` JSON of rows
+    analyzed before the column existed."""
+    rows = conn.execute(
+        select(Track.id, Track.features).where(Track.feature_vector.is_(None), Track.features.isnot(None))
+    ).all()
+    filled = 0
+    for track_id, features in rows:
+        blob = vector_bytes(features or {})
+        if blob is not None:
+            conn.execute(update(Track).where(Track.id == track_id).values(feature_vector=blob))
+            filled += 1
+    return filled
+
+
+class SimilarityIndex:
+    """In-memory k-NN index over tracks.feature_vector ("sounds like" search).
+
+    Vectors are standardized per dimension with the library's mean / std
+    (missing values become the mean, so they do not affect distances) and
+    kept in one contiguous float32 matrix. Exact search is a single BLAS
+    matrix-vector product, ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, plus an
+    argpartition top-k. Approximate search probes the IVF_NPROBE nearest
+    k-means cells (IVF) and scores only their rows. Same refresh rules as
+    RecommendationIndex.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._checked_at = 0.0
+        self._marker = None
+        self._reset(0)
+
+    def _reset(self, capacity: int) -> None:
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.camelot = np.full(capacity, UNKNOWN_CAMELOT, dtype=np.int16)
+        self.raw = np.full((capacity, VECTOR_DIM), np.nan, dtype=np.float32)
+        self.vectors = np.zeros((capacity, VECTOR_DIM), dtype=np.float32)
+        self.norms = np.zeros(capacity, dtype=np.float32)
+        self.mean = np.zeros(VECTOR_DIM, dtype=np.float32)
+        self.scale = np.ones(VECTOR_DIM, dtype=np.float32)
+        self._pos: dict[int, int] = {}
+        self._ivf = None
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        for name, fill in (("ids", 0), ("camelot", UNKNOWN_CAMELOT), ("raw", np.nan),
+                           ("vectors", 0.0), ("norms", 0.0)):
+            old = getattr(self, name)
+            new = np.full((new_capacity,) + old.shape[1:], fill, dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+
+    def _standardize(self, raw: np.ndarray) -> np.ndarray:
+        z = (raw - self.mean) / self.scale
+        return np.nan_to_num(z, nan=0.0).astype(np.float32, copy=False)
+
+    def _fit_scaling(self) -> None:
+        raw = self.raw[:self.size]
+        present = ~np.isnan(raw)
+        count = np.maximum(present.sum(axis=0), 1)
+        filled = np.where(present, raw, 0.0)
+        self.mean = (filled.sum(axis=0) / count).astype(np.float32)
+        var = (np.where(present, raw - self.mean, 0.0) ** 2).sum(axis=0) / count
+        scale = np.sqrt(var).astype(np.float32)
+        scale[scale < 1e-6] = 1.0
+        self.scale = scale
+        self.vectors[:self.size] = self._standardize(raw)
+        self.norms[:self.size] = np.einsum("ij,ij->i", self.vectors[:self.size], self.vectors[:self.size])
+
+    # -------------------------------------------
+    # Betöltés és frissítés
+    # -------------------------------------------
+
+    @staticmethod
+    def _change_marker(db) -> tuple:
+        # Csak a jó méretű vektorok számítanak (a régi formátumúakat load() kihagyja),
+        # különben a darabszám sosem egyezne és minden ellenőrzés újratöltene
+        return tuple(db.query(func.count(Track.id), func.max(Track.id), func.max(Track.updated_at))
+                     .filter(func.length(Track.feature_vector) == VECTOR_DIM * 4).one())
+
+    def load(self, db) -> None:
+        """(Re)build the index from the tracks that have a feature vector."""
+        with self._lock:
+            marker = self._change_marker(db)
+            rows = (db.query(Track.id, Track.camelot, Track.feature_vector)
+                    .filter(func.length(Track.feature_vector) == VECTOR_DIM * 4).order_by(Track.id).all())
+            self._reset(len(rows))
+            self._append(rows)
+            self._fit_scaling()
+            self._loaded = True
+            self._marker = marker
+            self._checked_at = time.time()
+
+    def _append(self, rows) -> None:
+        self._grow(self.size + len(rows))
+        for track_id, camelot, blob in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            if len(vector) != VECTOR_DIM:
+                continue  # régi vektor formátum: a következő elemzés felülírja
+            row = self.size
+            self.ids[row] = track_id
+            self.camelot[row] = encode_camelot(camelot)
+            self.raw[row] = vector
+            self._pos[int(track_id)] = row
+            self.size += 1
+
+    def ensure_loaded(self, db) -> None:
+        with self._lock:
+            if not self._loaded:
+                self.load(db)
+                return
+            if time.time() - self._checked_at < INDEX_REFRESH_SECONDS:
+                return
+            self._checked_at = time.time()
+            if self._change_marker(db) != self._marker:
+                self.load(db)
+
+    def upsert(self, track_id: int, camelot, blob: bytes | None) -> None:
+        """Insert or update one row with the current scaling (called when a track is saved)."""
+        if blob is None:
+            return
+        with self._lock:
+            if not self._loaded:
+                return
+            row = self._pos.get(int(track_id))
+            if row is None:
+                if self.size and track_id < self.ids[self.size - 1]:
+                    self._loaded = False
+                    return
+                self._append([(track_id, camelot, blob)])
+                row = self._pos.get(int(track_id))
+                if row is None:
+                    return
+            else:
+                self.camelot[row] = encode_camelot(camelot)
+                self.raw[row] = np.frombuffer(blob, dtype=np.float32)
+            self.vectors[row] = self._standardize(self.raw[row])
+            self.norms[row] = float(self.vectors[row] @ self.vectors[row])
+            if self._ivf is not None:
+                self._ivf["dirty"].add(row)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded = False
+
+    # -------------------------------------------
+    # Közelítő keresés (IVF)
+    # -------------------------------------------
+
+    def _nearest_centroids(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        c_norms = np.einsum("ij,ij->i", centroids, centroids)
+        out = np.empty(len(vectors), dtype=np.int32)
+        chunk = max(1, ASSIGN_CHUNK_CELLS // len(centroids))
+        for start in range(0, len(vectors), chunk):
+            part = vectors[start:start + chunk]
+            out[start:start + chunk] = np.argmin(c_norms[None, :] - 2.0 * (part @ centroids.T), axis=1)
+        return out
+
+    def _build_ivf(self) -> None:
+        """k-means (sqrt(n) cells) on a sample, then every row is assigned to
+        its nearest cell; rows are grouped by cell for contiguous probing."""
+        vectors = self.vectors[:self.size]
+        nlist = int(np.clip(np.sqrt(self.size), 1, 4096))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(self.size, size=min(self.size, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            assign = self._nearest_centroids(sample, centroids)
+            counts = np.bincount(assign, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        assign = self._nearest_centroids(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self._ivf = {"centroids": centroids, "order": order, "offsets": offsets,
+                     "built_size": self.size, "dirty": set()}
+
+    def _ivf_candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        ivf = self._ivf
+        if ivf is None or len(ivf["dirty"]) > IVF_REBUILD_SHARE * self.size:
+            self._build_ivf()
+            ivf = self._ivf
+        centroids, order, offsets = ivf["centroids"], ivf["order"], ivf["offsets"]
+        dist = np.einsum("ij,ij->i", centroids, centroids) - 2.0 * (centroids @ query)
+        probes = np.argsort(dist)[:max(1, nprobe)]
+        parts = [order[offsets[c]:offsets[c + 1]] for c in probes]
+        # Építés után hozzáadott / módosított sorokat mindig megnézzük
+        parts.append(np.fromiter(ivf["dirty"], dtype=np.int64, count=len(ivf["dirty"])))
+        return np.unique(np.concatenate(parts))
+
+    # -------------------------------------------
+    # Keresés
+    # -------------------------------------------
+
+    def _search(self, query: np.ndarray, k: int, camelot: int | None, exclude_row: int | None,
+                approximate: bool, nprobe: int) -> list[tuple[int, float]]:
+        if self.size == 0 or k <= 0:
+            return []
+        if approximate and self.size >= IVF_MIN_ROWS:
+            rows = self._ivf_candidates(query, nprobe)
+            dist = self.norms[rows] - 2.0 * (self.vectors[rows] @ query)
+        else:
+            rows = np.arange(self.size)
+            dist = self.norms[:self.size] - 2.0 * (self.vectors[:self.size] @ query)
+
+        eligible = np.ones(len(rows), dtype=bool)
+        if camelot is not None:
+            eligible &= CAMELOT_COMPAT[camelot, self.camelot[rows]]
+        if exclude_row is not None:
+            eligible &= rows != exclude_row
+        candidates = np.flatnonzero(eligible)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(dist[candidates], k - 1)[:k]]
+        candidates = candidates[np.lexsort((rows[candidates], dist[candidates]))]
+        q_norm = float(query @ query)
+        return [(int(self.ids[rows[i]]), float(np.sqrt(max(dist[i] + q_norm, 0.0)))) for i in candidates]
+
+    def similar_to_track(self, db, track_id: int, k: int = 10, strict: bool = False,
+                         approximate: bool = False, nprobe: int = IVF_NPROBE) -> list[tuple[int, float]] | None:
+        """[(track_id, distance), ...] of the k nearest tracks, nearest first;
+        None if the track has no feature vector. `strict` keeps only tracks
+        whose Camelot key is compatible with the seed's."""
+        self.ensure_loaded(db)
+        with self._lock:
+            row = self._pos.get(int(track_id))
+            if row is None:
+                return None
+            camelot = int(self.camelot[row]) if strict else None
+            return self._search(self.vectors[row].copy(), k, camelot, row, approximate, nprobe)
+
+    def similar_to_features(self, db, values: dict, k: int = 10, strict: bool = False,
+                            approximate: bool = False, nprobe: int = IVF_NPROBE) -> list[tuple[int, float]] | None:
+        """similar_to_track() for an analysis result that is not (or not yet)
+        in the library; None if the result has no usable features."""
+        vector = feature_vector(values)
+        if vector is None:
+            return None
+        self.ensure_loaded(db)
+        with self._lock:
+            camelot = encode_camelot(values.get("camelot")) if strict else None
+            return self._search(self._standardize(vector), k, camelot, None, approximate, nprobe)
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,62 @@
+import io
+import os
+import numpy as np
+import soundfile as sf
+
+from backend.services.analysis_profile import load_audio
+
+
+SNIPPET_SECONDS = 30.0
+# Tömörített formátum a feltöltéshez (MP3 / OGG); ha a libsndfile nem tudja, WAV-ra esünk vissza
+SNIPPET_FORMAT = os.getenv("SNIPPET_FORMAT", "MP3").upper()
+
+# formátum -> (libsndfile subtype, kiterjesztés, MIME)
+SNIPPET_ENCODINGS = {
+    "MP3": ("MPEG_LAYER_III", ".mp3", "audio/mpeg"),
+    "OGG": ("VORBIS", ".ogg", "audio/ogg"),
+    "WAV": ("PCM_16", ".wav", "audio/wav"),
+}
+
+
+def loudest_window(rms_frames: np.ndarray, sr: int, hop_length: int,
+                   seconds: float = SNIPPET_SECONDS) -> float:
+    """Start time (s) of the `seconds` long window with the most energy,
+    from frame RMS values (sliding sum of RMS^2 via a cumulative sum)."""
+    energy = np.square(np.ravel(rms_frames), dtype=np.float64)
+    win = int(round(seconds * sr / hop_length))
+    if win <= 0 or len(energy) <= win:
+        return 0.0
+    csum = np.concatenate([[0.0], np.cumsum(energy)])
+    start_frame = int(np.argmax(csum[win:] - csum[:-win]))
+    return start_frame * hop_length / sr
+
+
+def encode_snippet(y: np.ndarray, sr: int, fmt: str = SNIPPET_FORMAT) -> tuple[bytes, str, str]:
+    """Encode mono audio into an in-memory buffer: (bytes, extension, MIME)."""
+    order = [fmt] + [name for name in SNIPPET_ENCODINGS if name != fmt]
+    for name in order:
+        subtype, ext, mime = SNIPPET_ENCODINGS[name]
+        buf = io.BytesIO()
+        try:
+            sf.write(buf, y, sr, format=name, subtype=subtype)
+        except Exception as e:
+            print(f"[Snippet] {name} encode failed:", str(e))
+            continue
+        return buf.getvalue(), ext, mime
+    raise RuntimeError("No snippet encoding available")
+
+
+def make_snippet(file_path: str, y: np.ndarray | None, sr: int, rms_frames: np.ndarray | None,
+                 hop_length: int, seconds: float = SNIPPET_SECONDS) -> tuple[bytes, str, str]:
+    """Compressed in-memory snippet of the loudest `seconds` of the track.
+
+    With `y` the window is cut from the decoded signal; without it
+    (streaming mode) only the window is decoded from the file.
+    """
+    start = loudest_window(rms_frames, sr, hop_length, seconds) if rms_frames is not None else 0.0
+    if y is not None:
+        begin = int(start * sr)
+        y_snip = y[begin:begin + int(seconds * sr)]
+    else:
+        y_snip, sr = load_audio(file_path, offset=start, duration=seconds)
+    return encode_snippet(y_snip, sr)
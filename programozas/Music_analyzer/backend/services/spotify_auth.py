@@ -1,9 +1,8 @@
 import os
-import base64
-import requests
 from urllib.parse import urlencode
 from flask import Blueprint, redirect, request, jsonify
 from dotenv import load_dotenv
+from backend.services.http_client import http, spotify_basic_auth, SPOTIFY_ACCOUNTS_URL
 
 spotify_auth = Blueprint("spotify_auth", __name__)
 
@@ -25,7 +24,7 @@ def login():
         "redirect_uri": REDIRECT_URI,
         "show_dialog": "true"
     }
-    url = "https://accounts.spotify.com/authorize?" + urlencode(params)
+    url = f"{SPOTIFY_ACCOUNTS_URL}/authorize?" + urlencode(params)
     return redirect(url)
 
 # 2️⃣ Callback, amikor a user visszatér
@@ -35,12 +34,9 @@ def callback():
     if not code:
         return jsonify({"error": "Missing authorization code"}), 400
 
-    auth_str = f"{CLIENT_ID}:{CLIENT_SECRET}"
-    b64_auth = base64.b64encode(auth_str.encode()).decode()
-
-    token_url = "https://accounts.spotify.com/api/token"
+    token_url = f"{SPOTIFY_ACCOUNTS_URL}/api/token"
     headers = {
-        "Authorization": f"Basic {b64_auth}",
+        "Authorization": f"Basic {spotify_basic_auth()}",
         "Content-Type": "application/x-www-form-urlencoded"
     }
     data = {
@@ -49,7 +45,7 @@ def callback():
         "redirect_uri": REDIRECT_URI
     }
 
-    response = requests.post(token_url, headers=headers, data=data)
+    response = http.post(token_url, headers=headers, data=data)
     if response.status_code != 200:
         return jsonify({"error": "Failed to get token", "details": response.text}), 400
 
@@ -0,0 +1,315 @@
+import os
+import time
+import numpy as np
+import librosa
+import soundfile as sf
+import soxr
+
+from backend.services.analysis_profile import get_profile
+from backend.services.feature_graph import FeatureGraph
+from backend.services.key_detection import ChromaBlocks, KEY_BLOCK_SECONDS, detect_key_blocks
+from backend.services.tempo import (
+    TEMPO_SEGMENT_SECONDS, TempoSegments, tempo_from_segments, tempogram_win, window_weights,
+)
+from backend.services.music_analyze import (
+    analysis_deadline, build_result, collect_enrichment, needs_snippet, read_metadata, start_enrichment,
+)
+
+
+# Egy blokk hossza másodpercben; a csúcsmemória ezzel arányos, nem a teljes hosszal
+STREAM_BLOCK_SECONDS = float(os.getenv("STREAM_BLOCK_SECONDS", "30"))
+
+
+class StreamAccumulator:
+    """Running sums of the frame-level features, updated one block at a time.
+
+    Apart from the 1-D onset envelope and frame RMS (one float32 each per
+    frame, ~1.3 MB per hour at 48 kHz), 12-bin chroma sums per key block
+    and one tempogram column per tempo segment, only fixed-size scalar
+    sums are kept, so peak memory is set by the block size, not by the
+    track length.
+    """
+
+    def __init__(self, sr: int, n_fft: int = 2048, hop_length: int = 512):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.timings: dict[str, float] = {}
+
+        self.frames = 0
+        self.rms_sum = 0.0
+        self.centroid_sum = 0.0
+        self.centroid_sq_sum = 0.0
+        self.rolloff_sum = 0.0
+        self.zcr_sum = 0.0
+        self.harmonic_abs_sum = 0.0
+        self.percussive_abs_sum = 0.0
+        self.samples = 0
+
+        self.chroma_frames = 0
+        self.chroma_sum = np.zeros(12)
+        self.chroma_sq_sum = np.zeros(12)
+        self.key_blocks = ChromaBlocks(max(1, int(round(KEY_BLOCK_SECONDS * sr / hop_length))))
+        # Hangolás: az első blokk harmonikus részéből, utána minden blokk CQT-je ezzel készül
+        self._tuning = None
+
+        self.tempogram_win = tempogram_win(sr, hop_length)
+        self.tempo_segments = TempoSegments(
+            self.tempogram_win, max(1, int(round(TEMPO_SEGMENT_SECONDS * sr / hop_length))))
+
+        # Az onset burkoló különbségképzéséhez az előző blokk utolsó mel kerete
+        self._prev_mel_frame = None
+        self._mel_max = -np.inf
+        self._env_tail = np.zeros(0)
+        self._tempo_started = False
+        self._onset_env_parts: list[np.ndarray] = []
+        self._rms_parts: list[np.ndarray] = []
+
+    def _timed(self, name: str, fn):
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - start)
+
+    def update(self, y_block: np.ndarray) -> None:
+        sr, n_fft, hop = self.sr, self.n_fft, self.hop_length
+
+        # A stream blokkjai keretre pontosan átfednek, így center=False mellett
+        # a keretek folytonosak a blokkhatárokon is
+        S = self._timed("stft", lambda: np.abs(librosa.stft(y_block, n_fft=n_fft, hop_length=hop, center=False)))
+        power = S ** 2
+        n_frames = S.shape[1]
+        if n_frames == 0:
+            return
+
+        rms = self._timed("rms", lambda: librosa.feature.rms(y=y_block, frame_length=n_fft, hop_length=hop, center=False))
+        self.rms_sum += float(rms.sum())
+        # Keretenkénti RMS (float32): a ReccoBeats részlet a leghangosabb ablakból készül
+        self._rms_parts.append(rms[0].astype(np.float32))
+
+        sc = self._timed("spectral_centroid", lambda: librosa.feature.spectral_centroid(S=S, sr=sr))[0]
+        self.centroid_sum += float(sc.sum())
+        self.centroid_sq_sum += float(np.square(sc, dtype=np.float64).sum())
+
+        roll = self._timed("spectral_rolloff", lambda: librosa.feature.spectral_rolloff(S=S, sr=sr, roll_percent=0.85))
+        self.rolloff_sum += float(roll.sum())
+
+        zcr = self._timed("zcr", lambda: librosa.feature.zero_crossing_rate(y_block, frame_length=n_fft, hop_length=hop, center=False))
+        self.zcr_sum += float(zcr.sum())
+        self.frames += n_frames
+
+        self._update_onsets(power)
+        y_harmonic = self._update_hpss(y_block)
+        self._update_chroma(y_harmonic, n_frames)
+
+    def _update_onsets(self, power: np.ndarray) -> None:
+        mel_db = self._timed("mel_db", lambda: librosa.power_to_db(
+            librosa.feature.melspectrogram(S=power, sr=self.sr), top_db=None))
+        # power_to_db top_db=80 vágása a globális maximumhoz képest; a teljes
+        # jel maximumát nem ismerjük, ezért az eddigi maximumot használjuk
+        self._mel_max = max(self._mel_max, float(mel_db.max()))
+        mel_db = np.maximum(mel_db, self._mel_max - 80.0)
+        if self._prev_mel_frame is not None:
+            mel_db = np.concatenate([self._prev_mel_frame, mel_db], axis=1)
+        self._prev_mel_frame = mel_db[:, -1:]
+        if mel_db.shape[1] < 2:
+            return
+
+        # onset_strength (lag=1, max_size=1) a blokkhatáron átívelő különbséggel
+        diff = np.maximum(0.0, mel_db[:, 1:] - mel_db[:, :-1])
+        env_mean = diff.mean(axis=0)
+        env_median = np.median(diff, axis=0)
+
+        # Az onset csúcskeresés a teljes burkolóra normalizál, ezért a (keretenként
+        # egy float32) burkolót megtartjuk, és a végén egyszerre keresünk csúcsokat
+        self._onset_env_parts.append(env_mean.astype(np.float32))
+
+        if not self._tempo_started:
+            # A teljes jelre számolt tempogram (center=True) lineáris rámpával
+            # párnáz; az első blokk elején ugyanezt tesszük
+            env_median = np.concatenate([self._edge_ramp(env_median[0], start=True), env_median])
+            self._tempo_started = True
+        self._update_tempogram(env_median)
+
+    def _edge_ramp(self, value: float, start: bool) -> np.ndarray:
+        ramp = np.linspace(0.0, value, self.tempogram_win // 2, endpoint=False)
+        return ramp if start else ramp[::-1]
+
+    def _update_tempogram(self, env_median: np.ndarray) -> None:
+        # Tempogram center=False-szal, az előző blokk végét kontextusként elé fűzve,
+        # így a blokkhatárokon nincs kitöltési torzítás
+        env_median = np.concatenate([self._env_tail, env_median])
+        self._env_tail = env_median[-(self.tempogram_win - 1):]
+        if len(env_median) < self.tempogram_win:
+            return
+        tg = self._timed("tempogram", lambda: librosa.feature.tempogram(
+            onset_envelope=env_median, sr=self.sr, hop_length=self.hop_length,
+            win_length=self.tempogram_win, center=False))
+        weights = window_weights(env_median, self.tempogram_win, tg.shape[1], center=False)
+        self.tempo_segments.add(tg, weights)
+
+    def _update_chroma(self, y_harmonic: np.ndarray, n_frames: int) -> None:
+        # Ugyanaz a chroma, mint a teljes elemzésben (FeatureGraph.chroma): a harmonikus rész CQT-je,
+        # így a hangnem / Camelot nem függ az elemzés módjától
+        bins = FeatureGraph.CHROMA_BINS_PER_OCTAVE
+        if self._tuning is None:
+            self._tuning = self._timed("tuning", lambda: librosa.estimate_tuning(
+                y=y_harmonic, sr=self.sr, bins_per_octave=bins))
+        C = self._timed("cqt", lambda: np.abs(librosa.cqt(
+            y_harmonic, sr=self.sr, hop_length=self.hop_length,
+            n_bins=FeatureGraph.CHROMA_OCTAVES * bins, bins_per_octave=bins, tuning=self._tuning)))
+        # A CQT keretei a mintára vannak középre igazítva (center=True), az STFT keretei
+        # n_fft / 2-vel később: ugyanazokat a keretközepeket vesszük ki
+        offset = self.n_fft // (2 * self.hop_length)
+        C = C[:, offset:offset + n_frames]
+        chroma = self._timed("chroma", lambda: librosa.feature.chroma_cqt(
+            C=C, sr=self.sr, hop_length=self.hop_length, bins_per_octave=bins))
+        self.chroma_sum += chroma.sum(axis=1)
+        self.chroma_sq_sum += np.square(chroma, dtype=np.float64).sum(axis=1)
+        self.chroma_frames += chroma.shape[1]
+        self.key_blocks.add(chroma)
+
+    def _update_hpss(self, y_block: np.ndarray) -> np.ndarray:
+        y_h, y_p = self._timed("hpss", lambda: librosa.effects.hpss(
+            y_block, n_fft=self.n_fft, hop_length=self.hop_length))
+        self.harmonic_abs_sum += float(np.abs(y_h).sum())
+        self.percussive_abs_sum += float(np.abs(y_p).sum())
+        self.samples += len(y_block)
+        # A harmonikus rész a chroma bemenete
+        return y_h
+
+    # -------------------------------------------
+    # Összesítés
+    # -------------------------------------------
+
+    def tempo(self) -> dict:
+        if self._tempo_started and len(self._env_tail):
+            # Záró párnázás a jel végén, majd a maradék keretek
+            self._update_tempogram(self._edge_ramp(self._env_tail[-1], start=False))
+            self._env_tail = np.zeros(0)
+        acf_sums, weight_sums = self.tempo_segments.sums()
+        return tempo_from_segments(acf_sums, weight_sums, self.sr, self.hop_length)
+
+    def key(self) -> dict | None:
+        block_seconds = self.key_blocks.frames_per_block * self.hop_length / self.sr
+        return detect_key_blocks(self.key_blocks.blocks(), block_seconds,
+                                 duration=self.chroma_frames * self.hop_length / self.sr)
+
+    def rms_frames(self) -> np.ndarray:
+        return np.concatenate(self._rms_parts) if self._rms_parts else np.zeros(0, dtype=np.float32)
+
+    def local_features(self, duration: float) -> dict:
+        out = {
+            "spectral_centroid_mean": None,
+            "spectral_centroid_std": None,
+            "spectral_rolloff_85": None,
+            "zcr_mean": None,
+            "onset_rate": None,
+            "harmonic_percussive_ratio": None,
+            "chroma_var": None,
+        }
+        if self.frames:
+            mean = self.centroid_sum / self.frames
+            out["spectral_centroid_mean"] = float(mean)
+            out["spectral_centroid_std"] = float(np.sqrt(max(self.centroid_sq_sum / self.frames - mean ** 2, 0.0)))
+            out["spectral_rolloff_85"] = float(self.rolloff_sum / self.frames)
+            out["zcr_mean"] = float(self.zcr_sum / self.frames)
+        if self._onset_env_parts:
+            env = np.concatenate(self._onset_env_parts)
+            onsets = self._timed("onset_detect", lambda: librosa.onset.onset_detect(
+                onset_envelope=env, sr=self.sr, hop_length=self.hop_length))
+            out["onset_rate"] = float(len(onsets) / duration) if duration > 0 else 0.0
+        if self.samples:
+            h_energy = self.harmonic_abs_sum / self.samples
+            p_energy = self.percussive_abs_sum / self.samples
+            out["harmonic_percussive_ratio"] = float((h_energy + 1e-8) / (p_energy + 1e-8))
+        if self.chroma_frames:
+            mean = self.chroma_sum / self.chroma_frames
+            var = np.maximum(self.chroma_sq_sum / self.chroma_frames - mean ** 2, 0.0)
+            out["chroma_var"] = float(np.mean(var))
+        return out
+
+    def report(self) -> dict:
+        return {
+            name: round(sec * 1000.0, 2)
+            for name, sec in sorted(self.timings.items(), key=lambda kv: kv[1], reverse=True)
+        }
+
+
+def stream_blocks(file_path: str, profile: dict, block_seconds: float = STREAM_BLOCK_SECONDS):
+    """Yield mono blocks at the profile's sample rate, frame-aligned.
+
+    Consecutive blocks overlap by n_fft - hop_length samples (like
+    librosa.stream), so STFT frames with center=False are contiguous across
+    blocks. The downmix happens before resampling, and resampling is done
+    with a streaming soxr resampler, so no block depends on the whole file.
+    """
+    n_fft, hop = profile["n_fft"], profile["hop_length"]
+    sr = profile["sr"]
+    quality = "LQ" if profile["res_type"] == "soxr_lq" else "HQ"
+
+    with sf.SoundFile(file_path) as f:
+        native_sr = f.samplerate
+        resampler = None
+        if native_sr != sr:
+            resampler = soxr.ResampleStream(native_sr, sr, 1, dtype="float32", quality=quality)
+        read_size = max(n_fft, int(block_seconds * native_sr))
+        buf = np.zeros(0, dtype=np.float32)
+
+        while True:
+            raw = f.read(read_size, dtype="float32", always_2d=True)
+            last = len(raw) < read_size
+            y = raw.mean(axis=1) if raw.shape[1] > 1 else raw[:, 0]
+            if resampler is not None:
+                y = resampler.resample_chunk(y, last=last)
+            buf = np.concatenate([buf, y])
+
+            n_frames = (len(buf) - n_fft) // hop + 1 if len(buf) >= n_fft else 0
+            if n_frames > 0:
+                yield buf[:(n_frames - 1) * hop + n_fft]
+                buf = buf[n_frames * hop:]
+            if last:
+                break
+
+
+def analyze_music_stream(file_path: str, user_token=None, return_timings: bool = False,
+                         profile: dict | None = None, enrich: bool = True,
+                         block_seconds: float = STREAM_BLOCK_SECONDS, source_name: str | None = None,
+                         content_hash: str | None = None) -> dict:
+    """Block-wise variant of analyze_music() with bounded peak memory.
+
+    The track is read with soundfile in `block_seconds` blocks; only one
+    block (plus its STFT) is in memory at a time. Produces the same result
+    keys as analyze_music().
+    """
+    profile = profile or get_profile()
+    sr = profile["sr"]
+    deadline = analysis_deadline()
+    snippet = enrich and needs_snippet(file_path)
+    enrichment = start_enrichment(file_path, content_hash=content_hash) if enrich and not snippet else None
+    duration = float(librosa.get_duration(path=file_path))
+
+    acc = StreamAccumulator(sr, n_fft=profile["n_fft"], hop_length=profile["hop_length"])
+    # A blokkok olvasása / átmintavételezése külön "decode" szakaszként mérve
+    blocks = stream_blocks(file_path, profile, block_seconds)
+    while (y_block := acc._timed("decode", lambda: next(blocks, None))) is not None:
+        acc.update(y_block)
+
+    tempo = acc.tempo()
+    rms = float(acc.rms_sum / acc.frames) if acc.frames else 0.0
+    key_estimate = acc.key()
+    local_feats = acc.local_features(duration)
+
+    # A snippet ablakát csak a teljes RMS görbe ismeretében lehet kiválasztani
+    if snippet:
+        enrichment = start_enrichment(file_path, None, sr, acc.rms_frames(), acc.hop_length, content_hash)
+    rb_features, enrichment_status = acc._timed("enrichment_wait", lambda: collect_enrichment(enrichment, deadline))
+    result = build_result(file_path, duration, tempo, rms, key_estimate, local_feats, rb_features,
+                          metadata=read_metadata(file_path, source_name))
+    result["enrichment"] = enrichment_status
+    result["analysis_mode"] = "stream"
+    result["analysis_profile"] = profile["name"]
+    if return_timings:
+        result["timings"] = acc.report()
+    return result
@@ -0,0 +1,177 @@
+import os
+import numpy as np
+import librosa
+
+
+# Szakaszos becslés: ennyi másodpercenként külön tempó, az autokorrelációs ablak hossza
+TEMPO_SEGMENT_SECONDS = float(os.getenv("TEMPO_SEGMENT_SECONDS", "15"))
+TEMPOGRAM_WIN_SECONDS = 8.0
+# Oktávhiba-javítás: a becslést ebbe a tartományba hajtjuk (fél / dupla tempó)
+TEMPO_MIN_BPM = float(os.getenv("TEMPO_MIN_BPM", "70"))
+TEMPO_MAX_BPM = float(os.getenv("TEMPO_MAX_BPM", "180"))
+# A beat_track-kel azonos log-normális prior (120 BPM körül, 1 oktáv szórással)
+TEMPO_PRIOR_BPM = 120.0
+TEMPO_PRIOR_STD = 1.0
+MAX_TEMPO_BPM = 320.0
+# Ennyi (relatív) eltérésen belül egyezik egy szakasz a teljes becsléssel
+TEMPO_AGREEMENT = 0.04
+
+
+def tempogram_win(sr: int, hop_length: int) -> int:
+    return int(librosa.time_to_frames(TEMPOGRAM_WIN_SECONDS, sr=sr, hop_length=hop_length))
+
+
+def tempo_onset_env(y: np.ndarray, sr: int, hop_length: int = 512) -> np.ndarray:
+    """Median-aggregated onset strength (the envelope beat_track uses)."""
+    return librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length, aggregate=np.median)
+
+
+def window_weights(onset_env: np.ndarray, win_length: int, n_columns: int, center: bool = True) -> np.ndarray:
+    """Mean onset strength under each tempogram column's window.
+
+    Tempogram columns are normalized, so a silent intro would count as much
+    as the drop; weighting by the window's onset energy lets the rhythmic
+    parts dominate (instead of masking frames in a Python loop).
+    """
+    env = np.asarray(onset_env, dtype=np.float64)
+    if center:
+        env = np.pad(env, (win_length // 2, win_length - win_length // 2), mode="edge")
+    csum = np.concatenate([[0.0], np.cumsum(env)])
+    return (csum[win_length:win_length + n_columns] - csum[:n_columns]) / win_length
+
+
+def acf_to_bpm(acf: np.ndarray, sr: int, hop_length: int) -> np.ndarray:
+    """Tempo (BPM) of every autocorrelation column (win x n) at once.
+
+    The best lag is picked under the log-normal prior, then refined with
+    parabolic interpolation on the raw autocorrelation, so the result is
+    not limited to the lag grid (about 2.8 BPM apart at 120 BPM).
+    0.0 for columns without a usable peak.
+    """
+    win, n = acf.shape
+    freqs = librosa.tempo_frequencies(win, sr=sr, hop_length=hop_length)
+    with np.errstate(divide="ignore"):
+        log_prior = -0.5 * ((np.log2(freqs) - np.log2(TEMPO_PRIOR_BPM)) / TEMPO_PRIOR_STD) ** 2
+    log_prior[~np.isfinite(freqs) | (freqs > MAX_TEMPO_BPM)] = -np.inf
+    prior = np.exp(log_prior)[:, np.newaxis]
+
+    best = np.argmax(acf * prior, axis=0)
+    inner = (best > 0) & (best < win - 1)
+    lag = best.astype(np.float64)
+    cols = np.flatnonzero(inner)
+    if len(cols):
+        a = acf[best[cols] - 1, cols]
+        b = acf[best[cols], cols]
+        c = acf[best[cols] + 1, cols]
+        denom = a - 2.0 * b + c
+        safe = np.abs(denom) > 1e-12
+        shift = np.zeros(len(cols))
+        shift[safe] = 0.5 * (a - c)[safe] / denom[safe]
+        lag[cols] += np.clip(shift, -0.5, 0.5)
+    bpm = np.zeros(n)
+    np.divide(60.0 * sr / hop_length, lag, out=bpm, where=lag > 0)
+    bpm[~np.any(acf > 0, axis=0)] = 0.0
+    return bpm
+
+
+def fold_tempo(bpm: np.ndarray, lo: float = TEMPO_MIN_BPM, hi: float = TEMPO_MAX_BPM) -> np.ndarray:
+    """Octave-error correction: halve / double into [lo, hi)."""
+    bpm = np.array(bpm, dtype=np.float64, ndmin=1)
+    valid = bpm > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        up = np.where(valid & (bpm < lo), np.ceil(np.log2(lo / bpm)), 0.0)
+        down = np.where(valid & (bpm >= hi), np.floor(np.log2(bpm / hi)) + 1.0, 0.0)
+    return bpm * np.exp2(up - down)
+
+
+def segment_sums(tempogram: np.ndarray, weights: np.ndarray, frames_per_segment: int) -> tuple[np.ndarray, np.ndarray]:
+    """Weighted tempogram sums per segment -> (win x n_segments, n_segments weight sums)."""
+    win, n_frames = tempogram.shape
+    n_segments = -(-n_frames // frames_per_segment)
+    padded_tg = np.zeros((win, n_segments * frames_per_segment))
+    padded_tg[:, :n_frames] = tempogram * weights[np.newaxis, :]
+    padded_w = np.zeros(n_segments * frames_per_segment)
+    padded_w[:n_frames] = weights
+    return (padded_tg.reshape(win, n_segments, frames_per_segment).sum(axis=2),
+            padded_w.reshape(n_segments, frames_per_segment).sum(axis=1))
+
+
+class TempoSegments:
+    """Incremental segment_sums() for block-wise (streaming) analysis: only
+    one weighted tempogram sum per segment is kept."""
+
+    def __init__(self, win_length: int, frames_per_segment: int):
+        self.frames_per_segment = frames_per_segment
+        self._acf: list[np.ndarray] = []
+        self._weights: list[float] = []
+        self._partial = np.zeros(win_length)
+        self._partial_weight = 0.0
+        self._partial_frames = 0
+
+    def add(self, tempogram: np.ndarray, weights: np.ndarray) -> None:
+        pos = 0
+        n_frames = tempogram.shape[1]
+        while pos < n_frames:
+            take = min(self.frames_per_segment - self._partial_frames, n_frames - pos)
+            w = weights[pos:pos + take]
+            self._partial += tempogram[:, pos:pos + take] @ w
+            self._partial_weight += float(w.sum())
+            self._partial_frames += take
+            pos += take
+            if self._partial_frames == self.frames_per_segment:
+                self._flush()
+
+    def _flush(self) -> None:
+        self._acf.append(self._partial)
+        self._weights.append(self._partial_weight)
+        self._partial = np.zeros_like(self._partial)
+        self._partial_weight = 0.0
+        self._partial_frames = 0
+
+    def sums(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._partial_frames:
+            self._flush()
+        if not self._acf:
+            return np.zeros((len(self._partial), 0)), np.zeros(0)
+        return np.stack(self._acf, axis=1), np.array(self._weights)
+
+
+def tempo_from_segments(acf_sums: np.ndarray, weight_sums: np.ndarray, sr: int, hop_length: int) -> dict:
+    """Track tempo from per-segment weighted tempogram sums.
+
+    The track tempo comes from the weighted mean autocorrelation of all
+    segments; every segment also gets its own (octave-folded) tempo.
+    `confidence` is the weight share of the segments that agree with the
+    track tempo within TEMPO_AGREEMENT. {"bpm": 0.0, ...} for silence.
+    """
+    voiced = weight_sums > 0
+    if not np.any(voiced):
+        return {"bpm": 0.0, "confidence": 0.0, "segments": []}
+    global_acf = acf_sums[:, voiced].sum(axis=1, keepdims=True) / weight_sums[voiced].sum()
+    bpm = float(fold_tempo(acf_to_bpm(global_acf, sr, hop_length))[0])
+
+    seg_bpm = np.zeros(len(weight_sums))
+    seg_bpm[voiced] = fold_tempo(acf_to_bpm(acf_sums[:, voiced] / weight_sums[voiced], sr, hop_length))
+    agree = voiced & (np.abs(seg_bpm - bpm) <= TEMPO_AGREEMENT * max(bpm, 1e-9))
+    confidence = float(weight_sums[agree].sum() / weight_sums[voiced].sum()) if bpm > 0 else 0.0
+    return {
+        "bpm": round(bpm, 2),
+        "confidence": round(confidence, 4),
+        "segments": [round(float(b), 2) for b in seg_bpm],
+    }
+
+
+def estimate_tempo(onset_env: np.ndarray, sr: int, hop_length: int = 512,
+                   segment_seconds: float = TEMPO_SEGMENT_SECONDS) -> dict:
+    """Segmented tempo estimate from one onset envelope: a single tempogram
+    (local autocorrelation) over the whole track, averaged per segment with
+    onset-energy weights, see tempo_from_segments()."""
+    onset_env = np.asarray(onset_env, dtype=np.float64)
+    if onset_env.size == 0 or not np.any(onset_env):
+        return {"bpm": 0.0, "confidence": 0.0, "segments": []}
+    win = tempogram_win(sr, hop_length)
+    tg = librosa.feature.tempogram(onset_envelope=onset_env, sr=sr, hop_length=hop_length, win_length=win)
+    weights = window_weights(onset_env, win, tg.shape[1])
+    frames_per_segment = max(1, int(round(segment_seconds * sr / hop_length)))
+    acf_sums, weight_sums = segment_sums(tg, weights, frames_per_segment)
+    return tempo_from_segments(acf_sums, weight_sums, sr, hop_length)
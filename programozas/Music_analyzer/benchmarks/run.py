@@ -0,0 +1,431 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+import tracemalloc
+
+# Csak Unix; Windowson a psutil, annak hiányában a tracemalloc ad csúcsmemóriát
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# -------------------------------------------
+# KÖRNYEZET ELSZIGETELÉSE
+# -------------------------------------------
+
+def isolate_environment(workdir: str) -> None:
+    """Point every database / cache at `workdir` and every external API at a
+    closed local port. Must run before the first `backend` import, because
+    the modules read their settings at import time."""
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bench.db")
+    os.environ["ANALYSIS_CACHE_PATH"] = os.path.join(workdir, "analysis_cache.db")
+    os.environ["RESPONSE_CACHE_BACKEND"] = "memory"
+    for name in ("GENIUS_API_URL", "GENIUS_WEB_API_URL", "YOUTUBE_API_URL", "SPOTIFY_API_URL",
+                 "SPOTIFY_ACCOUNTS_URL", "RECCOBEATS_API_URL"):
+        os.environ[name] = "http://127.0.0.1:9"
+    os.environ["HTTP_RETRIES"] = "0"
+
+
+def stub_network(remote_latency: float) -> None:
+    """No request leaves the machine: the shared HTTP session refuses every
+    call, and the ReccoBeats upload is replaced by a fixed answer after
+    `remote_latency` seconds (so the enrichment overlap is still measured)."""
+    import requests
+    from requests.adapters import BaseAdapter
+    import backend.services.music_analyze as music_analyze
+    import backend.services.feature_store as feature_store
+    from backend.services.http_client import http
+
+    class NoNetworkAdapter(BaseAdapter):
+        def send(self, request, **kwargs):
+            raise requests.ConnectionError(f"network disabled in benchmarks: {request.url}")
+
+        def close(self):
+            pass
+
+    http.mount("http://", NoNetworkAdapter())
+    http.mount("https://", NoNetworkAdapter())
+
+    def fake_reccobeats(file_path, api_key=None, data=None, filename=None):
+        time.sleep(remote_latency)
+        return {"acousticness": 0.1, "danceability": 0.7, "energy": 0.8, "valence": 0.5, "tempo": 128.0}
+
+    music_analyze.analyze_with_reccobeats = fake_reccobeats
+    # A feature store se válaszoljon tárolt értékkel: minden futás ugyanazt méri
+    feature_store.file_features = lambda content_hash, upload: upload()
+
+
+# -------------------------------------------
+# MÉRÉS
+# -------------------------------------------
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 if unknown)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return 0
+
+
+class RssSampler:
+    """Peak RSS while the block runs, sampled every `interval` seconds.
+    Without /proc or psutil it falls back to the process-lifetime peak
+    (ru_maxrss), and where that is missing too (Windows) to the peak of
+    traced allocations (tracemalloc; numpy arrays included)."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.start = self.peak = current_rss()
+        if self.start:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        elif resource is None:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.peak = max(self.peak, current_rss())
+        elif resource is None:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            # ru_maxrss: Linuxon KB, macOS-en bájt
+            scale = 1 if sys.platform == "darwin" else 1024
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        return False
+
+
+def result_key(entry: dict) -> str:
+    return f"{entry['suite']}:{entry['name']}:{json.dumps(entry['params'], sort_keys=True)}"
+
+
+class Recorder:
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results: list[dict] = []
+
+    def measure(self, suite: str, name: str, params: dict, fn, setup=None, repeat: int | None = None) -> object:
+        """Run `fn()` `repeat` times (after `setup()` each time, not timed);
+        records the median wall time and the peak RSS. Returns the last value."""
+        runs, peak, delta, value = [], 0, 0, None
+        for _ in range(repeat or self.repeat):
+            if setup is not None:
+                setup()
+            with RssSampler() as rss:
+                start = time.perf_counter()
+                value = fn()
+                runs.append(time.perf_counter() - start)
+            peak = max(peak, rss.peak)
+            delta = max(delta, rss.peak - rss.start)
+        entry = {
+            "suite": suite,
+            "name": name,
+            "params": params,
+            "seconds": statistics.median(runs),
+            "runs": [round(r, 6) for r in runs],
+            "peak_rss_mb": round(peak / 2 ** 20, 1),
+            "rss_delta_mb": round(delta / 2 ** 20, 1),
+        }
+        self.results.append(entry)
+        label = " ".join(f"{k}={v}" for k, v in params.items())
+        print(f"  {suite}/{name} [{label}] {entry['seconds'] * 1000:.1f} ms, peak {entry['peak_rss_mb']} MB", flush=True)
+        return value
+
+
+# -------------------------------------------
+# BENCHMARK CSOPORTOK
+# -------------------------------------------
+
+def bench_audio(rec: Recorder, workdir: str, durations, sample_rates, profiles) -> None:
+    from benchmarks.synthetic import write_audio
+    from backend.services.analysis_profile import get_profile, load_audio
+    from backend.services.feature_graph import FeatureGraph
+    from backend.services.camelot import detect_camelot
+    from backend.services.music_analyze import analyze_music, compute_local_features
+
+    for duration in durations:
+        for native_sr in sample_rates:
+            path = write_audio(os.path.join(workdir, f"audio_{duration:g}s_{native_sr}.wav"), duration, native_sr)
+            for profile_name in profiles:
+                prof = get_profile(profile_name)
+                params = {"duration": duration, "sample_rate": native_sr, "profile": profile_name}
+                y, sr = rec.measure("audio", "load_audio", params, lambda: load_audio(path, prof))
+
+                def graph():
+                    return FeatureGraph(y, sr, n_fft=prof["n_fft"], hop_length=prof["hop_length"])
+
+                rec.measure("audio", "tempo", params, lambda: graph().tempo_estimate)
+                rec.measure("audio", "detect_camelot", params, lambda: detect_camelot(y, sr, graph=graph()))
+                rec.measure("audio", "compute_local_features", params,
+                            lambda: compute_local_features(y, sr, graph=graph()))
+                result = rec.measure("audio", "analyze_music", params, lambda: analyze_music(
+                    path, mode="full", profile=profile_name, return_timings=True))
+                # Csomópontonkénti idők (tájékoztató, az összehasonlítás nem használja)
+                rec.results[-1]["nodes_ms"] = result.get("timings", {})
+                rec.measure("audio", "analyze_music_stream", params, lambda: analyze_music(
+                    path, mode="stream", profile=profile_name))
+
+
+def _track_session(workdir: str, rows: int):
+    from sqlalchemy.orm import sessionmaker
+    from backend.database import Base, create_db_engine
+    import backend.models.music  # noqa: F401  (a táblák regisztrálása)
+    import backend.models.reccobeats  # noqa: F401
+
+    path = os.path.join(workdir, f"tracks_{rows}.db")
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_db_engine("sqlite:///" + path)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def bench_recommend(rec: Recorder, workdir: str, sizes, seeds: int, playlist_length: int) -> None:
+    from benchmarks.synthetic import synth_track_rows, CAMELOT_KEYS
+    from backend.models.music import Track, fill_derived_columns
+    from backend.services.recommend_index import recommend_index
+    from backend.services.db_service import find_tracks_in_range
+    from backend.services.music_service import recommend_ai, recommend_batch, build_playlist, similar_tracks
+    from backend.services.similarity_index import similarity_index
+    from backend.services.genre_classifier import reclassify_library
+
+    for rows in sizes:
+        params = {"rows": rows}
+        session_factory = _track_session(workdir, rows)
+        db = session_factory()
+        try:
+            def insert():
+                conn = db.connection()
+                genre_ids = {}
+                db.bulk_insert_mappings(Track, [fill_derived_columns(conn, row, genre_ids)
+                                                for row in synth_track_rows(rows)])
+                db.commit()
+
+            rec.measure("recommend", "insert_tracks", params, insert, repeat=1)
+            ids = [track_id for (track_id,) in db.query(Track.id).order_by(Track.id)]
+            rng = random.Random(rows)
+            seed_ids = rng.sample(ids, min(seeds, len(ids)))
+            seed_params = {**params, "seeds": len(seed_ids)}
+
+            rec.measure("recommend", "index_load", params, lambda: recommend_index.load(db))
+            rec.measure("recommend", "recommend_ai", seed_params,
+                        lambda: [recommend_ai(db, track_id) for track_id in seed_ids])
+            rec.measure("recommend", "recommend_ai_strict", seed_params,
+                        lambda: [recommend_ai(db, track_id, strict=True) for track_id in seed_ids])
+            rec.measure("recommend", "recommend_batch", seed_params, lambda: recommend_batch(db, seed_ids))
+            rec.measure("recommend", "build_playlist", {**params, "length": playlist_length},
+                        lambda: build_playlist(db, seed_id=seed_ids[0], length=playlist_length))
+
+            queries = [(rng.choice(CAMELOT_KEYS), rng.uniform(80.0, 170.0)) for _ in seed_ids]
+            rec.measure("recommend", "find_tracks_in_range", seed_params, lambda: [
+                find_tracks_in_range(db, camelot=key, bpm_min=bpm - 3, bpm_max=bpm + 3) for key, bpm in queries])
+
+            rec.measure("recommend", "similarity_load", params, lambda: similarity_index.load(db))
+            rec.measure("recommend", "similar_tracks", seed_params,
+                        lambda: [similar_tracks(db, track_id) for track_id in seed_ids])
+            rec.measure("recommend", "similar_tracks_strict", seed_params,
+                        lambda: [similar_tracks(db, track_id, strict=True) for track_id in seed_ids])
+            # Első hívás az IVF listákat is felépíti
+            rec.measure("recommend", "similar_tracks_approximate", seed_params,
+                        lambda: [similar_tracks(db, track_id, approximate=True) for track_id in seed_ids])
+            rec.measure("recommend", "reclassify_genres", params, lambda: reclassify_library(db), repeat=1)
+        finally:
+            db.close()
+            recommend_index.invalidate()
+            similarity_index.invalidate()
+
+
+def bench_scan(rec: Recorder, workdir: str, files: int, duration: float, workers: int) -> None:
+    from benchmarks.synthetic import write_audio
+    from backend.services.ingest import ingest_folder
+    from backend.models.music import Track
+
+    folder = os.path.join(workdir, "library")
+    os.makedirs(folder, exist_ok=True)
+    for i in range(files):
+        write_audio(os.path.join(folder, f"Artist {i} - Track {i}.mp3"), duration, 44100,
+                    bpm=90.0 + 7.0 * i, seed=i)
+    params = {"files": files, "duration": duration}
+
+    session_factory = _track_session(workdir, 0)
+
+    def clear():
+        # Változatlan fájlokat az ingest kihagyna: minden futás üres táblával indul
+        db = session_factory()
+        try:
+            db.query(Track).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    rec.measure("scan", "ingest_folder", {**params, "workers": workers},
+                lambda: ingest_folder(folder, workers=workers, session_factory=session_factory), setup=clear)
+    if resource is not None:
+        rec.results[-1]["children_peak_rss_mb"] = round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+
+    # Az asztali (tkinter) változat soros mappabeolvasása
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    try:
+        import music_search
+    except ImportError as e:
+        print("  scan/scan_folder kihagyva:", str(e))
+        return
+    cwd = os.getcwd()
+    os.chdir(workdir)  # a scan_folder a munkakönyvtárba írja a tracks.json-t
+    try:
+        rec.measure("scan", "scan_folder", params, lambda: music_search.scan_folder(folder))
+    finally:
+        os.chdir(cwd)
+
+
+# -------------------------------------------
+# ÖSSZEHASONLÍTÁS
+# -------------------------------------------
+
+def compare(current: dict, baseline: dict, threshold: float, min_seconds: float) -> list[dict]:
+    """Print current vs. baseline per stage; returns the regressions (slower
+    by more than `threshold` relative and `min_seconds` absolute)."""
+    base = {result_key(entry): entry for entry in baseline["results"]}
+    regressions = []
+    print(f"\n{'stage':<70} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for entry in current["results"]:
+        old = base.get(result_key(entry))
+        label = result_key(entry)
+        if old is None:
+            print(f"{label:<70} {'-':>10} {entry['seconds'] * 1000:>8.1f}ms {'new':>7}")
+            continue
+        ratio = entry["seconds"] / old["seconds"] if old["seconds"] > 0 else float("inf")
+        slower = ratio > 1.0 + threshold and entry["seconds"] - old["seconds"] > min_seconds
+        mark = "  <-- REGRESSION" if slower else ""
+        print(f"{label:<70} {old['seconds'] * 1000:>8.1f}ms {entry['seconds'] * 1000:>8.1f}ms {ratio:>6.2f}x{mark}")
+        if slower:
+            regressions.append({"stage": label, "baseline": old["seconds"], "current": entry["seconds"],
+                                "ratio": round(ratio, 3)})
+    return regressions
+
+
+def environment_info(args) -> dict:
+    import numpy
+    import librosa
+    import sqlalchemy
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "librosa": librosa.__version__,
+        "sqlalchemy": sqlalchemy.__version__,
+        "args": vars(args),
+    }
+
+
+def _numbers(text: str, cast=float) -> list:
+    return [cast(part) for part in text.split(",") if part.strip()]
+
+
+# -------------------------------------------
+# PARANCSORI FUTTATÁS
+# -------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Elemzési és ajánlási benchmarkok hálózat nélkül (a Music_analyzer mappából: "
+                    "python -m benchmarks.run)")
+    parser.add_argument("--suites", default="audio,recommend,scan", help="audio, recommend, scan (vesszővel)")
+    parser.add_argument("--durations", default="30,180", help="Szintetikus hanganyag hossza (s)")
+    parser.add_argument("--sample-rates", default="22050,44100", help="Szintetikus fájlok mintavételezése (Hz)")
+    parser.add_argument("--profiles", default="default", help="Elemzési profilok (analysis_profile)")
+    parser.add_argument("--rows", default="1000,10000,100000", help="Szintetikus tracks tábla méretek")
+    parser.add_argument("--seeds", type=int, default=100, help="Ajánlási kérések száma táblánként")
+    parser.add_argument("--playlist-length", type=int, default=20)
+    parser.add_argument("--scan-files", type=int, default=8)
+    parser.add_argument("--scan-duration", type=float, default=30.0)
+    parser.add_argument("--scan-workers", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3, help="Ismétlések száma (a medián számít)")
+    parser.add_argument("--remote-latency", type=float, default=0.0,
+                        help="A helyettesített ReccoBeats válasz késleltetése (s)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--load", default=None, help="Futtatás helyett meglévő eredményfájl betöltése")
+    parser.add_argument("--compare", default=None, help="Korábbi eredményfájl, amihez viszonyítunk")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Megengedett relatív lassulás")
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="Ennél kisebb abszolút lassulás nem hiba")
+    args = parser.parse_args(argv)
+
+    if args.load:
+        with open(args.load, encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        with tempfile.TemporaryDirectory(prefix="music_bench_") as workdir:
+            isolate_environment(workdir)
+            from backend.database import init_db
+            init_db()
+            stub_network(args.remote_latency)
+
+            rec = Recorder(args.repeat)
+            suites = {name.strip() for name in args.suites.split(",")}
+            if "audio" in suites:
+                print("audio:")
+                bench_audio(rec, workdir, _numbers(args.durations), _numbers(args.sample_rates, int),
+                            [name.strip() for name in args.profiles.split(",")])
+            if "recommend" in suites:
+                print("recommend:")
+                bench_recommend(rec, workdir, _numbers(args.rows, int), args.seeds, args.playlist_length)
+            if "scan" in suites:
+                print("scan:")
+                bench_scan(rec, workdir, args.scan_files, args.scan_duration, args.scan_workers)
+
+            current = {"meta": environment_info(args), "results": rec.results}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ Eredmények: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"\n❌ {len(regressions)} lassulás (> {args.threshold:.0%})")
+            return 1
+        print("\n✅ Nincs lassulás")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import numpy as np
+import soundfile as sf
+from scipy.signal import fftconvolve
+
+from backend.services.similarity_index import LOCAL_VECTOR_FEATURES, VECTOR_DIM
+
+
+# Szintetikus zenekönyvtár értékkészletei (a valós adatbázis eloszlásához hasonlóan)
+CAMELOT_KEYS = [f"{num}{letter}" for num in range(1, 13) for letter in ("A", "B")]
+GENRES = ["Pop", "Hip-Hop/Rap", "Dance/Electronic", "Rock/Metal", "Jazz/Blues",
+          "Acoustic/Folk", "Classical/Orchestral", "Electronic (Fast)", "Hardstyle", "Techno"]
+UNKNOWN_SHARE = 0.05
+
+# Akkordmenet A-mollban (Am - F - G - E), Hz: a harmonikus réteg
+CHORDS = [(220.0, 261.63, 329.63), (174.61, 220.0, 261.63), (196.0, 246.94, 293.66), (164.81, 207.65, 246.94)]
+
+
+def synth_audio(duration: float, sr: int, bpm: float = 128.0, seed: int = 0,
+                channels: int = 1) -> np.ndarray:
+    """Deterministic test signal: kick + hi-hat on the beat grid, a chord
+    progression changing every bar and a little noise. Shape (samples,)
+    or (samples, channels)."""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    t = np.arange(n, dtype=np.float64) / sr
+    beat = 60.0 / bpm
+
+    # Ütemrács: impulzusok, majd egyetlen konvolúció a lábdob / cin hanggal
+    kick_len, hat_len = int(0.25 * sr), int(0.05 * sr)
+    kt = np.arange(kick_len) / sr
+    kick = np.sin(2 * np.pi * (50.0 + 80.0 * np.exp(-kt * 30.0)) * kt) * np.exp(-kt * 12.0)
+    hat = rng.standard_normal(hat_len) * np.exp(-np.arange(hat_len) / sr * 80.0) * 0.3
+    kicks = np.zeros(n)
+    kicks[(np.arange(0.0, duration, beat) * sr).astype(int)] = 1.0
+    hats = np.zeros(n)
+    hats[(np.arange(beat / 2, duration, beat) * sr).astype(int)] = 1.0
+    drums = fftconvolve(kicks, kick)[:n] + fftconvolve(hats, hat)[:n]
+
+    # Akkordok ütemenként (4 negyed)
+    bar = (t // (4 * beat)).astype(int) % len(CHORDS)
+    freqs = np.array(CHORDS)[bar]
+    harmony = np.sin(2 * np.pi * freqs * t[:, np.newaxis]).sum(axis=1) * 0.15
+
+    y = 0.6 * drums + harmony + 0.01 * rng.standard_normal(n)
+    y = (y / (np.max(np.abs(y)) + 1e-9) * 0.9).astype(np.float32)
+    if channels > 1:
+        y = np.repeat(y[:, np.newaxis], channels, axis=1)
+    return y
+
+
+def write_audio(path: str, duration: float, sr: int, bpm: float = 128.0, seed: int = 0,
+                channels: int = 2) -> str:
+    """synth_audio() written to `path`; the format follows the extension (.wav / .flac / .mp3)."""
+    y = synth_audio(duration, sr, bpm=bpm, seed=seed, channels=channels)
+    sf.write(path, y, sr)
+    return path
+
+
+def synth_track_rows(count: int, seed: int = 0) -> list[dict]:
+    """`count` deterministic tracks-table rows (bpm, camelot, genre, feature
+    vector, ...) with a small share of unknown keys / genres, as in real
+    libraries."""
+    rng = np.random.default_rng(seed)
+    bpm = np.round(rng.normal(124.0, 22.0, count).clip(60.0, 200.0), 2)
+    keys = rng.integers(0, len(CAMELOT_KEYS), count)
+    genres = rng.integers(0, len(GENRES), count)
+    unknown_key = rng.random(count) < UNKNOWN_SHARE
+    unknown_genre = rng.random(count) < UNKNOWN_SHARE
+    duration = rng.uniform(120.0, 420.0, count).round(2)
+    rms = rng.uniform(0.02, 0.3, count).round(4)
+    # Hangzásvektorok (similarity_index): néhány "stílus" körüli felhők, a ReccoBeats rész többnyire hiányzik
+    centers = rng.uniform(0.2, 1.0, (len(GENRES), VECTOR_DIM))
+    vectors = (centers[genres] + rng.normal(0.0, 0.08, (count, VECTOR_DIM))).astype(np.float32)
+    vectors[rng.random(count) < 0.7, len(LOCAL_VECTOR_FEATURES):] = np.nan
+    return [
+        {
+            "title": f"Track {i}",
+            "artist": f"Artist {i % 997}",
+            "genre": "Ismeretlen" if unknown_genre[i] else GENRES[genres[i]],
+            "bpm": float(bpm[i]),
+            "duration": float(duration[i]),
+            "rms": float(rms[i]),
+            "camelot": "Ismeretlen" if unknown_key[i] else CAMELOT_KEYS[keys[i]],
+            "path": f"synthetic/{i}.mp3",
+            "feature_vector": vectors[i].tobytes(),
+        }
+        for i in range(count)
+    ]
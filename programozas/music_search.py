@@ -1,60 +1,24 @@
 import librosa
-import numpy as np
 import json
 import os
+import sys
 from mutagen.easyid3 import EasyID3
 import mutagen
-from collections import Counter
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
-# Camelot-kód táblázatt
-camelot_map = {
-    'C':  '8B', 'C#': '3B', 'D':  '10B', 'D#': '5B', 'E':  '12B', 'F':  '7B',
-    'F#': '2B', 'G':  '9B', 'G#': '4B', 'A':  '11B', 'A#': '6B', 'B':  '1B',
-    'Cm': '5A', 'C#m':'12A','Dm': '7A',  'D#m':'2A', 'Em': '9A',  'Fm': '4A',
-    'F#m':'11A','Gm': '6A', 'G#m':'1A',  'Am': '8A',  'A#m':'3A', 'Bm': '10A'
-}
+# A hangnem- és tempófelismerés a Music_analyzer backendjével közös
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Music_analyzer"))
+from backend.services.key_detection import detect_key, key_chroma
+from backend.services.tempo import estimate_tempo, tempo_onset_env
 
 def detect_key_camelot(y, sr):
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-    chroma_mean = np.mean(chroma, axis=1)
-    pitch_class = np.argmax(chroma_mean)
-    pitch_names = ['C', 'C#', 'D', 'D#', 'E', 'F',
-                   'F#', 'G', 'G#', 'A', 'A#', 'B']
-    is_minor = librosa.feature.tonnetz(y=y, sr=sr).mean() < 0
-    key_name = pitch_names[pitch_class] + ('m' if is_minor else '')
-    return camelot_map.get(key_name, "Ismeretlen")
+    estimate = detect_key(key_chroma(y, sr), sr)
+    return estimate["camelot"] if estimate is not None else "Ismeretlen"
 
 def analyze_bpm_advanced(y, sr):
-    hop_length = 512
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-    threshold = np.percentile(rms, 50)
-    mask = rms > threshold
-    sample_mask = np.zeros(len(y), dtype=bool)
-    for i, keep in enumerate(mask):
-        start = i * hop_length
-        end = min(start + hop_length, len(y))
-        if keep:
-            sample_mask[start:end] = True
-    y_filtered = y[sample_mask]
-    segment_length = sr * 15
-    bpms = []
-    for start in range(0, len(y_filtered), segment_length):
-        segment = y_filtered[start:start+segment_length]
-        if len(segment) < sr * 5:
-            continue
-        tempo, _ = librosa.beat.beat_track(y=segment, sr=sr)
-        tempo_val = float(tempo[0]) if isinstance(tempo, (list, np.ndarray)) else float(tempo)
-        bpms.append(int(round(tempo_val)))
-    if not bpms:
-        return None
-    most_common_bpm = Counter(bpms).most_common(1)[0][0]
-    if most_common_bpm < 80:
-        most_common_bpm *= 2
-    elif most_common_bpm > 180:
-        most_common_bpm //= 2
-    return most_common_bpm
+    tempo = estimate_tempo(tempo_onset_env(y, sr), sr)
+    return tempo["bpm"] or None
 
 def analyze_track(file_path):
     try: